@@ -1,6 +1,9 @@
 # analytics/admin.py
 from django.contrib import admin
-from .models import RelevanceResult
+from .models import (
+    RelevanceResult, VacancyFunnel, EmployerFunnel, VacancyPromptCache, AnalysisStageState, AnalysisReplayItem, DeadLetter, QuestionTemplate,
+    TenantSchedulingPolicy, AnalysisQueueItem, LLMUsageRecord, LLMUsageDaily, EmployerLLMBudget,
+)
 
 
 @admin.register(RelevanceResult)
@@ -26,4 +29,108 @@ class RelevanceResultAdmin(admin.ModelAdmin):
     def get_analysis_type(self, obj):
         return obj.analysis_type
 
-    get_analysis_type.short_description = 'Тип анализа'
\ No newline at end of file
+    get_analysis_type.short_description = 'Тип анализа'
+
+@admin.register(VacancyFunnel)
+class VacancyFunnelAdmin(admin.ModelAdmin):
+    list_display = [
+        'vacancy', 'total_applications', 'scored_count',
+        'chat_completed_count', 'llm_cost_total', 'updated_at'
+    ]
+    readonly_fields = ['updated_at']
+    raw_id_fields = ['vacancy']
+
+
+@admin.register(EmployerFunnel)
+class EmployerFunnelAdmin(admin.ModelAdmin):
+    list_display = [
+        'employer', 'total_applications', 'scored_count',
+        'chat_completed_count', 'llm_cost_total', 'updated_at'
+    ]
+    readonly_fields = ['updated_at']
+    raw_id_fields = ['employer']
+
+
+@admin.register(VacancyPromptCache)
+class VacancyPromptCacheAdmin(admin.ModelAdmin):
+    list_display = ['vacancy', 'content_hash', 'gemini_cache_name', 'gemini_cache_expires_at', 'updated_at']
+    readonly_fields = ['content_hash', 'vacancy_block', 'gemini_cache_name', 'gemini_cache_expires_at', 'updated_at']
+    raw_id_fields = ['vacancy']
+
+
+@admin.register(AnalysisStageState)
+class AnalysisStageStateAdmin(admin.ModelAdmin):
+    list_display = ['application', 'stage', 'status', 'attempts', 'fingerprint', 'updated_at']
+    list_filter = ['stage', 'status']
+    search_fields = ['application__id', 'fingerprint']
+    readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['application']
+
+
+@admin.register(AnalysisReplayItem)
+class AnalysisReplayItemAdmin(admin.ModelAdmin):
+    list_display = ['application', 'reason', 'attempts', 'enqueued_at', 'last_attempt_at']
+    list_filter = ['reason']
+    readonly_fields = ['enqueued_at', 'last_attempt_at']
+    raw_id_fields = ['application']
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task_name', 'application', 'stage', 'exception_type', 'attempts', 'status', 'created_at']
+    list_filter = ['status', 'stage', 'task_name']
+    search_fields = ['application__id', 'task_id', 'exception_message']
+    readonly_fields = ['created_at', 'updated_at', 'last_replayed_at', 'traceback']
+    raw_id_fields = ['application']
+
+
+@admin.register(QuestionTemplate)
+class QuestionTemplateAdmin(admin.ModelAdmin):
+    list_display = ['signature', 'source', 'hits', 'updated_at']
+    list_filter = ['source']
+    search_fields = ['signature']
+    readonly_fields = ['hits', 'created_at', 'updated_at']
+
+
+@admin.register(TenantSchedulingPolicy)
+class TenantSchedulingPolicyAdmin(admin.ModelAdmin):
+    list_display = ['employer', 'weight', 'max_in_flight', 'updated_at']
+    readonly_fields = ['updated_at']
+    raw_id_fields = ['employer']
+
+
+@admin.register(AnalysisQueueItem)
+class AnalysisQueueItemAdmin(admin.ModelAdmin):
+    list_display = ['application', 'employer', 'status', 'batch', 'chat', 'enqueued_at', 'dispatched_at']
+    list_filter = ['status', 'batch', 'chat']
+    search_fields = ['application__id', 'task_id']
+    readonly_fields = ['enqueued_at', 'dispatched_at', 'task_id']
+    raw_id_fields = ['application', 'employer']
+
+
+@admin.register(LLMUsageRecord)
+class LLMUsageRecordAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'employer_id', 'vacancy_id', 'application_id', 'purpose', 'model',
+                    'prompt_tokens', 'completion_tokens', 'latency_ms', 'success', 'cost']
+    list_filter = ['purpose', 'model', 'success']
+    search_fields = ['=employer_id', '=vacancy_id', '=application_id']
+    date_hierarchy = 'created_at'
+    show_full_result_count = False
+
+
+@admin.register(LLMUsageDaily)
+class LLMUsageDailyAdmin(admin.ModelAdmin):
+    list_display = ['day', 'employer_id', 'vacancy_id', 'purpose', 'model', 'calls', 'failures',
+                    'prompt_tokens', 'completion_tokens', 'cost']
+    list_filter = ['purpose', 'model']
+    search_fields = ['=employer_id', '=vacancy_id']
+    date_hierarchy = 'day'
+    readonly_fields = ['updated_at']
+
+
+@admin.register(EmployerLLMBudget)
+class EmployerLLMBudgetAdmin(admin.ModelAdmin):
+    list_display = ['employer', 'daily_tokens', 'monthly_cost', 'over_budget_action', 'updated_at']
+    list_filter = ['over_budget_action']
+    readonly_fields = ['updated_at']
+    raw_id_fields = ['employer']
@@ -5,4 +5,7 @@ from django.apps import AppConfig
 class AnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analytics'
-    verbose_name = 'Аналитика'
\ No newline at end of file
+    verbose_name = 'Аналитика'
+
+    def ready(self):
+        from analytics import signals  # noqa: F401
@@ -0,0 +1,72 @@
+# analytics/management/commands/check_import_time.py
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Модули, которые веб-процесс загружать не должен
+FORBIDDEN_PREFIXES = ("google.generativeai", "google.ai.generativelanguage", "grpc")
+
+# Что импортирует веб/ASGI-процесс при старте
+STARTUP_SCRIPT = (
+    "import django; django.setup(); "
+    "import project.urls, project.wsgi, candidates.consumers"
+)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время старта веб-процесса через python -X importtime и "
+        "падает, если превышен бюджет или загружен LLM SDK"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--budget-ms", type=float,
+                            default=getattr(settings, "STARTUP_IMPORT_BUDGET_MS", 1500),
+                            help="Допустимое суммарное время импортов, мс")
+        parser.add_argument("--top", type=int, default=15, help="Показать N самых тяжелых модулей")
+
+    def handle(self, *args, **options):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise CommandError(f"Startup import failed:\n{proc.stderr[-4000:]}")
+
+        total_us = 0
+        modules = []
+        for line in proc.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if not match:
+                continue
+            self_us, cumulative_us, indent, module = match.groups()
+            total_us += int(self_us)
+            if not indent.strip(" ") and len(indent) <= 1:
+                # Импорты верхнего уровня: их cumulative покрывает вложенные
+                modules.append((int(cumulative_us), module))
+
+        forbidden = sorted({
+            module for line in proc.stderr.splitlines()
+            for module in [line.rsplit("|", 1)[-1].strip()]
+            if module.startswith(FORBIDDEN_PREFIXES)
+        })
+
+        for cumulative_us, module in sorted(modules, reverse=True)[:options["top"]]:
+            self.stdout.write(f"{cumulative_us / 1000:10.1f} ms  {module}")
+        total_ms = total_us / 1000
+        self.stdout.write(f"Total import time: {total_ms:.1f} ms (budget {options['budget_ms']:.0f} ms)")
+
+        errors = []
+        if forbidden:
+            errors.append("LLM SDK imported at web startup: " + ", ".join(forbidden[:10]))
+        if total_ms > options["budget_ms"]:
+            errors.append(f"import time {total_ms:.1f} ms exceeds budget {options['budget_ms']:.0f} ms")
+        if errors:
+            raise CommandError("; ".join(errors))
+
+        self.stdout.write(self.style.SUCCESS("Startup import budget OK"))
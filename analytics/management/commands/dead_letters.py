@@ -0,0 +1,69 @@
+# analytics/management/commands/dead_letters.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.models import DeadLetter
+from analytics.services.dead_letter_service import DeadLetterService
+
+
+class Command(BaseCommand):
+    help = "Просмотр, перезапуск и сверка упавших задач анализа (DLQ)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["list", "replay", "discard", "reconcile"])
+        parser.add_argument("--status", default="pending", help="Статус записей (all — любые)")
+        parser.add_argument("--task", help="Имя задачи (например, analytics.tasks.llm_evaluate_stage)")
+        parser.add_argument("--stage", help="Стадия конвейера")
+        parser.add_argument("--application", type=int, action="append", dest="applications",
+                            help="Только указанные отклики (можно несколько раз)")
+        parser.add_argument("--limit", type=int, default=500)
+        parser.add_argument("--rate", type=float, help="Скорость перезапуска, задач в секунду")
+        parser.add_argument("--older-than-minutes", type=int,
+                            help="Для reconcile: отклики старше N минут")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        service = DeadLetterService()
+
+        if options["action"] == "reconcile":
+            minutes = options["older_than_minutes"]
+            found = service.reconcile(
+                timedelta(minutes=minutes) if minutes else None, dry_run=options["dry_run"]
+            )
+            self.stdout.write(self.style.SUCCESS(f"Stuck applications: {found}"))
+            return
+
+        if options["rate"] is not None and options["rate"] <= 0:
+            raise CommandError("--rate must be positive")
+
+        queryset = DeadLetter.objects.all()
+        if options["status"] != "all":
+            queryset = queryset.filter(status=options["status"])
+        if options["task"]:
+            queryset = queryset.filter(task_name=options["task"])
+        if options["stage"]:
+            queryset = queryset.filter(stage=options["stage"])
+        if options["applications"]:
+            queryset = queryset.filter(application_id__in=options["applications"])
+        entries = list(queryset.order_by("created_at")[:options["limit"]])
+
+        if options["action"] == "list" or options["dry_run"]:
+            for entry in entries:
+                self.stdout.write(
+                    f"{entry.pk}\t{entry.created_at:%Y-%m-%d %H:%M}\t{entry.status}\t"
+                    f"app={entry.application_id}\t{entry.task_name}\t{entry.stage or '-'}\t"
+                    f"x{entry.attempts}\t{entry.exception_type}: {entry.exception_message[:120]}"
+                )
+            self.stdout.write(f"Total: {len(entries)}")
+            return
+
+        if options["action"] == "discard":
+            discarded = service.discard(entries)
+            self.stdout.write(self.style.SUCCESS(f"Discarded {discarded} entries"))
+            return
+
+        dispatched = service.replay(entries, rate_per_second=options["rate"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {len(entries)} entries, dispatched {dispatched} tasks"
+        ))
@@ -0,0 +1,16 @@
+# analytics/management/commands/rebuild_funnels.py
+from django.core.management.base import BaseCommand
+
+from analytics.services.funnel_service import FunnelService
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает воронки вакансий и работодателей из таблицы откликов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vacancy", type=int, action="append", dest="vacancies",
+                            help="Пересчитать только указанные вакансии (можно несколько раз)")
+
+    def handle(self, *args, **options):
+        rebuilt = FunnelService().rebuild(options["vacancies"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt funnels for {rebuilt} vacancies"))
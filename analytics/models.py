@@ -2,6 +2,11 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from candidates.models import Application
+from employers.models import Employer
+from jobs.models import Vacancy
+
+# Количество корзин гистограммы баллов (0-9, 10-19, ..., 90-100)
+SCORE_HISTOGRAM_BUCKETS = 10
 
 
 class RelevanceResult(models.Model):
@@ -52,4 +57,495 @@ class RelevanceResult(models.Model):
     @property
     def analysis_type(self):
         """Тип анализа из метаданных"""
-        return self.metadata.get('analysis_type', 'initial')
\ No newline at end of file
+        return self.metadata.get('analysis_type', 'initial')
+
+
+class FunnelRollup(models.Model):
+    """
+    Инкрементально поддерживаемая воронка откликов (базовая модель)
+    """
+    total_applications = models.IntegerField(default=0, verbose_name="Всего откликов")
+    status_counts = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Количество откликов по статусам"
+    )
+    score_histogram = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="Гистограмма финальных баллов"
+    )
+    scored_count = models.IntegerField(default=0, verbose_name="Откликов с баллом")
+    score_sum = models.FloatField(default=0, verbose_name="Сумма баллов")
+    chat_completed_count = models.IntegerField(default=0, verbose_name="Завершенных чатов")
+    chat_duration_total = models.FloatField(default=0, verbose_name="Суммарная длительность чатов (сек)")
+    llm_tokens_total = models.BigIntegerField(default=0, verbose_name="Токенов LLM")
+    llm_cost_total = models.DecimalField(
+        max_digits=14,
+        decimal_places=6,
+        default=0,
+        verbose_name="Стоимость LLM"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_score(self):
+        return self.score_sum / self.scored_count if self.scored_count else None
+
+    @property
+    def average_chat_completion_seconds(self):
+        if not self.chat_completed_count:
+            return None
+        return self.chat_duration_total / self.chat_completed_count
+
+
+class VacancyFunnel(FunnelRollup):
+    """
+    Воронка откликов по вакансии
+    """
+    vacancy = models.OneToOneField(
+        Vacancy,
+        on_delete=models.CASCADE,
+        related_name='funnel',
+        verbose_name="Вакансия"
+    )
+
+    class Meta:
+        verbose_name = "Воронка вакансии"
+        verbose_name_plural = "Воронки вакансий"
+
+    def __str__(self):
+        return f"Воронка вакансии {self.vacancy_id}: {self.total_applications}"
+
+
+class EmployerFunnel(FunnelRollup):
+    """
+    Воронка откликов по работодателю (сумма воронок его вакансий)
+    """
+    employer = models.OneToOneField(
+        Employer,
+        on_delete=models.CASCADE,
+        related_name='funnel',
+        verbose_name="Работодатель"
+    )
+
+    class Meta:
+        verbose_name = "Воронка работодателя"
+        verbose_name_plural = "Воронки работодателей"
+
+    def __str__(self):
+        return f"Воронка работодателя {self.employer_id}: {self.total_applications}"
+
+
+class VacancyPromptCache(models.Model):
+    """
+    Отрендеренный префикс промпта вакансии и ссылка на контекстный кэш Gemini
+    """
+    vacancy = models.OneToOneField(
+        Vacancy,
+        on_delete=models.CASCADE,
+        related_name='prompt_cache',
+        verbose_name="Вакансия"
+    )
+    content_hash = models.CharField(max_length=64, verbose_name="Хэш префикса")
+    vacancy_block = models.TextField(verbose_name="Блок вакансии")
+    gemini_cache_name = models.CharField(max_length=255, blank=True, verbose_name="Кэш Gemini")
+    gemini_cache_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Кэш Gemini истекает")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Префикс промпта вакансии"
+        verbose_name_plural = "Префиксы промптов вакансий"
+
+    def __str__(self):
+        return f"Префикс вакансии {self.vacancy_id} ({self.content_hash[:12]})"
+
+
+class AnalysisStageState(models.Model):
+    """
+    Чекпоинт стадии конвейера анализа отклика.
+    Ключ — (отклик, стадия, отпечаток входных данных): при повторном запуске
+    с теми же входами завершенные стадии не выполняются заново.
+    """
+    STAGE_CHOICES = (
+        ('rule_based', 'Rule-based анализ'),
+        ('llm_evaluate', 'LLM-оценка'),
+        ('questions', 'Генерация вопросов'),
+        ('persist', 'Сохранение результата'),
+        ('chat_init', 'Инициализация чата'),
+        ('notify', 'Уведомление'),
+    )
+    STATUS_CHOICES = (
+        ('running', 'Выполняется'),
+        ('done', 'Завершена'),
+        # Завершена с деградированным результатом: выход используется
+        # следующими стадиями, но при повторном запуске стадия выполнится заново
+        ('degraded', 'Деградированный результат'),
+        ('failed', 'Ошибка'),
+    )
+
+    application = models.ForeignKey(
+        Application,
+        on_delete=models.CASCADE,
+        related_name='analysis_stages',
+        verbose_name="Отклик"
+    )
+    stage = models.CharField(max_length=32, choices=STAGE_CHOICES, verbose_name="Стадия")
+    fingerprint = models.CharField(max_length=64, verbose_name="Отпечаток входных данных")
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default='running',
+        verbose_name="Статус",
+        db_index=True
+    )
+    output = models.JSONField(default=dict, blank=True, verbose_name="Результат стадии")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Стадия анализа"
+        verbose_name_plural = "Стадии анализа"
+        unique_together = ("application", "stage", "fingerprint")
+        indexes = [
+            models.Index(fields=["application", "fingerprint"]),
+        ]
+
+    def __str__(self):
+        return f"{self.application_id}/{self.stage} ({self.status})"
+
+
+class AnalysisReplayItem(models.Model):
+    """
+    Отклик, оцененный без LLM (деградированный режим), в очереди на
+    повторный анализ. Запись удаляется, когда сохранен полноценный результат.
+    """
+    REASON_CHOICES = (
+        ('llm_unavailable', 'LLM недоступен'),
+        ('llm_failed', 'Ошибка LLM'),
+        ('budget_exceeded', 'Бюджет LLM исчерпан'),
+    )
+
+    application = models.OneToOneField(
+        Application,
+        on_delete=models.CASCADE,
+        related_name='replay_item',
+        verbose_name="Отклик"
+    )
+    reason = models.CharField(max_length=32, choices=REASON_CHOICES, verbose_name="Причина")
+    attempts = models.IntegerField(default=0, verbose_name="Повторных запусков")
+    enqueued_at = models.DateTimeField(auto_now_add=True, verbose_name="Поставлен в очередь")
+    last_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний запуск")
+
+    class Meta:
+        verbose_name = "Отклик на повторный анализ"
+        verbose_name_plural = "Очередь повторного анализа"
+        indexes = [
+            models.Index(fields=["last_attempt_at", "enqueued_at"]),
+        ]
+        ordering = ["enqueued_at"]
+
+    def __str__(self):
+        return f"Replay {self.application_id} ({self.reason})"
+
+
+class DeadLetter(models.Model):
+    """
+    Задача анализа, окончательно упавшая после всех повторов,
+    или отклик, анализ которого так и не завершился (сверка).
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает разбора'),
+        ('replayed', 'Перезапущена'),
+        ('resolved', 'Решена'),
+        ('discarded', 'Отброшена'),
+    )
+
+    task_name = models.CharField(max_length=255, verbose_name="Задача", db_index=True)
+    task_id = models.CharField(max_length=255, blank=True, verbose_name="ID задачи")
+    args = models.JSONField(default=list, blank=True, verbose_name="Аргументы")
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name="Именованные аргументы")
+    application = models.ForeignKey(
+        Application,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='dead_letters',
+        verbose_name="Отклик"
+    )
+    stage = models.CharField(max_length=32, blank=True, verbose_name="Стадия")
+    exception_type = models.CharField(max_length=255, blank=True, verbose_name="Тип исключения")
+    exception_message = models.TextField(blank=True, verbose_name="Сообщение исключения")
+    traceback = models.TextField(blank=True, verbose_name="Traceback")
+    attempts = models.IntegerField(default=1, verbose_name="Попыток")
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Статус",
+        db_index=True
+    )
+    replay_count = models.IntegerField(default=0, verbose_name="Перезапусков")
+    last_replayed_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний перезапуск")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Упавшая задача"
+        verbose_name_plural = "Упавшие задачи (DLQ)"
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["application", "status"]),
+        ]
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.task_name} [{self.application_id}] ({self.status})"
+
+
+class QuestionTemplate(models.Model):
+    """
+    Набор шаблонов уточняющих вопросов для сигнатуры расхождений
+    (например, "experience_gap+location"). Шаблоны содержат плейсхолдеры
+    вакансии и кандидата ({vacancy_city}, {candidate_years}, ...).
+    """
+    SOURCE_CHOICES = (
+        ('curated', 'Подготовлен вручную'),
+        ('learned', 'Получен от LLM'),
+    )
+
+    signature = models.CharField(max_length=255, unique=True, verbose_name="Сигнатура расхождений")
+    templates = models.JSONField(default=list, blank=True, verbose_name="Шаблоны вопросов")
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default='learned', verbose_name="Источник")
+    hits = models.IntegerField(default=0, verbose_name="Использований")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Шаблон вопросов"
+        verbose_name_plural = "Банк вопросов"
+        ordering = ["-hits"]
+
+    def __str__(self):
+        return f"{self.signature} ({self.source})"
+
+
+class TenantSchedulingPolicy(models.Model):
+    """
+    Настройки справедливого планировщика анализа для работодателя:
+    вес (доля пропускной способности LLM) и лимит одновременных анализов.
+    Работодатели без записи получают значения по умолчанию из настроек.
+    """
+    employer = models.OneToOneField(
+        Employer,
+        on_delete=models.CASCADE,
+        related_name='scheduling_policy',
+        verbose_name="Работодатель"
+    )
+    weight = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        verbose_name="Вес"
+    )
+    max_in_flight = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1)],
+        verbose_name="Лимит одновременных анализов"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Политика планирования"
+        verbose_name_plural = "Политики планирования анализа"
+
+    def __str__(self):
+        return f"{self.employer_id}: weight={self.weight}, max_in_flight={self.max_in_flight or '-'}"
+
+
+class AnalysisQueueItem(models.Model):
+    """
+    Отклик в очереди справедливого планировщика: ждет отправки на анализ
+    (waiting) или анализируется (dispatched). Запись удаляется после
+    сохранения результата; зависшие dispatched снимаются по таймауту.
+    """
+    STATUS_CHOICES = (
+        ('waiting', 'Ожидает'),
+        ('dispatched', 'Отправлен на анализ'),
+    )
+
+    application = models.OneToOneField(
+        Application,
+        on_delete=models.CASCADE,
+        related_name='queue_item',
+        verbose_name="Отклик"
+    )
+    employer = models.ForeignKey(
+        Employer,
+        on_delete=models.CASCADE,
+        related_name='analysis_queue',
+        verbose_name="Работодатель"
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default='waiting',
+        verbose_name="Статус",
+        db_index=True
+    )
+    batch = models.BooleanField(default=False, verbose_name="Массовая загрузка")
+    chat = models.BooleanField(default=False, verbose_name="Анализ после чата")
+    task_id = models.CharField(max_length=255, blank=True, verbose_name="ID задачи")
+    enqueued_at = models.DateTimeField(auto_now_add=True, verbose_name="Поставлен в очередь")
+    dispatched_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлен на анализ")
+
+    class Meta:
+        verbose_name = "Отклик в очереди анализа"
+        verbose_name_plural = "Очередь анализа по работодателям"
+        indexes = [
+            models.Index(fields=["employer", "status", "enqueued_at"]),
+            models.Index(fields=["status", "dispatched_at"]),
+        ]
+        ordering = ["enqueued_at"]
+
+    def __str__(self):
+        return f"Queue {self.application_id} [{self.employer_id}] ({self.status})"
+
+
+LLM_PURPOSE_CHOICES = (
+    ('evaluate', 'Оценка отклика'),
+    ('questions', 'Вопросы для чата'),
+    ('chat', 'Чат'),
+    ('other', 'Прочее'),
+)
+
+
+class LLMUsageRecord(models.Model):
+    """
+    Журнал вызовов LLM: токены, задержка, модель и назначение вызова.
+    Записи только добавляются, пачками из буфера (LLMUsageLedger.flush).
+    Ссылки на отклик/вакансию/работодателя хранятся без внешних ключей,
+    чтобы вставка не проверяла и не блокировала связанные строки.
+    """
+    created_at = models.DateTimeField(verbose_name="Время вызова")
+    employer_id = models.IntegerField(null=True, blank=True, verbose_name="Работодатель")
+    vacancy_id = models.IntegerField(null=True, blank=True, verbose_name="Вакансия")
+    application_id = models.IntegerField(null=True, blank=True, verbose_name="Отклик")
+    purpose = models.CharField(max_length=16, choices=LLM_PURPOSE_CHOICES, verbose_name="Назначение")
+    model = models.CharField(max_length=64, verbose_name="Модель")
+    prompt_tokens = models.IntegerField(default=0, verbose_name="Токенов запроса")
+    completion_tokens = models.IntegerField(default=0, verbose_name="Токенов ответа")
+    cached_tokens = models.IntegerField(default=0, verbose_name="Токенов из кэша")
+    latency_ms = models.IntegerField(default=0, verbose_name="Задержка, мс")
+    success = models.BooleanField(default=True, verbose_name="Успешно")
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0, verbose_name="Стоимость, $")
+
+    class Meta:
+        verbose_name = "Вызов LLM"
+        verbose_name_plural = "Журнал вызовов LLM"
+        indexes = [
+            models.Index(fields=["created_at"]),
+        ]
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.model} {self.purpose} [{self.application_id}] {self.prompt_tokens}+{self.completion_tokens}"
+
+
+class LLMUsageDaily(models.Model):
+    """
+    Дневная сводка расхода LLM по работодателю, вакансии, назначению и модели.
+    Пополняется при каждом сбросе журнала.
+    """
+    day = models.DateField(verbose_name="День")
+    employer_id = models.IntegerField(null=True, blank=True, verbose_name="Работодатель")
+    vacancy_id = models.IntegerField(null=True, blank=True, verbose_name="Вакансия")
+    purpose = models.CharField(max_length=16, choices=LLM_PURPOSE_CHOICES, verbose_name="Назначение")
+    model = models.CharField(max_length=64, verbose_name="Модель")
+
+    calls = models.IntegerField(default=0, verbose_name="Вызовов")
+    failures = models.IntegerField(default=0, verbose_name="Ошибок")
+    prompt_tokens = models.BigIntegerField(default=0, verbose_name="Токенов запроса")
+    completion_tokens = models.BigIntegerField(default=0, verbose_name="Токенов ответа")
+    cached_tokens = models.BigIntegerField(default=0, verbose_name="Токенов из кэша")
+    latency_ms_total = models.BigIntegerField(default=0, verbose_name="Суммарная задержка, мс")
+    cost = models.DecimalField(max_digits=14, decimal_places=6, default=0, verbose_name="Стоимость, $")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Расход LLM за день"
+        verbose_name_plural = "Расход LLM по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "employer_id", "vacancy_id", "purpose", "model"],
+                name="llmusagedaily_key_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["employer_id", "day"]),
+            models.Index(fields=["vacancy_id", "day"]),
+        ]
+        ordering = ["-day"]
+
+    def __str__(self):
+        return f"{self.day} [{self.employer_id}/{self.vacancy_id}] {self.purpose}: {self.calls} calls"
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+class EmployerLLMBudget(models.Model):
+    """
+    Бюджет LLM работодателя. При превышении анализ переводится на
+    дешевую модель или откладывается (очередь повторного анализа).
+    Пустой лимит — значение по умолчанию из настроек, 0 — без лимита.
+    """
+    ACTION_CHOICES = (
+        ('downgrade', 'Дешевая модель'),
+        ('defer', 'Отложить анализ'),
+    )
+
+    employer = models.OneToOneField(
+        Employer,
+        on_delete=models.CASCADE,
+        related_name='llm_budget',
+        verbose_name="Работодатель"
+    )
+    daily_tokens = models.BigIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name="Лимит токенов в день"
+    )
+    monthly_cost = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name="Лимит расходов в месяц, $"
+    )
+    over_budget_action = models.CharField(
+        max_length=16,
+        choices=ACTION_CHOICES,
+        default='downgrade',
+        verbose_name="При превышении"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Бюджет LLM"
+        verbose_name_plural = "Бюджеты LLM работодателей"
+
+    def __str__(self):
+        return f"{self.employer_id}: {self.daily_tokens or '-'} tokens/day, ${self.monthly_cost or '-'}/month"
@@ -1,8 +1,44 @@
 from rest_framework import serializers
-from .models import RelevanceResult
+from .models import RelevanceResult, VacancyFunnel, EmployerFunnel, DeadLetter
 
 class RelevanceResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = RelevanceResult
         fields = ('id','application','score','reasons','summary','computed_at')
         read_only_fields = ('id','computed_at')
+
+
+class FunnelSerializerMixin(serializers.Serializer):
+    average_score = serializers.FloatField(read_only=True)
+    average_chat_completion_seconds = serializers.FloatField(read_only=True)
+
+    FUNNEL_FIELDS = (
+        'total_applications', 'status_counts', 'score_histogram', 'scored_count',
+        'average_score', 'chat_completed_count', 'average_chat_completion_seconds',
+        'llm_tokens_total', 'llm_cost_total', 'updated_at',
+    )
+
+
+class VacancyFunnelSerializer(FunnelSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = VacancyFunnel
+        fields = ('vacancy',) + FunnelSerializerMixin.FUNNEL_FIELDS
+        read_only_fields = fields
+
+
+class EmployerFunnelSerializer(FunnelSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = EmployerFunnel
+        fields = ('employer',) + FunnelSerializerMixin.FUNNEL_FIELDS
+        read_only_fields = fields
+
+
+class DeadLetterSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeadLetter
+        fields = (
+            'id', 'task_name', 'task_id', 'args', 'kwargs', 'application', 'stage',
+            'exception_type', 'exception_message', 'traceback', 'attempts', 'status',
+            'replay_count', 'last_replayed_at', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
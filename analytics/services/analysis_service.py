@@ -22,8 +22,13 @@ class AnalysisService:
         # 1. Анализ локации (мягкая проверка)
         if hasattr(vacancy, 'city') and hasattr(candidate, 'city'):
             if vacancy.city and candidate.city and vacancy.city.lower() != candidate.city.lower():
-                discrepancies.append(f"Локация: вакансия в {vacancy.city}, кандидат в {candidate.city}")
-                base_score -= penalty_per_item
+                if getattr(candidate, 'willing_to_relocate', None):
+                    # Кандидат подтвердил готовность к переезду — только информируем
+                    discrepancies.append(
+                        f"Локация: вакансия в {vacancy.city}, кандидат в {candidate.city} (готов к переезду)")
+                else:
+                    discrepancies.append(f"Локация: вакансия в {vacancy.city}, кандидат в {candidate.city}")
+                    base_score -= penalty_per_item
 
         # 2. Анализ опыта (мягкая проверка)
         if hasattr(vacancy, 'experience_years') and hasattr(candidate, 'experience_years'):
@@ -0,0 +1,448 @@
+# analytics/services/answer_extraction.py
+"""
+Локальное извлечение структурированных данных из ответов кандидата в чате
+(без вызова LLM): зарплата и валюта, готовность к переезду, срок отработки,
+опыт в годах, дата выхода, тональность. Русский и английский языки.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EXTRACTOR_VERSION = 2
+
+CATEGORY_SALARY = 'salary'
+CATEGORY_RELOCATION = 'relocation'
+CATEGORY_AVAILABILITY = 'availability'
+CATEGORY_EXPERIENCE = 'experience'
+
+# Категория вопроса по его тексту (для вопросов с expected_answer_type='text')
+_QUESTION_PATTERNS = (
+    (CATEGORY_SALARY, re.compile(r"зарплат|доход|оклад|компенсац|ожидани\w* по|salary|compensation|pay\b|rate\b")),
+    (CATEGORY_RELOCATION, re.compile(r"переезд|переех|релокац|relocat|move to|commut|добира")),
+    (CATEGORY_AVAILABILITY, re.compile(r"отработ|приступить|выйти на работу|когда .*(готовы|сможете)|notice|start\b|when can you|available")),
+    (CATEGORY_EXPERIENCE, re.compile(r"опыт|стаж|сколько лет|experience|how many years")),
+)
+
+_NUMBER_WORDS = {
+    'один': 1, 'одна': 1, 'одну': 1, 'два': 2, 'две': 2, 'три': 3, 'четыре': 4, 'пять': 5,
+    'шесть': 6, 'семь': 7, 'восемь': 8, 'девять': 9, 'десять': 10,
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+}
+_NUMBER_WORDS_RE = re.compile(r"\b(" + "|".join(_NUMBER_WORDS) + r")\b")
+
+_NUMBER = r"(\d{1,3}(?:[, \u00a0\u202f]\d{3})+(?!\d)|\d+(?:[.,]\d+)?)"
+_GROUPED_NUMBER = re.compile(r"\d{1,3}(?:[, \u00a0\u202f]\d{3})+")
+# Множитель — отдельным словом/сокращением: "m" в "monthly", "k" в "kzt", "к" в "как" не считаются
+_MULTIPLIER = r"(?:(к|k|тыс\.?|тысяч\w*|thousand|тр|т\.р\.?|млн|mln|m)(?![a-zа-я]))?"
+_SALARY_RE = re.compile(
+    _NUMBER + r"\s*" + _MULTIPLIER + r"(?:\s*(?:-|–|—|до|to)\s*" + _NUMBER + r"\s*" + _MULTIPLIER + r")?"
+)
+_CURRENCIES = (
+    ('KZT', re.compile(r"тенге|\bтг\b|\bkzt\b|₸")),
+    ('RUB', re.compile(r"руб|₽|\bр\b|\bр\.|rub|rur|т\.р|\bтр\b")),
+    ('USD', re.compile(r"\$|usd|доллар|dollar|бакс")),
+    ('EUR', re.compile(r"€|eur|евро")),
+)
+_PERIODS = (
+    ('year', re.compile(r"в год|год\w* доход|per year|a year|annual|/year|/год|годовых")),
+    ('hour', re.compile(r"в час|per hour|an hour|/h\b|/час|hourly")),
+    ('month', re.compile(r"в месяц|/мес|per month|a month|monthly|ежемесячно")),
+)
+_SALARY_CONTEXT = re.compile(r"зарплат|доход|оклад|ожида|хочу|рассчитыва|salary|expect|net|gross|на руки")
+
+# Отрицание относится к глаголу готовности/переезда ("не готов", "can't relocate"),
+# а не к любому "нет"/"no" в ответе ("Нет проблем", "Yes, no problem")
+_NEGATIVE_RELOCATION = re.compile(
+    r"\bне\s+(?:(?!против\b)\w+\s+)?(?:готов\w*|планиру\w*|хочу|хотел\w*|рассматрива\w*|могу|смогу|собира\w*|"
+    r"интересн\w*|переед\w*|переезжа\w*|переехат\w*|буду)|\bни в коем случае\b|"
+    r"\b(?:not|never)\s+(?:\w+\s+)?(?:willing|ready|open|planning|interested|able|relocat\w*|mov\w*)|"
+    r"\b(?:won'?t|can'?t|cannot|don'?t|do not|wouldn'?t|would not)\s+(?:(?!mind\b)\w+\s+)?"
+    r"(?:relocat\w*|move|moving|want|plan\w*|consider\w*|be able)|"
+    # Короткий отказ в начале ответа: "Нет.", "No, ..." (но не "Нет проблем")
+    r"^\W*(?:нет|no|nope)\b(?!\s+(?:проблем\w*|problem\w*|worries))"
+)
+_POSITIVE_RELOCATION = re.compile(
+    r"\bготов\w*|\bда\b|\bрассматрива\w*|\bмогу\b|\bконечно\b|\bсогласен\b|\bбез проблем|"
+    r"\bнет проблем|\bне проблема\b|\bне против\b|"
+    r"\byes\b|\bwilling\b|\bready\b|\bopen to\b|\bsure\b|\bof course\b|\bhappy to\b|"
+    r"\bno problem|\b(?:don'?t|do not|wouldn'?t|would not) mind\b"
+)
+_RELOCATION_CONTEXT = re.compile(r"переезд|переех|релокац|relocat|move|командиров")
+
+_IMMEDIATE = re.compile(
+    r"\bсразу\b|немедленно|хоть завтра|в любое время|прямо сейчас|\bimmediately\b|right away|\basap\b|"
+    r"\bright now\b|\bany time\b"
+)
+_DAYS_RE = re.compile(r"(\d+)\s*(?:дн\w*|день|days?)\b")
+_WEEKS_RE = re.compile(r"(\d+)\s*(?:недел\w*|weeks?)\b")
+_MONTHS_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:месяц\w*|мес\b|months?)")
+_SINGLE_WEEK = re.compile(r"\b(?:недел[юяи]|a week|one week)\b")
+_SINGLE_MONTH = re.compile(r"\b(?:месяц\w*|a month|one month)\b")
+_NOTICE_CONTEXT = re.compile(r"отработ|уведомл|notice|выйти|приступ|start|через|in\s+\d|готов")
+
+_YEARS_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*\+?\s*(?:год|года|лет|years?|yrs?)\b")
+_HALF_YEAR = re.compile(r"\bполгода\b|\bпол года\b|\bhalf a year\b|\bsix months\b")
+_ONE_AND_HALF = re.compile(r"\bполтора\b|\bone and a half\b|\b1\.5\b")
+_EXPERIENCE_CONTEXT = re.compile(r"опыт|стаж|работаю|работал|занимаюсь|experience|worked|working")
+
+_RU_MONTHS = {
+    'январ': 1, 'феврал': 2, 'март': 3, 'апрел': 4, 'ма': 5, 'июн': 6,
+    'июл': 7, 'август': 8, 'сентябр': 9, 'октябр': 10, 'ноябр': 11, 'декабр': 12,
+}
+_EN_MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+_NUMERIC_DATE = re.compile(r"\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2,4}))?\b")
+_RU_DATE = re.compile(r"\b(\d{1,2})\s+(январ|феврал|март|апрел|ма|июн|июл|август|сентябр|октябр|ноябр|декабр)[а-я]*")
+_EN_DATE = re.compile(
+    r"\b(?:(\d{1,2})(?:st|nd|rd|th)?\s+(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*|"
+    r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{1,2})(?:st|nd|rd|th)?)\b"
+)
+
+# Лексикон тональности (основы слов)
+_POSITIVE_STEMS = (
+    'готов', 'интерес', 'рад', 'хорош', 'отлич', 'конечно', 'соглас', 'нрав', 'люблю', 'спасиб',
+    'с удовольствием', 'уверен', 'легко', 'без проблем', 'да',
+    'yes', 'sure', 'happy', 'glad', 'great', 'good', 'excellent', 'interest', 'love', 'like',
+    'excit', 'confident', 'willing', 'thank', 'absolutely', 'definitely',
+)
+_NEGATIVE_STEMS = (
+    'нет', 'плох', 'сложн', 'трудн', 'против', 'неудоб', 'сомнева', 'к сожалению', 'проблем',
+    'никогда', 'не хочу', 'не могу', 'не готов', 'не интерес',
+    'no', 'not', 'bad', 'difficult', 'hard', 'unfortunately', 'never', 'doubt', 'problem',
+    "can't", 'cannot', "won't", 'unwilling', 'hate',
+)
+_TOKEN_RE = re.compile(r"[a-zа-я']+|[^\sa-zа-я']+")
+_NEGATIONS = {'не', 'ни', 'not', "don't", 'never', 'no'}
+
+
+@dataclass
+class AnswerExtraction:
+    """Результат разбора ответа"""
+    data: Dict = field(default_factory=dict)
+    sentiment: float = 0.0
+    confidence: float = 0.0
+
+
+def _normalize(text: str) -> str:
+    text = (text or "").lower().replace("ё", "е")
+    return _NUMBER_WORDS_RE.sub(lambda m: str(_NUMBER_WORDS[m.group(1)]), text)
+
+
+def _to_number(raw: str) -> float:
+    if _GROUPED_NUMBER.fullmatch(raw):
+        # Разделители разрядов: "150 000", "4,000"
+        return float(re.sub(r"[, \u00a0\u202f]", "", raw))
+    return float(raw.replace(",", "."))
+
+
+def _apply_multiplier(value: float, multiplier: Optional[str]) -> float:
+    if not multiplier:
+        return value
+    if multiplier in ('млн', 'mln', 'm'):
+        return value * 1_000_000
+    return value * 1000
+
+
+def default_currency() -> str:
+    """Валюта, если кандидат ее не назвал (валюта Candidate.expected_salary)"""
+    return getattr(settings, 'CHAT_DEFAULT_SALARY_CURRENCY', 'KZT')
+
+
+def classify_question(text: str) -> str:
+    """Категория вопроса бота по тексту ('' — свободный ответ)"""
+    text = _normalize(text)
+    for category, pattern in _QUESTION_PATTERNS:
+        if pattern.search(text):
+            return category
+    return ''
+
+
+def extract_salary(text: str, expected: bool = False) -> Optional[Dict]:
+    """
+    Зарплата: {"min", "max", "amount", "currency", "period", "confidence"}.
+    expected=True — ответ на вопрос о зарплате (допускаются голые числа).
+    """
+    text = _normalize(text)
+    currency = next((code for code, pattern in _CURRENCIES if pattern.search(text)), None)
+    period = next((name for name, pattern in _PERIODS if pattern.search(text)), None)
+    if not (expected or currency or _SALARY_CONTEXT.search(text)):
+        return None
+
+    for match in _SALARY_RE.finditer(text):
+        low_raw, low_mult, high_raw, high_mult = match.groups()
+        low_mult = low_mult or high_mult
+        low = _apply_multiplier(_to_number(low_raw), low_mult)
+        high = _apply_multiplier(_to_number(high_raw), high_mult or low_mult) if high_raw else low
+        confidence = 0.9 if (currency or low_mult) else 0.6
+
+        if not (low_mult or high_mult) and low < 1000 and currency in (None, 'KZT', 'RUB') and period != 'hour':
+            # "150" в ответ на вопрос о зарплате — это 150 тысяч (тенге, рублей)
+            if not expected or low < 10:
+                continue
+            low, high = low * 1000, high * 1000
+            confidence = 0.5
+
+        low, high = min(low, high), max(low, high)
+        return {
+            "min": low,
+            "max": high,
+            "amount": low,
+            "currency": currency or default_currency(),
+            "period": period or 'month',
+            "confidence": confidence,
+        }
+    return None
+
+
+def extract_relocation(text: str, expected: bool = False) -> Optional[bool]:
+    """Готовность к переезду: True/False, None — не понятно"""
+    text = _normalize(text)
+    if not (expected or _RELOCATION_CONTEXT.search(text)):
+        return None
+    if _NEGATIVE_RELOCATION.search(text):
+        return False
+    if _POSITIVE_RELOCATION.search(text):
+        return True
+    return None
+
+
+def extract_notice_period(text: str, expected: bool = False) -> Optional[int]:
+    """Срок отработки / через сколько готов выйти, в днях"""
+    text = _normalize(text)
+    if _IMMEDIATE.search(text):
+        return 0
+    if not (expected or _NOTICE_CONTEXT.search(text)):
+        return None
+
+    match = _DAYS_RE.search(text)
+    if match:
+        return int(match.group(1))
+    match = _WEEKS_RE.search(text)
+    if match:
+        return int(match.group(1)) * 7
+    match = _MONTHS_RE.search(text)
+    if match:
+        return int(round(_to_number(match.group(1)) * 30))
+    if _SINGLE_WEEK.search(text):
+        return 7
+    if _SINGLE_MONTH.search(text):
+        return 30
+    return None
+
+
+def extract_experience_years(text: str, expected: bool = False) -> Optional[float]:
+    """Опыт работы в годах"""
+    text = _normalize(text)
+    if not (expected or _EXPERIENCE_CONTEXT.search(text)):
+        return None
+
+    if _ONE_AND_HALF.search(text):
+        return 1.5
+    match = _YEARS_RE.search(text)
+    if match:
+        years = _to_number(match.group(1))
+        return years if 0 <= years <= 50 else None
+    if _HALF_YEAR.search(text):
+        return 0.5
+    match = _MONTHS_RE.search(text)
+    if match:
+        return round(_to_number(match.group(1)) / 12, 1)
+    if re.search(r"\bгод\b|\ba year\b", text):
+        return 1.0
+    return None
+
+
+def extract_start_date(text: str, today: date = None, notice_days: int = None) -> Optional[date]:
+    """Дата выхода: явная дата, относительный срок или срок отработки"""
+    today = today or timezone.localdate()
+    text = _normalize(text)
+
+    def _future(day: int, month: int, year: int = None) -> Optional[date]:
+        try:
+            candidate = date(year or today.year, month, day)
+        except ValueError:
+            return None
+        if year is None and candidate < today:
+            candidate = candidate.replace(year=today.year + 1)
+        return candidate
+
+    match = _NUMERIC_DATE.search(text)
+    if match:
+        day, month, year = match.groups()
+        if year:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+        result = _future(int(day), int(month), year)
+        if result:
+            return result
+
+    match = _RU_DATE.search(text)
+    if match:
+        result = _future(int(match.group(1)), _RU_MONTHS[match.group(2)])
+        if result:
+            return result
+
+    match = _EN_DATE.search(text)
+    if match:
+        day = match.group(1) or match.group(4)
+        month = match.group(2) or match.group(3)
+        result = _future(int(day), _EN_MONTHS[month])
+        if result:
+            return result
+
+    if notice_days is None:
+        notice_days = extract_notice_period(text)
+    if notice_days is not None:
+        return today + timedelta(days=notice_days)
+    return None
+
+
+def _stem_match(token: str, stem: str) -> bool:
+    # Короткие основы ("да", "no", "нет") — только целым словом
+    return token == stem if len(stem) <= 3 else token.startswith(stem)
+
+
+def sentiment_score(text: str) -> float:
+    """Тональность по лексикону: от -1 (негатив) до 1 (позитив)"""
+    tokens = _TOKEN_RE.findall(_normalize(text))
+    positive = negative = 0
+    negate_window = 0
+    for token in tokens:
+        if token in _NEGATIONS:
+            negate_window = 2
+            negative += 1 if token in ('no', 'never') else 0
+            continue
+        is_positive = any(_stem_match(token, stem) for stem in _POSITIVE_STEMS if ' ' not in stem)
+        is_negative = any(_stem_match(token, stem) for stem in _NEGATIVE_STEMS if ' ' not in stem)
+        if negate_window:
+            is_positive, is_negative = is_negative, is_positive
+            negate_window -= 1
+        positive += is_positive
+        negative += is_negative
+
+    text = _normalize(text)
+    positive += sum(1 for stem in _POSITIVE_STEMS if ' ' in stem and stem in text)
+    negative += sum(1 for stem in _NEGATIVE_STEMS if ' ' in stem and stem in text)
+
+    total = positive + negative
+    if not total:
+        return 0.0
+    return round((positive - negative) / total, 3)
+
+
+def extract_answer(text: str, category: str = '', today: date = None) -> AnswerExtraction:
+    """
+    Разбор ответа. Если категория вопроса известна, выполняется только
+    соответствующий извлекатель; иначе — все, но с требованием контекстных слов.
+    """
+    data = {"category": category or None, "extractor_version": EXTRACTOR_VERSION}
+    confidences = []
+
+    def wanted(name):
+        return not category or category == name
+
+    if wanted(CATEGORY_SALARY):
+        salary = extract_salary(text, expected=category == CATEGORY_SALARY)
+        if salary:
+            confidences.append(salary.pop("confidence"))
+            data["salary"] = salary
+
+    if wanted(CATEGORY_RELOCATION):
+        relocation = extract_relocation(text, expected=category == CATEGORY_RELOCATION)
+        if relocation is not None:
+            data["relocation"] = relocation
+            confidences.append(0.8 if category else 0.6)
+
+    if wanted(CATEGORY_AVAILABILITY):
+        notice = extract_notice_period(text, expected=category == CATEGORY_AVAILABILITY)
+        if notice is not None:
+            data["notice_period_days"] = notice
+            confidences.append(0.8)
+        start = extract_start_date(text, today=today, notice_days=notice)
+        if start is not None:
+            data["start_date"] = start.isoformat()
+            confidences.append(0.8 if notice is None else 0.7)
+
+    if wanted(CATEGORY_EXPERIENCE):
+        years = extract_experience_years(text, expected=category == CATEGORY_EXPERIENCE)
+        if years is not None:
+            data["experience_years"] = years
+            confidences.append(0.9 if category else 0.6)
+
+    return AnswerExtraction(
+        data=data,
+        sentiment=sentiment_score(text),
+        confidence=max(confidences) if confidences else 0.0,
+    )
+
+
+class AnswerExtractionService:
+    """
+    Сохраняет разбор ответа в CandidateResponse и переносит извлеченные
+    значения в поля кандидата (их использует rule-based анализ).
+    """
+
+    # Минимальная уверенность для записи в профиль кандидата
+    MIN_CONFIDENCE = 0.5
+
+    def process(self, application, question_message, answer_text: str):
+        from candidates.models import CandidateResponse
+
+        category = question_message.expected_answer_type
+        if category not in (CATEGORY_SALARY, CATEGORY_RELOCATION, CATEGORY_AVAILABILITY, CATEGORY_EXPERIENCE):
+            category = classify_question(question_message.text)
+
+        extraction = extract_answer(answer_text, category)
+
+        with transaction.atomic():
+            response, _ = CandidateResponse.objects.update_or_create(
+                application=application,
+                question_message=question_message,
+                defaults={
+                    "answer_text": answer_text,
+                    "extracted_data": extraction.data,
+                    "sentiment_score": extraction.sentiment,
+                    "confidence_score": extraction.confidence,
+                }
+            )
+            if extraction.confidence >= self.MIN_CONFIDENCE:
+                self._update_candidate(application.candidate, extraction.data)
+
+        return response
+
+    @staticmethod
+    def _update_candidate(candidate, data: Dict):
+        updates = {}
+
+        salary = data.get("salary")
+        if salary and salary["currency"] == default_currency() and salary["period"] in ('month', 'year'):
+            amount = salary["amount"] / 12 if salary["period"] == 'year' else salary["amount"]
+            # Значение, не помещающееся в DecimalField, — ошибка разбора, а не зарплата
+            field = type(candidate)._meta.get_field('expected_salary')
+            if 0 < amount < 10 ** (field.max_digits - field.decimal_places):
+                updates["expected_salary"] = Decimal(str(round(amount, 2)))
+        if "relocation" in data:
+            updates["willing_to_relocate"] = data["relocation"]
+        if "notice_period_days" in data:
+            updates["notice_period"] = data["notice_period_days"]
+        if "experience_years" in data:
+            updates["experience_years"] = data["experience_years"]
+
+        updates = {name: value for name, value in updates.items() if getattr(candidate, name) != value}
+        if not updates:
+            return
+        for name, value in updates.items():
+            setattr(candidate, name, value)
+        candidate.save(update_fields=list(updates) + ['updated_at'])
+        logger.info("Candidate %s updated from chat answer: %s", candidate.pk, ", ".join(updates))
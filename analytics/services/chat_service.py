@@ -5,7 +5,13 @@ from django.utils import timezone
 
 from candidates.models import Application, ChatSession, BotMessage
 from analytics.services.analysis_service import AnalysisService
-from analytics.services.llm_client import GeminiClient
+from analytics.services.answer_extraction import AnswerExtractionService, classify_question
+from analytics.services.conversation_memory import ConversationMemory
+from analytics.services.llm_budget import LLMBudgetService, BUDGET_DEFER, BUDGET_OK
+from analytics.services.llm_client import get_llm_client
+from analytics.services.llm_usage import llm_usage_scope, PURPOSE_CHAT
+from analytics.services.prompt_service import PromptService
+from analytics.services.question_bank import QuestionBank
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +22,16 @@ class ChatService:
     """
 
     def __init__(self):
-        self.llm = GeminiClient()
+        self._llm = None
         self.analysis_service = AnalysisService()
+        self.extraction_service = AnswerExtractionService()
+
+    @property
+    def llm(self):
+        # Клиент LLM создается только когда он действительно нужен
+        if self._llm is None:
+            self._llm = get_llm_client()
+        return self._llm
 
     def initialize_chat_for_application(self, application_id: int) -> Optional[ChatSession]:
         """
@@ -62,23 +76,30 @@ class ChatService:
         discrepancies, preliminary_score = self.analysis_service.analyze_discrepancies(vacancy, candidate)
 
         if discrepancies:
-            # Генерируем вопросы через LLM
-            vacancy_text = self._prepare_vacancy_text(vacancy)
-            resume_text = candidate.resume_text or ""
-
-            questions = self.llm.generate_questions(
-                vacancy_text=vacancy_text,
-                resume_text=resume_text,
-                discrepancies=discrepancies
+            # Вопросы из банка шаблонов; LLM — только для новой сигнатуры расхождений.
+            # Сверх бюджета LLM работодателя — дешевая модель или только банк
+            budget = LLMBudgetService()
+            decision = budget.decision(vacancy.employer_id)
+            llm = None if decision == BUDGET_DEFER else (
+                lambda: self.llm if decision == BUDGET_OK else budget.client(decision)
             )
+            with llm_usage_scope(PURPOSE_CHAT, application=application):
+                questions, source = QuestionBank(llm).get_questions(
+                    vacancy, candidate, discrepancies,
+                    resume_text=candidate.resume_text or "",
+                    prefix=lambda: PromptService(self.llm if decision == BUDGET_OK else None).get_prefix(vacancy)
+                )
+            logger.info("Chat questions for session %s from %s", chat_session.pk, source or "none")
 
             # Сохраняем вопросы в чат
             for i, question in enumerate(questions):
                 BotMessage.objects.create(
                     chat_session=chat_session,
                     sender='bot',
+                    message_type='question',
                     text=question,
-                    is_question=True
+                    is_question=True,
+                    expected_answer_type=classify_question(question) or 'text'
                 )
 
         else:
@@ -90,23 +111,42 @@ class ChatService:
                 is_question=False
             )
             chat_session.is_active = False
-            chat_session.save()
+            # Без last_seq: его двигают вставки сообщений в обход этого экземпляра
+            chat_session.save(update_fields=['is_active', 'updated_at', 'last_activity'])
 
     def process_candidate_response(self, chat_session_id: int, candidate_response: str) -> Dict:
         """
         Обрабатывает ответ кандидата и генерирует следующий вопрос или завершает диалог
         """
         try:
-            chat_session = ChatSession.objects.prefetch_related('messages').get(pk=chat_session_id)
+            chat_session = ChatSession.objects.select_related(
+                'application__candidate'
+            ).prefetch_related('messages').get(pk=chat_session_id)
+            question = self._next_question_message(chat_session)
 
             # Сохраняем ответ кандидата
             BotMessage.objects.create(
                 chat_session=chat_session,
                 sender='candidate',
+                message_type='response',
                 text=candidate_response,
-                is_question=False
+                is_question=False,
+                parent_message=question
             )
 
+            # Локальный разбор ответа (зарплата, переезд, сроки, опыт) без LLM
+            if question is not None:
+                try:
+                    self.extraction_service.process(chat_session.application, question, candidate_response)
+                except Exception as e:
+                    logger.warning("Answer extraction failed for session %s: %s", chat_session_id, e)
+
+            # Инкрементально обновляем память диалога (сводка + последние реплики)
+            try:
+                ConversationMemory(chat_session).sync()
+            except Exception as e:
+                logger.warning("Conversation memory update failed for session %s: %s", chat_session_id, e)
+
             # Получаем следующий вопрос или завершаем диалог
             next_question = self._get_next_question(chat_session)
 
@@ -119,7 +159,7 @@ class ChatService:
             else:
                 # Завершаем диалог и запускаем финальный анализ
                 chat_session.is_active = False
-                chat_session.save()
+                chat_session.save(update_fields=['is_active', 'updated_at', 'last_activity'])
 
                 self._finalize_analysis(chat_session.application)
 
@@ -133,10 +173,24 @@ class ChatService:
             logger.exception(f"Failed to process candidate response: {e}")
             return {'status': 'error', 'message': 'Произошла ошибка'}
 
+    def get_conversation_context(self, chat_session: ChatSession) -> str:
+        """
+        Контекст диалога ограниченного размера для LLM-вызовов по сессии
+        (вместо полного транскрипта).
+        """
+        return ConversationMemory(chat_session).sync().context()
+
     def _get_next_question(self, chat_session: ChatSession) -> Optional[str]:
         """
         Возвращает следующий вопрос для кандидата
         """
+        question = self._next_question_message(chat_session)
+        return question.text if question else None
+
+    def _next_question_message(self, chat_session: ChatSession) -> Optional[BotMessage]:
+        """
+        Первый вопрос бота без ответа кандидата
+        """
         # Простая логика - берем следующий неотвеченный вопрос
         bot_questions = chat_session.messages.filter(sender='bot', is_question=True)
         candidate_responses = chat_session.messages.filter(sender='candidate')
@@ -148,23 +202,29 @@ class ChatService:
             has_response = candidate_responses.filter(created_at__gt=question_time).exists()
 
             if not has_response:
-                return question.text
+                return question
 
         return None
 
     def _finalize_analysis(self, application: Application):
         """
-        Запускает финальный анализ после завершения диалога
+        Ставит финальный анализ после завершения диалога в очередь
+        планировщика: он учитывается в лимитах работодателя, а отправляется
+        в очередь chat, а не за первичными анализами.
         """
-        from analytics.tasks import analyze_application_task
-        analyze_application_task.delay(application.id)
-
-    def _prepare_vacancy_text(self, vacancy) -> str:
-        """Подготавливает текст вакансии для LLM"""
-        return " ".join(filter(None, [
-            getattr(vacancy, "title", ""),
-            getattr(vacancy, "description", ""),
-            f"City: {getattr(vacancy, 'city', '')}",
-            f"Experience required: {getattr(vacancy, 'experience_years', '')}",
-            f"Employment type: {getattr(vacancy, 'employment_type', '')}",
-        ]))
\ No newline at end of file
+        from analytics.services.fair_scheduler import FairScheduler
+        FairScheduler().enqueue([application.id], chat=True)
+
+
+_chat_service = None
+
+
+def get_chat_service() -> ChatService:
+    """
+    Общий на процесс экземпляр ChatService (сервис не хранит состояния запроса,
+    LLM-клиент внутри создается лениво и тоже переиспользуется).
+    """
+    global _chat_service
+    if _chat_service is None:
+        _chat_service = ChatService()
+    return _chat_service
@@ -0,0 +1,104 @@
+# analytics/services/circuit_breaker.py
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен: предохранитель разомкнут"""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель вокруг внешнего сервиса, общий для всех воркеров.
+
+    Состояние хранится в кэше Django (Redis в проде):
+    - closed    — вызовы проходят, ошибки подряд считаются;
+    - open      — после failure_threshold ошибок подряд вызовы сразу
+                  отклоняются в течение recovery_timeout секунд;
+    - half_open — по истечении таймаута пропускается один пробный вызов:
+                  успех замыкает предохранитель, ошибка снова размыкает.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, recovery_timeout: int = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or getattr(settings, 'LLM_CIRCUIT_FAILURE_THRESHOLD', 5)
+        self.recovery_timeout = recovery_timeout or getattr(settings, 'LLM_CIRCUIT_RECOVERY_SECONDS', 60)
+
+    def _key(self, suffix: str) -> str:
+        return f"circuit:{self.name}:{suffix}"
+
+    def state(self) -> str:
+        opened_at = cache.get(self._key('opened_at'))
+        if opened_at is None:
+            return STATE_CLOSED
+        if time.time() - opened_at < self.recovery_timeout:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def allow_request(self) -> bool:
+        state = self.state()
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_OPEN:
+            return False
+        # Half-open: пробный вызов достается только одному воркеру
+        return cache.add(self._key('probe'), 1, timeout=self.recovery_timeout)
+
+    def record_success(self):
+        if cache.get(self._key('opened_at')) is not None:
+            logger.info("Circuit %s closed", self.name)
+        cache.delete_many([self._key('opened_at'), self._key('failures'), self._key('probe')])
+
+    def record_failure(self):
+        if self.state() == STATE_HALF_OPEN:
+            self._open()
+            return
+
+        cache.add(self._key('failures'), 0, timeout=self.recovery_timeout * 10)
+        try:
+            failures = cache.incr(self._key('failures'))
+        except ValueError:
+            failures = 1
+        if failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        cache.set(self._key('opened_at'), time.time(), timeout=None)
+        cache.delete_many([self._key('failures'), self._key('probe')])
+        logger.warning("Circuit %s opened for %ss", self.name, self.recovery_timeout)
+
+    def call(self, func, *args, **kwargs):
+        """Выполняет вызов через предохранитель"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            'name': self.name,
+            'state': self.state(),
+            'failures': cache.get(self._key('failures')) or 0,
+            'opened_at': cache.get(self._key('opened_at')),
+            'failure_threshold': self.failure_threshold,
+            'recovery_timeout': self.recovery_timeout,
+        }
+
+
+def llm_circuit_breaker() -> CircuitBreaker:
+    """Предохранитель LLM-бэкенда (Gemini)"""
+    return CircuitBreaker('llm')
@@ -0,0 +1,135 @@
+# analytics/services/conversation_memory.py
+import logging
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import transaction
+
+from candidates.models import BotMessage, CandidateResponse, ChatSession
+from project.response_cache import bump, chat_scope
+
+logger = logging.getLogger(__name__)
+
+MEMORY_KEY = 'memory'
+
+# Какие извлеченные из ответов факты переносятся в память (см. answer_extraction)
+FACT_FIELDS = ('salary', 'relocation', 'notice_period_days', 'experience_years', 'start_date')
+
+_SENDER_LABELS = {'bot': 'Бот', 'candidate': 'Кандидат'}
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+class ConversationMemory:
+    """
+    Память диалога ограниченного размера для LLM-вызовов по чат-сессии.
+
+    Последние recent_turns реплик хранятся дословно, более старые
+    сворачиваются в краткую сводку (по строке на реплику, не длиннее
+    summary_max_chars), извлеченные из ответов факты хранятся отдельно
+    и не вытесняются. Состояние лежит в ChatSession.session_data['memory']
+    и обновляется инкрементально: sync() читает только новые сообщения.
+    """
+
+    def __init__(self, chat_session: ChatSession, recent_turns: int = None,
+                 summary_max_chars: int = None, turn_max_chars: int = None):
+        self.chat_session = chat_session
+        self.recent_turns = recent_turns or getattr(settings, 'CHAT_MEMORY_RECENT_TURNS', 6)
+        self.summary_max_chars = summary_max_chars or getattr(settings, 'CHAT_MEMORY_SUMMARY_CHARS', 1500)
+        self.turn_max_chars = turn_max_chars or getattr(settings, 'CHAT_MEMORY_TURN_CHARS', 600)
+        self.state = self._load(chat_session.session_data)
+
+    @staticmethod
+    def _load(session_data) -> Dict:
+        state = dict((session_data or {}).get(MEMORY_KEY) or {})
+        state.setdefault('summary', [])
+        state.setdefault('dropped', 0)
+        state.setdefault('recent', [])
+        state.setdefault('facts', {})
+        state.setdefault('last_message_id', 0)
+        return state
+
+    def sync(self) -> "ConversationMemory":
+        """Добавляет в память сообщения, появившиеся после прошлой синхронизации"""
+        with transaction.atomic():
+            locked = ChatSession.objects.select_for_update().only('session_data').get(pk=self.chat_session.pk)
+            self.state = self._load(locked.session_data)
+
+            messages = list(
+                BotMessage.objects
+                .filter(chat_session_id=self.chat_session.pk, id__gt=self.state['last_message_id'])
+                .order_by('id')
+                .values('id', 'sender', 'text', 'parent_message_id')
+            )
+            if not messages:
+                return self
+
+            for message in messages:
+                self._append(message)
+            self._merge_facts(messages)
+            self.state['last_message_id'] = messages[-1]['id']
+
+            session_data = dict(locked.session_data or {})
+            session_data[MEMORY_KEY] = self.state
+            ChatSession.objects.filter(pk=self.chat_session.pk).update(session_data=session_data)
+            self.chat_session.session_data = session_data
+            # update() не вызывает сигналы — версию кэша ответа меняем сами
+            bump(chat_scope(self.chat_session.pk))
+
+        return self
+
+    def _append(self, message: Dict):
+        self.state['recent'].append({
+            'id': message['id'],
+            'sender': message['sender'],
+            'text': _clip(message['text'], self.turn_max_chars),
+        })
+        while len(self.state['recent']) > self.recent_turns:
+            self._fold(self.state['recent'].pop(0))
+
+    def _fold(self, turn: Dict):
+        """Сворачивает реплику в сводку, вытесняя самые старые строки сверх лимита"""
+        label = _SENDER_LABELS.get(turn['sender'], turn['sender'])
+        limit = 120 if turn['sender'] == 'bot' else 200
+        summary = self.state['summary']
+        summary.append(f"{label}: {_clip(turn['text'], limit)}")
+        while summary and sum(len(line) + 1 for line in summary) > self.summary_max_chars:
+            summary.pop(0)
+            self.state['dropped'] += 1
+
+    def _merge_facts(self, messages: List[Dict]):
+        question_ids = [m['parent_message_id'] for m in messages
+                        if m['sender'] == 'candidate' and m['parent_message_id']]
+        if not question_ids:
+            return
+        responses = CandidateResponse.objects.filter(
+            application_id=self.chat_session.application_id,
+            question_message_id__in=question_ids
+        ).order_by('created_at').values_list('extracted_data', flat=True)
+        for data in responses:
+            for name in FACT_FIELDS:
+                if name in (data or {}):
+                    self.state['facts'][name] = data[name]
+
+    def context_lines(self) -> List[str]:
+        """Контекст диалога ограниченного размера: факты, сводка, последние реплики"""
+        lines = []
+        facts = self.state['facts']
+        if facts:
+            lines.append("Факты из ответов кандидата: " + "; ".join(
+                f"{name}={value}" for name, value in sorted(facts.items())
+            ))
+        if self.state['summary']:
+            header = "Ранее в диалоге"
+            if self.state['dropped']:
+                header += f" (еще {self.state['dropped']} реплик опущено)"
+            lines.append(header + ":\n" + "\n".join(self.state['summary']))
+        for turn in self.state['recent']:
+            lines.append(f"{_SENDER_LABELS.get(turn['sender'], turn['sender'])}: {turn['text']}")
+        return lines
+
+    def context(self) -> str:
+        return "\n".join(self.context_lines())
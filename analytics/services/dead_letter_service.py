@@ -0,0 +1,203 @@
+# analytics/services/dead_letter_service.py
+import logging
+import traceback as traceback_module
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from analytics.models import DeadLetter
+from candidates.models import Application
+from project.celery import TASK_ANALYZE_APPLICATION, TASK_PROCESS_CHAT_COMPLETION, batch_options, dispatch
+
+logger = logging.getLogger(__name__)
+
+# Задачи-стадии конвейера анализа -> стадия
+STAGE_TASKS = {
+    "analytics.tasks.rule_based_stage": "rule_based",
+    "analytics.tasks.llm_evaluate_stage": "llm_evaluate",
+    "analytics.tasks.questions_stage": "questions",
+    "analytics.tasks.persist_stage": "persist",
+    "analytics.tasks.chat_init_stage": "chat_init",
+    "analytics.tasks.notify_stage": "notify",
+}
+
+# Задачи, перезапуск которых — это анализ отклика целиком
+ANALYSIS_TASKS = (TASK_ANALYZE_APPLICATION, TASK_PROCESS_CHAT_COMPLETION)
+
+ACTIVE_STATUSES = ('pending', 'replayed')
+
+
+class DeadLetterService:
+    """
+    Хранилище упавших задач анализа (DLQ): запись, перезапуск, сверка.
+    """
+
+    def record(self, task_name: str, args: Iterable = (), kwargs: dict = None,
+               exc: BaseException = None, stage: str = "", application_id: Optional[int] = None,
+               task_id: str = "", attempts: int = 1, tb: str = None,
+               terminal: bool = True) -> DeadLetter:
+        """
+        Сохраняет упавшую задачу. Повторное падение той же задачи по тому же
+        отклику и стадии обновляет существующую запись, а не создает новую.
+        terminal=False — запись без окончательного падения задачи (сверка):
+        место отклика в планировщике не освобождается.
+        """
+        args = list(args or [])
+        if application_id is None and args and isinstance(args[0], int):
+            application_id = args[0]
+        stage = stage or STAGE_TASKS.get(task_name, "")
+        if tb is None and exc is not None and exc.__traceback__ is not None:
+            tb = "".join(traceback_module.format_exception(type(exc), exc, exc.__traceback__))
+
+        fields = {
+            "task_id": task_id or "",
+            "args": args,
+            "kwargs": kwargs or {},
+            "exception_type": type(exc).__name__ if exc is not None else "",
+            "exception_message": str(exc)[:4000] if exc is not None else "",
+            "traceback": (tb or "")[-20000:],
+        }
+
+        with transaction.atomic():
+            existing = (
+                DeadLetter.objects.select_for_update()
+                .filter(task_name=task_name, application_id=application_id,
+                        stage=stage, status__in=ACTIVE_STATUSES)
+                .first()
+            )
+            if existing:
+                for name, value in fields.items():
+                    setattr(existing, name, value)
+                existing.attempts = F('attempts') + max(attempts, 1)
+                existing.status = 'pending'
+                existing.save()
+                existing.refresh_from_db(fields=['attempts'])
+                entry = existing
+            else:
+                entry = DeadLetter.objects.create(
+                    task_name=task_name, application_id=application_id,
+                    stage=stage, attempts=max(attempts, 1), **fields
+                )
+
+        logger.warning("Dead letter %s: %s [app=%s, stage=%s] %s",
+                       entry.pk, task_name, application_id, stage or "-", fields["exception_type"])
+        if terminal and application_id is not None:
+            # Окончательно упавший анализ не должен занимать место работодателя
+            # в планировщике; ожидающий в очереди отклик остается в ней
+            from analytics.services.fair_scheduler import FairScheduler
+
+            FairScheduler().release(application_id, status='dispatched')
+        return entry
+
+    def resolve_application(self, application_id: int):
+        """Закрывает записи отклика, анализ которого завершился"""
+        DeadLetter.objects.filter(
+            application_id=application_id, status__in=ACTIVE_STATUSES
+        ).update(status='resolved', updated_at=timezone.now())
+
+    @staticmethod
+    def replay_target(entry: DeadLetter):
+        """
+        Что перезапускать: для анализа отклика (стадии, запуск, анализ после
+        чата) — весь конвейер (завершенные стадии восстановятся из чекпоинтов),
+        для остальных — исходную задачу.
+        """
+        if entry.application_id and (entry.task_name in STAGE_TASKS or entry.task_name in ANALYSIS_TASKS):
+            return TASK_ANALYZE_APPLICATION, [entry.application_id], {}
+        return entry.task_name, entry.args, entry.kwargs
+
+    def replay(self, entries, rate_per_second: float = None) -> int:
+        """
+        Перезапускает записи. Анализ откликов ставится в очередь справедливого
+        планировщика (массовой загрузкой) и идет в пределах лимитов работодателя,
+        остальные задачи — через очередь batch со скоростью, ограниченной
+        отложенным стартом (countdown), так что вызов не блокируется.
+        Возвращает число перезапущенных задач.
+        """
+        from analytics.services.fair_scheduler import FairScheduler
+
+        rate = rate_per_second or getattr(settings, 'DEAD_LETTER_REPLAY_RATE', 2.0)
+        now = timezone.now()
+        dispatched = 0
+        countdown_slot = 0
+        seen = set()
+        analysis_ids = []
+
+        for entry in entries:
+            task_name, args, kwargs = self.replay_target(entry)
+            key = (task_name, tuple(args), tuple(sorted((kwargs or {}).items())))
+            if key not in seen:
+                seen.add(key)
+                if task_name == TASK_ANALYZE_APPLICATION:
+                    analysis_ids.append(args[0])
+                else:
+                    dispatch(task_name, *args, kwargs=kwargs,
+                             countdown=countdown_slot / rate, **batch_options())
+                    countdown_slot += 1
+                dispatched += 1
+            DeadLetter.objects.filter(pk=entry.pk).update(
+                status='replayed', replay_count=F('replay_count') + 1,
+                last_replayed_at=now, updated_at=now
+            )
+        FairScheduler().enqueue(analysis_ids, batch=True)
+
+        logger.info("Replayed %d dead-letter tasks at %.2f/s", dispatched, rate)
+        return dispatched
+
+    def discard(self, entries) -> int:
+        return DeadLetter.objects.filter(pk__in=[e.pk for e in entries]).update(
+            status='discarded', updated_at=timezone.now()
+        )
+
+    def stuck_applications(self, older_than: timedelta = None):
+        """
+        Отклики, анализ которых так и не завершился:
+        - новые без RelevanceResult старше older_than;
+        - с завершенным чатом, но без анализа после завершения чата.
+        Отклики, уже находящиеся в DLQ, очереди повторного анализа или очереди
+        справедливого планировщика (ждут места или анализируются), не включаются.
+        """
+        older_than = older_than or timedelta(
+            minutes=getattr(settings, 'DEAD_LETTER_RECONCILE_AFTER_MINUTES', 30)
+        )
+        cutoff = timezone.now() - older_than
+
+        never_analyzed = Q(status='new', relevance_result__isnull=True, created_at__lt=cutoff)
+        chat_not_analyzed = Q(
+            chat_completed_at__lt=cutoff
+        ) & (Q(relevance_result__isnull=True) | Q(relevance_result__updated_at__lt=F('chat_completed_at')))
+
+        return (
+            Application.objects
+            .filter(never_analyzed | chat_not_analyzed)
+            .exclude(dead_letters__status__in=ACTIVE_STATUSES)
+            .exclude(replay_item__isnull=False)
+            .exclude(queue_item__isnull=False)
+            .values_list('pk', 'chat_completed_at')
+            .distinct()
+        )
+
+    def reconcile(self, older_than: timedelta = None, dry_run: bool = False) -> int:
+        """Записывает в DLQ отклики, анализ которых не завершился"""
+        found = 0
+        for application_id, chat_completed_at in self.stuck_applications(older_than).iterator():
+            found += 1
+            if dry_run:
+                continue
+            task_name = TASK_PROCESS_CHAT_COMPLETION if chat_completed_at else TASK_ANALYZE_APPLICATION
+            self.record(
+                task_name, args=[application_id], stage="reconcile",
+                application_id=application_id, attempts=0, terminal=False,
+                exc=AnalysisNotFinished(f"Analysis of application {application_id} never finished"),
+            )
+        if found:
+            logger.warning("Reconciliation found %d applications without finished analysis", found)
+        return found
+
+
+class AnalysisNotFinished(Exception):
+    """Анализ отклика не завершился (найдено сверкой)"""
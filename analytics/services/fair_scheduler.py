@@ -0,0 +1,324 @@
+# analytics/services/fair_scheduler.py
+"""
+Справедливое распределение анализа откликов между работодателями.
+
+Отклики не отправляются в Celery напрямую, а ставятся в очередь
+AnalysisQueueItem по работодателю (вакансия -> работодатель). Планировщик
+держит в работе не больше LLM_SCHEDULER_MAX_IN_FLIGHT анализов и делит
+свободные места между работодателями по deficit round-robin с весами из
+TenantSchedulingPolicy, не превышая лимит работодателя. Поэтому массовая
+загрузка одного работодателя не задерживает первые анализы остальных.
+
+Планирование запускается после постановки в очередь, после завершения
+анализа (release) и раз в минуту из beat (страховка и снятие зависших).
+Повторные анализы (DLQ, очередь повторного анализа) тоже проходят через
+enqueue и не обходят лимиты работодателя.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q
+from django.utils import timezone
+
+from analytics.models import AnalysisQueueItem, AnalysisStageState, TenantSchedulingPolicy
+from analytics.services.queue_metrics import record_wait, wait_summary
+from candidates.models import Application
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "fair_scheduler:lock"
+PENDING_KEY = "fair_scheduler:pending"
+STATE_KEY = "fair_scheduler:drr"
+LOCK_TIMEOUT = 30
+STATE_TTL = 24 * 3600
+
+
+def tenant_metrics_name(employer_id: int) -> str:
+    """Имя для queue_metrics: время ожидания в очереди планировщика по работодателю"""
+    return f"tenant:{employer_id}"
+
+
+class FairScheduler:
+    """
+    Очередь анализа по работодателям с взвешенным справедливым планированием.
+    """
+
+    def __init__(self):
+        self.max_in_flight = getattr(settings, 'LLM_SCHEDULER_MAX_IN_FLIGHT', 16)
+        self.default_weight = getattr(settings, 'LLM_SCHEDULER_DEFAULT_WEIGHT', 1)
+        self.default_tenant_limit = getattr(settings, 'LLM_SCHEDULER_TENANT_MAX_IN_FLIGHT', 0)
+        self.dispatch_timeout = timedelta(seconds=getattr(settings, 'LLM_SCHEDULER_DISPATCH_TIMEOUT', 900))
+        self.batch_dispatch_timeout = timedelta(
+            seconds=getattr(settings, 'LLM_SCHEDULER_BATCH_DISPATCH_TIMEOUT', 3600)
+        )
+
+    # ------------------------------------------------------------------
+    # Очередь
+    # ------------------------------------------------------------------
+
+    def enqueue(self, application_ids: Iterable[int], batch: bool = False, chat: bool = False) -> Dict[int, str]:
+        """
+        Ставит отклики в очередь анализа. Отклик, уже стоящий в очереди,
+        повторно не добавляется. chat — финальный анализ после диалога:
+        у работодателя идет первым и отправляется в очередь Celery chat. Возвращает {application_id: task_id} —
+        id будущей задачи analyze_application_task. Планирование
+        запускается после коммита текущей транзакции.
+        """
+        application_ids = list(application_ids)
+        if not application_ids:
+            return {}
+
+        AnalysisQueueItem.objects.bulk_create(
+            [AnalysisQueueItem(application_id=pk, employer_id=employer_id,
+                               batch=batch, chat=chat, task_id=str(uuid.uuid4()))
+             for pk, employer_id in Application.objects.filter(pk__in=application_ids)
+             .values_list('pk', 'vacancy__employer_id')],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        task_ids = dict(
+            AnalysisQueueItem.objects.filter(application_id__in=application_ids)
+            .values_list('application_id', 'task_id')
+        )
+        transaction.on_commit(self.kick)
+        return task_ids
+
+    def release(self, application_id: int, status: Optional[str] = None):
+        """
+        Снимает отклик с очереди после завершения анализа и отдает место
+        следующему. status ограничивает снятие записями в этом статусе.
+        """
+        items = AnalysisQueueItem.objects.filter(application_id=application_id)
+        if status:
+            items = items.filter(status=status)
+        deleted, _ = items.delete()
+        if deleted:
+            transaction.on_commit(self.kick)
+
+    def kick(self):
+        """Планирование без исключений (из on_commit); ошибку подберет периодический запуск"""
+        try:
+            self.schedule()
+        except Exception as e:
+            logger.exception("Fair scheduling failed: %s", e)
+
+    # ------------------------------------------------------------------
+    # Планирование
+    # ------------------------------------------------------------------
+
+    def _acquire(self) -> bool:
+        if cache.add(LOCK_KEY, 1, LOCK_TIMEOUT):
+            return True
+        # Планирование уже идет в другом процессе: просим его повторить проход.
+        # Повторная попытка закрывает гонку с только что отпущенной блокировкой.
+        cache.set(PENDING_KEY, 1, LOCK_TIMEOUT)
+        return cache.add(LOCK_KEY, 1, LOCK_TIMEOUT)
+
+    def schedule(self) -> int:
+        """
+        Отправляет на анализ очередные отклики в пределах свободных мест.
+        Одновременно планирует только один процесс. Возвращает число
+        отправленных откликов.
+        """
+        dispatched = 0
+        while self._acquire():
+            try:
+                cache.delete(PENDING_KEY)
+                dispatched += self._schedule_round()
+            finally:
+                cache.delete(LOCK_KEY)
+            if not cache.get(PENDING_KEY):
+                break
+        return dispatched
+
+    def _schedule_round(self) -> int:
+        now = timezone.now()
+        self.reap_stale(now)
+
+        in_flight = self._counts('dispatched')
+        free = self.max_in_flight - sum(in_flight.values())
+        waiting = self._counts('waiting')
+        if free <= 0 or not waiting:
+            return 0
+
+        quotas = self.allocate(waiting, in_flight, self._policies(waiting), free)
+        if not quotas:
+            return 0
+
+        with transaction.atomic():
+            selected = []
+            for employer_id, quota in quotas.items():
+                # Анализ после чата идет первым, отклики, созданные поштучно, —
+                # раньше массовой загрузки того же работодателя
+                selected += list(
+                    AnalysisQueueItem.objects.select_for_update(skip_locked=True)
+                    .filter(employer_id=employer_id, status='waiting')
+                    .order_by('-chat', 'batch', 'enqueued_at', 'pk')[:quota]
+                )
+            if not selected:
+                return 0
+            AnalysisQueueItem.objects.filter(pk__in=[item.pk for item in selected]).update(
+                status='dispatched', dispatched_at=now
+            )
+            transaction.on_commit(lambda: [self._dispatch(item) for item in selected])
+
+        for item in selected:
+            record_wait(tenant_metrics_name(item.employer_id), (now - item.enqueued_at).total_seconds())
+        logger.debug("Fair scheduler dispatched %d applications: %s", len(selected), dict(quotas))
+        return len(selected)
+
+    def allocate(self, waiting: Dict[int, int], in_flight: Dict[int, int],
+                 policies: Dict[int, tuple], free: int) -> Dict[int, int]:
+        """
+        Deficit round-robin: за каждый круг работодатель получает кредит,
+        равный весу, и забирает столько мест, сколько позволяют кредит,
+        его очередь и лимит. Неизрасходованный кредит и позиция обхода
+        сохраняются между запусками. Возвращает {employer_id: мест}.
+        """
+        state = cache.get(STATE_KEY) or {}
+        deficits = state.get('deficits', {})
+        last = state.get('last')
+
+        def weight(employer_id):
+            return policies.get(employer_id, (self.default_weight, None))[0]
+
+        def room(employer_id):
+            limit = self.tenant_limit(policies.get(employer_id, (None, None))[1])
+            available = min(waiting[employer_id], limit - in_flight.get(employer_id, 0))
+            return available - quotas[employer_id]
+
+        # Обход начинается с работодателя, следующего за обслуженным последним
+        employers = sorted(waiting)
+        start = next((i for i, employer_id in enumerate(employers) if last is not None and employer_id > last), 0)
+        quotas = defaultdict(int)
+        active = [employer_id for employer_id in employers[start:] + employers[:start] if room(employer_id) > 0]
+
+        while free > 0 and active:
+            for employer_id in list(active):
+                deficits[employer_id] = deficits.get(employer_id, 0) + weight(employer_id)
+                take = min(deficits[employer_id], room(employer_id), free)
+                if take > 0:
+                    quotas[employer_id] += take
+                    deficits[employer_id] -= take
+                    free -= take
+                    last = employer_id
+                if room(employer_id) <= 0:
+                    active.remove(employer_id)
+                if free <= 0:
+                    break
+
+        # Работодатель с опустевшей очередью не копит кредит
+        deficits = {
+            employer_id: deficit for employer_id, deficit in deficits.items()
+            if employer_id in waiting and quotas[employer_id] < waiting[employer_id]
+        }
+        cache.set(STATE_KEY, {'deficits': deficits, 'last': last}, STATE_TTL)
+        return {employer_id: quota for employer_id, quota in quotas.items() if quota > 0}
+
+    def tenant_limit(self, limit: Optional[int] = None) -> int:
+        """Лимит работодателя: из политики, иначе по умолчанию; 0 — только общий лимит"""
+        return limit or self.default_tenant_limit or self.max_in_flight
+
+    def reap_stale(self, now=None) -> int:
+        """
+        Возвращает в очередь отклики, анализ которых перестал подавать признаки
+        жизни. Признак жизни — отправка или обновление чекпоинта стадии
+        (AnalysisStageState) за последние LLM_SCHEDULER_DISPATCH_TIMEOUT;
+        для массовой загрузки, ждущей в очереди batch, срок до первой стадии —
+        LLM_SCHEDULER_BATCH_DISPATCH_TIMEOUT. Идущий анализ (повторы стадий)
+        повторно не отправляется.
+        """
+        now = now or timezone.now()
+        cutoff = now - self.dispatch_timeout
+        heartbeat = AnalysisStageState.objects.filter(
+            application_id=OuterRef('application_id'),
+            updated_at__gte=OuterRef('dispatched_at'),
+        )
+        reaped = (
+            AnalysisQueueItem.objects
+            .filter(status='dispatched', dispatched_at__lt=cutoff)
+            .exclude(Exists(heartbeat.filter(updated_at__gte=cutoff)))
+            .filter(
+                Q(batch=False)
+                | Q(dispatched_at__lt=now - self.batch_dispatch_timeout)
+                | Exists(heartbeat)
+            )
+            .update(status='waiting', dispatched_at=None)
+        )
+        if reaped:
+            logger.warning("Fair scheduler: %d stale dispatched applications returned to queue", reaped)
+        return reaped
+
+    def _dispatch(self, item: AnalysisQueueItem):
+        from project.celery import TASK_ANALYZE_APPLICATION, batch_options, chat_options, dispatch
+
+        options = chat_options() if item.chat else batch_options() if item.batch else {}
+        try:
+            dispatch(TASK_ANALYZE_APPLICATION, item.application_id, task_id=item.task_id or None, **options)
+        except Exception as e:
+            # Запись остается dispatched и вернется в очередь по таймауту
+            logger.exception("Failed to dispatch analysis for application %s: %s", item.application_id, e)
+
+    @staticmethod
+    def _counts(status: str) -> Dict[int, int]:
+        return dict(
+            AnalysisQueueItem.objects.filter(status=status).order_by()
+            .values_list('employer_id').annotate(n=Count('pk'))
+        )
+
+    @staticmethod
+    def _policies(employer_ids: Iterable[int]) -> Dict[int, tuple]:
+        return {
+            employer_id: (weight, max_in_flight)
+            for employer_id, weight, max_in_flight in TenantSchedulingPolicy.objects
+            .filter(employer_id__in=list(employer_ids))
+            .values_list('employer_id', 'weight', 'max_in_flight')
+        }
+
+    # ------------------------------------------------------------------
+    # Метрики
+    # ------------------------------------------------------------------
+
+    def stats(self, employer_ids: Optional[Iterable[int]] = None) -> dict:
+        """
+        Состояние очереди по работодателям: ожидающие, в работе, возраст
+        самого старого ожидающего отклика, вес/лимит и время ожидания
+        до отправки (среднее, скользящее, максимум).
+        """
+        now = timezone.now()
+        rows = (
+            AnalysisQueueItem.objects.order_by()
+            .values_list('employer_id', 'status')
+            .annotate(n=Count('pk'), oldest=Min('enqueued_at'))
+        )
+        tenants = defaultdict(lambda: {'waiting': 0, 'in_flight': 0, 'oldest_waiting_seconds': None})
+        for employer_id, status, count, oldest in rows:
+            if status == 'waiting':
+                tenants[employer_id]['waiting'] = count
+                tenants[employer_id]['oldest_waiting_seconds'] = round((now - oldest).total_seconds(), 3)
+            else:
+                tenants[employer_id]['in_flight'] = count
+        for employer_id in employer_ids or ():
+            tenants[employer_id]
+
+        policies = self._policies(tenants)
+        for employer_id, data in tenants.items():
+            weight, limit = policies.get(employer_id, (self.default_weight, None))
+            data.update(
+                weight=weight,
+                max_in_flight=self.tenant_limit(limit),
+                **wait_summary(tenant_metrics_name(employer_id)),
+            )
+
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': sum(data['in_flight'] for data in tenants.values()),
+            'waiting': sum(data['waiting'] for data in tenants.values()),
+            'tenants': {str(employer_id): data for employer_id, data in sorted(tenants.items())},
+        }
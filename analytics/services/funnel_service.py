@@ -0,0 +1,276 @@
+# analytics/services/funnel_service.py
+import logging
+from collections import Counter
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, DurationField, Sum
+
+from analytics.models import EmployerFunnel, SCORE_HISTOGRAM_BUCKETS, VacancyFunnel
+from candidates.models import Application, ChatSession
+from jobs.models import Vacancy
+
+logger = logging.getLogger(__name__)
+
+
+def score_bucket(score: Optional[float]) -> Optional[int]:
+    """Номер корзины гистограммы для балла (None — балла нет)"""
+    if score is None:
+        return None
+    return max(0, min(int(score // (100 / SCORE_HISTOGRAM_BUCKETS)), SCORE_HISTOGRAM_BUCKETS - 1))
+
+
+def application_state(app: Application) -> Dict:
+    """
+    Снимок полей отклика, влияющих на воронку.
+    Читает только загруженные поля, чтобы не вызывать запросов для отложенных.
+    """
+    loaded = app.__dict__
+    return {
+        'status': loaded.get('status'),
+        'final_score': loaded.get('final_score'),
+        'chat_completed': loaded['chat_completed_at'] is not None if 'chat_completed_at' in loaded else None,
+        'loaded': {name for name in ('status', 'final_score', 'chat_completed_at') if name in loaded},
+    }
+
+
+class FunnelDelta:
+    """Накопитель изменений воронки"""
+
+    def __init__(self):
+        self.total = 0
+        self.statuses = Counter()
+        self.buckets = Counter()
+        self.scored = 0
+        self.score_sum = 0.0
+        self.chat_completed = 0
+        self.chat_duration = 0.0
+        self.llm_tokens = 0
+        self.llm_cost = Decimal('0')
+
+    def add_application(self, state: Dict, sign: int = 1):
+        self.total += sign
+        if state.get('status'):
+            self.statuses[state['status']] += sign
+        self.add_score(state.get('final_score'), sign)
+
+    def add_score(self, score: Optional[float], sign: int = 1):
+        bucket = score_bucket(score)
+        if bucket is None:
+            return
+        self.buckets[bucket] += sign
+        self.scored += sign
+        self.score_sum += sign * score
+
+    def is_empty(self) -> bool:
+        return not any([
+            self.total, any(self.statuses.values()), any(self.buckets.values()),
+            self.scored, self.score_sum, self.chat_completed, self.chat_duration,
+            self.llm_tokens, self.llm_cost,
+        ])
+
+    def apply_to(self, rollup):
+        rollup.total_applications += self.total
+
+        counts = dict(rollup.status_counts or {})
+        for status, delta in self.statuses.items():
+            counts[status] = counts.get(status, 0) + delta
+        rollup.status_counts = counts
+
+        histogram = list(rollup.score_histogram or [])
+        histogram += [0] * (SCORE_HISTOGRAM_BUCKETS - len(histogram))
+        for bucket, delta in self.buckets.items():
+            histogram[bucket] += delta
+        rollup.score_histogram = histogram
+
+        rollup.scored_count += self.scored
+        rollup.score_sum += self.score_sum
+        rollup.chat_completed_count += self.chat_completed
+        rollup.chat_duration_total += self.chat_duration
+        rollup.llm_tokens_total += self.llm_tokens
+        rollup.llm_cost_total = Decimal(rollup.llm_cost_total or 0) + self.llm_cost
+
+
+class FunnelService:
+    """
+    Сервис инкрементального обновления воронок вакансий и работодателей
+    """
+
+    def apply(self, vacancy_id: int, delta: FunnelDelta, employer_id: int = None):
+        """Применяет изменение к воронке вакансии и ее работодателя под блокировкой строк"""
+        if delta.is_empty():
+            return
+        if employer_id is None:
+            employer_id = Vacancy.objects.filter(pk=vacancy_id).values_list('employer_id', flat=True).first()
+
+        with transaction.atomic():
+            rollups = [self._locked(VacancyFunnel, vacancy_id=vacancy_id)]
+            if employer_id:
+                rollups.append(self._locked(EmployerFunnel, employer_id=employer_id))
+            for rollup in rollups:
+                delta.apply_to(rollup)
+                rollup.save()
+
+    @staticmethod
+    def _locked(model, **lookup):
+        model.objects.get_or_create(**lookup)
+        return model.objects.select_for_update().get(**lookup)
+
+    def track_application_change(self, app: Application, old_state: Optional[Dict], created: bool):
+        """
+        Переносит изменение статуса/балла/завершения чата отклика в воронку.
+        old_state — снимок application_state() на момент загрузки из БД.
+        """
+        new_state = application_state(app)
+        delta = FunnelDelta()
+
+        if created or old_state is None:
+            delta.add_application(new_state)
+        else:
+            known = old_state['loaded'] & new_state['loaded']
+            if 'status' in known and old_state['status'] != new_state['status']:
+                if old_state['status']:
+                    delta.statuses[old_state['status']] -= 1
+                if new_state['status']:
+                    delta.statuses[new_state['status']] += 1
+            if 'final_score' in known and old_state['final_score'] != new_state['final_score']:
+                delta.add_score(old_state['final_score'], -1)
+                delta.add_score(new_state['final_score'])
+            if 'chat_completed_at' in known and not old_state['chat_completed'] and new_state['chat_completed']:
+                delta.chat_completed += 1
+                delta.chat_duration += self._chat_duration(app)
+
+        if created and new_state['chat_completed']:
+            delta.chat_completed += 1
+            delta.chat_duration += self._chat_duration(app)
+
+        self.apply(app.vacancy_id, delta)
+
+    def track_application_deleted(self, app: Application):
+        delta = FunnelDelta()
+        delta.add_application(application_state(app), sign=-1)
+        self.apply(app.vacancy_id, delta)
+
+    def track_bulk_created(self, vacancy_counts: Dict[int, int], status: str = 'new'):
+        """Учет откликов, созданных через bulk_create (сигналы не срабатывают)"""
+        for vacancy_id, count in vacancy_counts.items():
+            delta = FunnelDelta()
+            delta.total = count
+            delta.statuses[status] = count
+            self.apply(vacancy_id, delta)
+
+    def record_llm_usage(self, vacancy_id: int, tokens: int, cost):
+        delta = FunnelDelta()
+        delta.llm_tokens = int(tokens or 0)
+        delta.llm_cost = Decimal(str(cost or 0))
+        self.apply(vacancy_id, delta)
+
+    @staticmethod
+    def _chat_duration(app: Application) -> float:
+        started = ChatSession.objects.filter(application_id=app.pk).values_list('created_at', flat=True).first()
+        if not started or not app.chat_completed_at:
+            return 0.0
+        return max((app.chat_completed_at - started).total_seconds(), 0.0)
+
+    def rebuild(self, vacancy_ids: Iterable[int] = None) -> int:
+        """
+        Полностью пересчитывает воронки из таблицы откликов.
+        Без vacancy_ids пересчитывает все вакансии. Возвращает число вакансий.
+        Агрегаты и накопленный расход LLM читаются под блокировкой строк
+        VacancyFunnel в той же транзакции, что и запись, поэтому параллельные
+        apply() (в том числе record_llm_usage) не теряются.
+        """
+        vacancies = Vacancy.objects.all()
+        if vacancy_ids is not None:
+            vacancies = vacancies.filter(pk__in=list(vacancy_ids))
+        vacancy_map = dict(vacancies.values_list('pk', 'employer_id'))
+        if not vacancy_map:
+            return 0
+
+        with transaction.atomic():
+            VacancyFunnel.objects.bulk_create(
+                [VacancyFunnel(vacancy_id=vacancy_id) for vacancy_id in vacancy_map],
+                batch_size=500, ignore_conflicts=True,
+            )
+            # Порядок блокировок как в apply(): воронки вакансий, затем работодателей
+            existing = {
+                f.vacancy_id: f for f in
+                VacancyFunnel.objects.select_for_update()
+                .filter(vacancy_id__in=list(vacancy_map)).order_by('vacancy_id')
+            }
+            deltas = self._aggregate(list(vacancy_map))
+
+            for vacancy_id, delta in deltas.items():
+                previous = existing[vacancy_id]
+                funnel = VacancyFunnel(pk=previous.pk, vacancy_id=vacancy_id)
+                # Токены и стоимость LLM не восстанавливаются из откликов — переносим накопленные
+                funnel.llm_tokens_total = previous.llm_tokens_total
+                funnel.llm_cost_total = previous.llm_cost_total
+                delta.apply_to(funnel)
+                funnel.save()
+
+            self._rebuild_employers(set(vacancy_map.values()))
+
+        logger.info("Rebuilt funnels for %d vacancies", len(vacancy_map))
+        return len(vacancy_map)
+
+    @staticmethod
+    def _aggregate(vacancy_ids) -> Dict[int, FunnelDelta]:
+        """Воронки вакансий, посчитанные по таблице откликов"""
+        apps = Application.objects.filter(vacancy_id__in=vacancy_ids)
+        deltas = {vacancy_id: FunnelDelta() for vacancy_id in vacancy_ids}
+
+        for row in apps.values('vacancy_id', 'status').annotate(n=Count('id')):
+            delta = deltas[row['vacancy_id']]
+            delta.total += row['n']
+            delta.statuses[row['status']] += row['n']
+
+        for vacancy_id, score in apps.filter(final_score__isnull=False).values_list('vacancy_id', 'final_score').iterator():
+            deltas[vacancy_id].add_score(score)
+
+        durations = (
+            apps.filter(chat_completed_at__isnull=False, chat_session__isnull=False)
+            .annotate(duration=ExpressionWrapper(
+                F('chat_completed_at') - F('chat_session__created_at'),
+                output_field=DurationField()
+            ))
+            .values('vacancy_id')
+            .annotate(n=Count('id'), total=Sum('duration'))
+        )
+        for row in durations:
+            delta = deltas[row['vacancy_id']]
+            delta.chat_completed = row['n']
+            delta.chat_duration = max(row['total'].total_seconds(), 0.0) if row['total'] else 0.0
+        return deltas
+
+    @staticmethod
+    def _rebuild_employers(employer_ids):
+        """Пересобирает воронки работодателей суммированием воронок вакансий"""
+        for employer_id in employer_ids:
+            funnel, _ = EmployerFunnel.objects.select_for_update().get_or_create(employer_id=employer_id)
+            totals = FunnelDelta()
+            funnel.total_applications = 0
+            funnel.status_counts = {}
+            funnel.score_histogram = []
+            funnel.scored_count = 0
+            funnel.score_sum = 0
+            funnel.chat_completed_count = 0
+            funnel.chat_duration_total = 0
+            funnel.llm_tokens_total = 0
+            funnel.llm_cost_total = 0
+
+            for vacancy_funnel in VacancyFunnel.objects.filter(vacancy__employer_id=employer_id):
+                totals.total += vacancy_funnel.total_applications
+                totals.statuses.update(vacancy_funnel.status_counts or {})
+                for bucket, count in enumerate(vacancy_funnel.score_histogram or []):
+                    totals.buckets[bucket] += count
+                totals.scored += vacancy_funnel.scored_count
+                totals.score_sum += vacancy_funnel.score_sum
+                totals.chat_completed += vacancy_funnel.chat_completed_count
+                totals.chat_duration += vacancy_funnel.chat_duration_total
+                totals.llm_tokens += vacancy_funnel.llm_tokens_total
+                totals.llm_cost += Decimal(vacancy_funnel.llm_cost_total or 0)
+
+            totals.apply_to(funnel)
+            funnel.save()
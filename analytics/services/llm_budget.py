@@ -0,0 +1,156 @@
+# analytics/services/llm_budget.py
+import logging
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from analytics.models import EmployerLLMBudget, LLMUsageDaily
+from analytics.services.llm_client import get_llm_client
+
+logger = logging.getLogger(__name__)
+
+BUDGET_OK = 'ok'
+BUDGET_DOWNGRADE = 'downgrade'
+BUDGET_DEFER = 'defer'
+
+# Стоимость в счетчиках кэша — в миллионных долях доллара (cache.incr работает с целыми)
+COST_UNITS = 1_000_000
+DAY_TTL = 2 * 24 * 3600
+MONTH_TTL = 32 * 24 * 3600
+
+
+class BudgetExceededError(Exception):
+    """Бюджет LLM работодателя исчерпан, анализ откладывается"""
+
+
+class LLMBudgetService:
+    """
+    Бюджеты LLM работодателей: лимит токенов в день и расходов в месяц.
+
+    Расход текущего дня и месяца считается в кэше при каждом вызове
+    (charge); при пустом кэше счетчик восстанавливается из дневных сводок.
+    Работодатель сверх бюджета переводится на дешевую модель или его
+    анализ откладывается; на дешевой модели бюджет можно превысить не
+    более чем в LLM_BUDGET_HARD_LIMIT_RATIO раз, дальше — только откладывание.
+    Остальные работодатели при этом работают как обычно.
+    """
+
+    def __init__(self):
+        self.default_daily_tokens = getattr(settings, 'LLM_BUDGET_DAILY_TOKENS', 0)
+        self.default_monthly_cost = Decimal(str(getattr(settings, 'LLM_BUDGET_MONTHLY_COST', 0)))
+        self.default_action = getattr(settings, 'LLM_BUDGET_ACTION', BUDGET_DOWNGRADE)
+        self.fallback_model = getattr(settings, 'LLM_BUDGET_FALLBACK_MODEL', '')
+        self.hard_limit_ratio = Decimal(str(getattr(settings, 'LLM_BUDGET_HARD_LIMIT_RATIO', 1.5)))
+
+    # ------------------------------------------------------------------
+    # Расход
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _tokens_key(employer_id: int, day) -> str:
+        return f"llm_budget:tokens:{employer_id}:{day:%Y%m%d}"
+
+    @staticmethod
+    def _cost_key(employer_id: int, day) -> str:
+        return f"llm_budget:cost:{employer_id}:{day:%Y%m}"
+
+    def charge(self, employer_id: int, tokens: int, cost: Decimal):
+        """Учитывает вызов LLM в счетчиках текущего дня и месяца"""
+        today = timezone.localdate()
+        self._incr(self._tokens_key(employer_id, today), int(tokens),
+                   lambda: self._rollup_spent(employer_id, today, today)[0], DAY_TTL)
+        self._incr(self._cost_key(employer_id, today), int(Decimal(cost) * COST_UNITS),
+                   lambda: int(self._rollup_spent(employer_id, today.replace(day=1), today)[1] * COST_UNITS),
+                   MONTH_TTL)
+
+    @staticmethod
+    def _incr(key: str, amount: int, initial, ttl: int):
+        if not amount:
+            return
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # Счетчика нет (новый период или кэш очищен) — начинаем с учтенного в сводках
+            if not cache.add(key, initial() + amount, ttl):
+                cache.incr(key, amount)
+
+    def spent(self, employer_id: int) -> Tuple[int, Decimal]:
+        """(токенов за сегодня, $ за текущий месяц)"""
+        today = timezone.localdate()
+        tokens = cache.get(self._tokens_key(employer_id, today))
+        if tokens is None:
+            tokens = self._rollup_spent(employer_id, today, today)[0]
+            cache.add(self._tokens_key(employer_id, today), tokens, DAY_TTL)
+        cost_units = cache.get(self._cost_key(employer_id, today))
+        if cost_units is None:
+            cost_units = int(self._rollup_spent(employer_id, today.replace(day=1), today)[1] * COST_UNITS)
+            cache.add(self._cost_key(employer_id, today), cost_units, MONTH_TTL)
+        return tokens, Decimal(cost_units) / COST_UNITS
+
+    @staticmethod
+    def _rollup_spent(employer_id: int, start, end) -> Tuple[int, Decimal]:
+        totals = LLMUsageDaily.objects.filter(
+            employer_id=employer_id, day__gte=start, day__lte=end
+        ).aggregate(tokens=Sum(F('prompt_tokens') + F('completion_tokens')), cost=Sum('cost'))
+        return int(totals['tokens'] or 0), Decimal(totals['cost'] or 0)
+
+    # ------------------------------------------------------------------
+    # Решение
+    # ------------------------------------------------------------------
+
+    def limits(self, employer_id: int) -> Tuple[int, Decimal, str]:
+        """(лимит токенов в день, лимит $ в месяц, действие при превышении); 0 — без лимита"""
+        budget = (
+            EmployerLLMBudget.objects.filter(employer_id=employer_id)
+            .values_list('daily_tokens', 'monthly_cost', 'over_budget_action').first()
+        )
+        if budget is None:
+            return self.default_daily_tokens, self.default_monthly_cost, self.default_action
+        daily_tokens, monthly_cost, action = budget
+        return (
+            self.default_daily_tokens if daily_tokens is None else daily_tokens,
+            self.default_monthly_cost if monthly_cost is None else monthly_cost,
+            action,
+        )
+
+    def decision(self, employer_id: Optional[int]) -> str:
+        """Как выполнять LLM-вызовы работодателя: ok | downgrade | defer"""
+        if not employer_id:
+            return BUDGET_OK
+        daily_tokens, monthly_cost, action = self.limits(employer_id)
+        if not daily_tokens and not monthly_cost:
+            return BUDGET_OK
+
+        tokens, cost = self.spent(employer_id)
+        usage = max(
+            Decimal(tokens) / daily_tokens if daily_tokens else Decimal(0),
+            cost / monthly_cost if monthly_cost else Decimal(0),
+        )
+        if usage < 1:
+            return BUDGET_OK
+        if action == BUDGET_DOWNGRADE and self.fallback_model and usage < self.hard_limit_ratio:
+            return BUDGET_DOWNGRADE
+        logger.info("LLM budget of employer %s exhausted (%.0f%%), deferring", employer_id, usage * 100)
+        return BUDGET_DEFER
+
+    def client(self, decision: str):
+        """LLM-клиент для решения: дешевая модель при downgrade"""
+        if decision == BUDGET_DOWNGRADE:
+            return get_llm_client(self.fallback_model)
+        return get_llm_client()
+
+    def status(self, employer_id: int) -> dict:
+        daily_tokens, monthly_cost, action = self.limits(employer_id)
+        tokens, cost = self.spent(employer_id)
+        return {
+            'daily_tokens_limit': daily_tokens or None,
+            'monthly_cost_limit': str(monthly_cost) if monthly_cost else None,
+            'over_budget_action': action,
+            'tokens_today': tokens,
+            'cost_this_month': str(cost.quantize(Decimal('0.01'))),
+            'decision': self.decision(employer_id),
+        }
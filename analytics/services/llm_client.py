@@ -1,32 +1,39 @@
 # analytics/services/llm_client.py
 import os
+import hashlib
 import json
 import logging
 import re
-import google.generativeai as genai
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Optional, Tuple
+
+from analytics.services.circuit_breaker import CircuitOpenError, llm_circuit_breaker
+from analytics.services.llm_usage import record_llm_call
 
 logger = logging.getLogger(__name__)
 
+# SDK Gemini тянет gRPC/protobuf и импортируется только при первом
+# создании клиента, чтобы не замедлять старт веб-процессов
+_genai = None
 
-class GeminiClient:
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
 
-    def evaluate_fit(self, vacancy_text: str, resume_text: str) -> dict:
-        """
-        Compare a job vacancy with a candidate resume using Gemini.
-        Returns a dict with {"score": int, "summary": str}.
-        """
-        prompt = f"""
-You are an expert HR analyst. Your task is to evaluate how well a candidate fits a job vacancy. 
+def load_genai():
+    global _genai
+    if _genai is None:
+        import google.generativeai
+        _genai = google.generativeai
+    return _genai
+
+# Общая инструкция для всех вызовов по вакансии. Входит в стабильный префикс
+# промпта и кэшируется на стороне Gemini вместе с блоком вакансии.
+SYSTEM_INSTRUCTIONS = """
+You are an expert HR analyst. Your task is to evaluate how well a candidate fits a job vacancy.
 
 Follow these rules strictly:
 
-1. **Experience**: 
+1. **Experience**:
    - If candidate's total years of experience >= required experience, add positive points.
    - If less than required, subtract points proportionally.
 
@@ -63,59 +70,326 @@ Follow these rules strictly:
 - Consider exceeding requirements (more experience, extra skills) as a positive factor.
 - Penalize only if key requirements are missing (e.g., essential skill or experience).
 
-**Output format**:
-Return ONLY a JSON object in the following structure:
-{{
-"score": <integer 0-100>,
-"summary": "<concise reasoning paragraph>"
-}}
+The vacancy is given below. Every following request is about a candidate for this vacancy.
+""".strip()
+
+
+# JSON-схема ответа объединенного анализа (score + summary + discrepancies + questions)
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer"},
+        "summary": {"type": "string"},
+        "discrepancies": {"type": "array", "items": {"type": "string"}},
+        "questions": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["score", "summary", "discrepancies", "questions"],
+}
+MAX_QUESTIONS = 3
+
+# JSON-схема ответа полной переоценки с учетом ответов из чата
+EVALUATION_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer"},
+        "summary": {"type": "string"},
+    },
+    "required": ["score", "summary"],
+}
+
+# JSON-схема ответа инкрементальной переоценки после чата
+DELTA_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer"},
+        "summary": {"type": "string"},
+        "delta": {"type": "string"},
+    },
+    "required": ["score", "summary", "delta"],
+}
+
+
+class LLMError(Exception):
+    """Ошибка вызова LLM"""
+
+
+class LLMResponseError(LLMError):
+    """Ответ LLM не соответствует ожидаемой схеме"""
+
+
+def validate_analysis(data, schema: dict = ANALYSIS_RESPONSE_SCHEMA) -> list:
+    """
+    Строгая проверка ответа объединенного анализа (или другого ответа
+    с баллом и выжимкой по schema).
+    Возвращает список ошибок (пустой — ответ корректен).
+    """
+    if not isinstance(data, dict):
+        return ["response must be a JSON object"]
+
+    errors = []
+    for field in schema["required"]:
+        if field not in data:
+            errors.append(f"missing field '{field}'")
+
+    score = data.get("score")
+    if "score" in data and (isinstance(score, bool) or not isinstance(score, (int, float))):
+        errors.append("'score' must be an integer")
+    elif isinstance(score, (int, float)) and not 0 <= score <= 100:
+        errors.append("'score' must be between 0 and 100")
+
+    if "summary" in data and (not isinstance(data["summary"], str) or not data["summary"].strip()):
+        errors.append("'summary' must be a non-empty string")
+
+    for field in ("discrepancies", "questions"):
+        if field not in schema["properties"]:
+            continue
+        value = data.get(field)
+        if field in data and (not isinstance(value, list) or not all(isinstance(v, str) for v in value)):
+            errors.append(f"'{field}' must be an array of strings")
+
+    return errors
+
+
+@dataclass
+class PromptPrefix:
+    """
+    Стабильная часть промпта: инструкции + блок вакансии.
+    key — хэш содержимого, cache_name — имя explicit-кэша Gemini (если создан).
+    """
+    key: str
+    vacancy_block: str
+    instructions: str = SYSTEM_INSTRUCTIONS
+    cache_name: str = ""
+
+    @property
+    def text(self) -> str:
+        return f"{self.instructions}\n\nVacancy:\n{self.vacancy_block}\n"
+
+    @classmethod
+    def from_vacancy_text(cls, vacancy_text: str) -> "PromptPrefix":
+        key = hashlib.sha256(f"{SYSTEM_INSTRUCTIONS}\n{vacancy_text}".encode("utf-8")).hexdigest()
+        return cls(key=key, vacancy_block=vacancy_text or "")
+
+
+def is_cache_unavailable(exc: Exception) -> bool:
+    """
+    Ошибка означает, что explicit-кэш истек или удален (NotFound либо
+    сообщение об истекшем кэше), а не сбой самого Gemini.
+    """
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        google_exceptions = None
+    if google_exceptions is not None and isinstance(exc, google_exceptions.NotFound):
+        return True
+    message = str(exc).lower()
+    return "cache" in message and ("expired" in message or "not found" in message)
 
-Vacancy:
-{vacancy_text}
+
+class GeminiClient:
+    def __init__(self, model_name: str = None, breaker=None):
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment")
+        genai = load_genai()
+        genai.configure(api_key=api_key)
+        self.model_name = model_name or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        self.model = genai.GenerativeModel(self.model_name)
+        # Модели, привязанные к explicit-кэшу Gemini: {cache_name: GenerativeModel}
+        self._cached_models = {}
+        # Общий для всех воркеров предохранитель: при недоступном Gemini
+        # вызовы сразу отклоняются с CircuitOpenError
+        self.breaker = breaker or llm_circuit_breaker()
+
+    # ------------------------------------------------------------------
+    # Контекстный кэш Gemini
+    # ------------------------------------------------------------------
+
+    def create_context_cache(self, prefix: PromptPrefix, ttl_seconds: int) -> Tuple[str, datetime]:
+        """
+        Создает explicit-кэш Gemini для префикса (инструкции + вакансия).
+        Возвращает (имя кэша, время истечения). Бросает исключение, если
+        кэш создать нельзя (например, префикс короче минимального размера).
+        """
+        from google.generativeai import caching
+
+        cached = caching.CachedContent.create(
+            model=f"models/{self.model_name}",
+            display_name=f"vacancy-{prefix.key[:16]}",
+            system_instruction=prefix.instructions,
+            contents=[f"Vacancy:\n{prefix.vacancy_block}"],
+            ttl=timedelta(seconds=ttl_seconds),
+        )
+        expires_at = getattr(cached, "expire_time", None) or (
+            datetime.now(dt_timezone.utc) + timedelta(seconds=ttl_seconds)
+        )
+        self._cached_models[cached.name] = load_genai().GenerativeModel.from_cached_content(cached_content=cached)
+        logger.info("Gemini context cache %s created for prefix %s", cached.name, prefix.key[:12])
+        return cached.name, expires_at
+
+    def _cached_model(self, cache_name: str):
+        model = self._cached_models.get(cache_name)
+        if model is None:
+            from google.generativeai import caching
+            cached = caching.CachedContent.get(cache_name)
+            model = load_genai().GenerativeModel.from_cached_content(cached_content=cached)
+            self._cached_models[cache_name] = model
+        return model
+
+    def _generate(self, suffix: str, prefix: Optional[PromptPrefix] = None, **kwargs):
+        """
+        Отправляет запрос: через explicit-кэш префикса, если он есть,
+        иначе полным текстом (префикс + суффикс).
+        Вызов идет через предохранитель; при разомкнутом — CircuitOpenError.
+        Токены и задержка каждого вызова записываются в журнал расхода LLM.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("LLM circuit is open")
+
+        if prefix is not None and prefix.cache_name:
+            started = time.monotonic()
+            try:
+                model = self._cached_model(prefix.cache_name)
+                response = model.generate_content(suffix, **kwargs)
+                self.breaker.record_success()
+                record_llm_call(self.model_name, response, started)
+                return response
+            except Exception as e:
+                if not is_cache_unavailable(e):
+                    self.breaker.record_failure()
+                    record_llm_call(self.model_name, None, started)
+                    raise
+                # Кэш истек или удален — откатываемся на полный промпт
+                logger.warning("Gemini context cache %s unavailable: %s", prefix.cache_name, e)
+                self._cached_models.pop(prefix.cache_name, None)
+                prefix.cache_name = ""
+
+        prompt = f"{prefix.text}\n{suffix}" if prefix is not None else suffix
+        started = time.monotonic()
+        try:
+            response = self.model.generate_content(prompt, **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            record_llm_call(self.model_name, None, started)
+            raise
+        self.breaker.record_success()
+        record_llm_call(self.model_name, response, started)
+        return response
+
+    # ------------------------------------------------------------------
+    # Вызовы анализа
+    # ------------------------------------------------------------------
+
+    def analyze_application(self, resume_text: str, discrepancies: list = None,
+                            prefix: PromptPrefix = None, vacancy_text: str = "",
+                            max_questions: int = MAX_QUESTIONS) -> dict:
+        """
+        Объединенный анализ одним вызовом: балл, выжимка, расхождения и
+        уточняющие вопросы. Ответ ограничен JSON-схемой и строго проверяется;
+        при невалидном ответе делается одна попытка исправления.
+        max_questions=0 — вопросы не нужны (уже есть в банке вопросов).
+        Бросает LLMError, если корректный ответ получить не удалось.
+        """
+        prefix = prefix or PromptPrefix.from_vacancy_text(vacancy_text)
+        max_questions = max(0, min(max_questions, MAX_QUESTIONS))
+        if max_questions:
+            questions_spec = f"""0-{max_questions} clarifying questions for the candidate about these discrepancies
+  (location, experience gaps, missing skills, employment type, salary, relocation, start date).
+  IMPORTANT: questions must be in Russian since the candidate is Russian-speaking."""
+        else:
+            questions_spec = "always an empty list (clarifying questions are prepared separately)."
+        suffix = f"""
+Evaluate the following candidate against the vacancy and prepare a short chat with them.
+
+Return a JSON object with:
+- "score": integer 0-100, overall fit;
+- "summary": concise reasoning paragraph;
+- "discrepancies": list of concrete mismatches between the vacancy and the resume (may be empty);
+- "questions": {questions_spec}
 
 Candidate Resume:
 {resume_text}
+
+Discrepancies found by rule-based checks: {discrepancies or []}
 """
+        data = self._generate_structured(suffix, prefix, ANALYSIS_RESPONSE_SCHEMA, "analysis")
+        return {
+            "score": int(round(data["score"])),
+            "summary": data["summary"].strip(),
+            "discrepancies": [d.strip() for d in data["discrepancies"] if d.strip()],
+            "questions": [q.strip() for q in data["questions"] if q.strip()][:max_questions],
+        }
+
+    def _generate_structured(self, suffix: str, prefix: Optional[PromptPrefix], schema: dict, what: str) -> dict:
+        """
+        Вызов с ответом, ограниченным JSON-схемой. Ответ строго проверяется;
+        при невалидном ответе делается одна попытка исправления.
+        Бросает LLMError (LLMResponseError — ответ не соответствует схеме).
+        """
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": schema,
+        }
+
         try:
-            response = self.model.generate_content(prompt)
-            text = getattr(response, "text", "").strip()
-            logger.info(f"Gemini raw response: {text[:400]}...")
+            response = self._generate(suffix, prefix, generation_config=generation_config)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            raise LLMError(f"Gemini {what} call failed: {e}") from e
+
+        text = getattr(response, "text", "").strip()
+        data, errors = self._parse_structured(text, schema)
+
+        if errors:
+            # Одна целевая попытка исправить ответ
+            logger.warning("Gemini %s response invalid (%s), requesting repair", what, "; ".join(errors))
+            repair_suffix = f"""
+Your previous answer does not match the required JSON schema.
 
-            if not text:
-                raise ValueError("No response text from Gemini model")
+Errors:
+{chr(10).join('- ' + error for error in errors)}
 
-            # Попытка прямого JSON
+Previous answer:
+{text[:4000]}
+
+Return ONLY the corrected JSON object with fields {', '.join(schema["required"])}.
+"""
             try:
-                data = json.loads(text)
-            except json.JSONDecodeError:
-                # Пробуем вытащить JSON через regex
-                match = re.search(r"\{.*\}", text, flags=re.DOTALL)
-                if match:
-                    try:
-                        data = json.loads(match.group())
-                    except json.JSONDecodeError:
-                        data = {"score": 0, "summary": text[:400]}
-                else:
-                    data = {"score": 0, "summary": text[:400]}
-
-            score = int(data.get("score", 0))
-            summary = data.get("summary", text[:400])
-            return {"score": score, "summary": summary}
+                response = self._generate(repair_suffix, prefix, generation_config=generation_config)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                raise LLMError(f"Gemini {what} repair call failed: {e}") from e
+            text = getattr(response, "text", "").strip()
+            data, errors = self._parse_structured(text, schema)
+            if errors:
+                raise LLMResponseError(f"Invalid {what} response after repair: " + "; ".join(errors))
 
-        except Exception as e:
-            logger.exception(f"Gemini evaluation failed: {e}")
-            return {"score": 0, "summary": "LLM failed or not available"}
+        return data
+
+    @staticmethod
+    def _parse_structured(text: str, schema: dict):
+        if not text:
+            return None, ["empty response"]
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            return None, [f"invalid JSON: {e.msg}"]
+        return data, validate_analysis(data, schema)
 
-    def generate_questions(self, vacancy_text: str, resume_text: str, discrepancies: list = None) -> list:
+    def generate_questions(self, vacancy_text: str = "", resume_text: str = "",
+                           discrepancies: list = None, prefix: PromptPrefix = None) -> list:
         """
         Генерирует уточняющие вопросы на основе расхождений между вакансией и резюме.
         """
-        prompt = f"""
-Based on the job vacancy and candidate resume below, identify key discrepancies and generate 1-3 clarifying questions for the candidate.
+        prefix = prefix or PromptPrefix.from_vacancy_text(vacancy_text)
+        suffix = f"""
+Based on the job vacancy above and candidate resume below, identify key discrepancies and generate 1-3 clarifying questions for the candidate.
 
 Focus on:
 - Location mismatch
-- Experience gaps  
+- Experience gaps
 - Missing skills/qualifications
 - Employment type preferences
 - Salary expectations
@@ -128,16 +402,13 @@ IMPORTANT: Generate questions in Russian language since the candidate is Russian
 Return ONLY a JSON array of questions in Russian:
 ["Вопрос 1?", "Вопрос 2?", "Вопрос 3?"]
 
-Vacancy:
-{vacancy_text}
-
 Candidate Resume:
 {resume_text}
 
 Discrepancies to consider: {discrepancies or []}
 """
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(suffix, prefix)
             text = getattr(response, "text", "").strip()
             logger.info(f"Gemini questions raw response: {text[:200]}...")
 
@@ -166,14 +437,18 @@ Discrepancies to consider: {discrepancies or []}
             logger.exception(f"Gemini questions generation failed: {e}")
             return []
 
-    def evaluate_with_chat_context(self, vacancy_text: str, resume_text: str, chat_responses: list) -> dict:
+    def evaluate_with_chat_context(self, vacancy_text: str = "", resume_text: str = "",
+                                   chat_responses: list = None, prefix: PromptPrefix = None) -> dict:
         """
         Оценка соответствия с учетом ответов кандидата из чата.
+        Ответ ограничен JSON-схемой и проверяется как у analyze_application.
+        Бросает LLMError, если корректный ответ получить не удалось.
         """
-        chat_context = "\n".join([f"Q&A: {resp}" for resp in chat_responses])
+        prefix = prefix or PromptPrefix.from_vacancy_text(vacancy_text)
+        chat_context = "\n".join([f"Q&A: {resp}" for resp in chat_responses or []])
 
-        prompt = f"""
-You are an expert HR analyst. Evaluate candidate fit considering their additional responses from chat.
+        suffix = f"""
+Evaluate candidate fit considering their additional responses from chat.
 
 Candidate Resume:
 {resume_text}
@@ -181,21 +456,20 @@ Candidate Resume:
 Chat Responses:
 {chat_context}
 
-Vacancy:
-{vacancy_text}
-
 Consider the candidate's clarifications from chat when scoring.
 If they addressed discrepancies positively (e.g., willing to relocate, learn skills), adjust score accordingly.
 
-Return JSON: {{"score": 0-100, "summary": "analysis with chat context"}}
+Return a JSON object with:
+- "score": integer 0-100, overall fit with chat context;
+- "summary": concise reasoning paragraph that takes the chat into account.
 
-**Important**: Be encouraging and constructive. If information is missing from the resume, 
+**Important**: Be encouraging and constructive. If information is missing from the resume,
 don't penalize too harshly - assume the candidate might have the experience but didn't include it.
 Focus on potential rather than just current match.
 
 **Scoring Guidelines**:
 - 80-100: Excellent match or high potential
-- 60-79: Good match with some areas for discussion  
+- 60-79: Good match with some areas for discussion
 - 40-59: Partial match, needs clarification
 - 20-39: Weak match but potential exists
 - 0-19: Poor match
@@ -203,26 +477,84 @@ Focus on potential rather than just current match.
 Always look for potential and transferable skills.
 
 """
-        try:
-            response = self.model.generate_content(prompt)
-            text = getattr(response, "text", "").strip()
+        # Недоступность LLM или негодный ответ не должны превращаться в балл 0 —
+        # ошибка уходит в деградированный режим и очередь повторного анализа
+        data = self._generate_structured(suffix, prefix, EVALUATION_RESPONSE_SCHEMA, "chat context evaluation")
+        return {"score": int(round(data["score"])), "summary": data["summary"].strip()}
 
-            try:
-                data = json.loads(text)
-            except json.JSONDecodeError:
-                match = re.search(r"\{.*\}", text, flags=re.DOTALL)
-                if match:
-                    try:
-                        data = json.loads(match.group())
-                    except json.JSONDecodeError:
-                        data = {"score": 0, "summary": text[:400]}
-                else:
-                    data = {"score": 0, "summary": text[:400]}
-
-            score = int(data.get("score", 0))
-            summary = data.get("summary", text[:400])
-            return {"score": score, "summary": summary}
+    def evaluate_delta(self, previous_score: float, previous_summary: str, new_responses: list) -> dict:
+        """
+        Инкрементальная переоценка после чата: вместо резюме и вакансии
+        отправляются только прошлые балл и выжимка и новые ответы кандидата,
+        поэтому размер промпта не зависит от длины резюме.
+        Возвращает {"score": int, "summary": str, "delta": str}.
+        """
+        answers = "\n".join(f"Q&A: {resp}" for resp in new_responses or [])
+        prompt = f"""
+You are an expert HR analyst. A candidate was already evaluated against a vacancy.
 
+Previous evaluation:
+- score: {previous_score:.0f}/100
+- summary: {previous_summary}
+
+Since then the candidate answered clarifying questions:
+{answers}
+
+Adjust the score based ONLY on what these answers change (resolved or confirmed concerns,
+new positives or negatives). Do not re-evaluate from scratch.
+
+Return a JSON object with:
+- "score": integer 0-100, the adjusted score;
+- "summary": the updated concise reasoning paragraph;
+- "delta": one or two sentences explaining what changed and why.
+"""
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": DELTA_RESPONSE_SCHEMA,
+        }
+        try:
+            response = self._generate(prompt, generation_config=generation_config)
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            logger.exception(f"Gemini evaluation with chat context failed: {e}")
-            return {"score": 0, "summary": "LLM failed or not available"}
\ No newline at end of file
+            raise LLMError(f"Gemini delta evaluation failed: {e}") from e
+
+        text = getattr(response, "text", "").strip()
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise LLMResponseError(f"Invalid delta response: {e.msg}") from e
+
+        score = data.get("score") if isinstance(data, dict) else None
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 100:
+            raise LLMResponseError("Invalid delta response: 'score' must be an integer 0-100")
+        summary = data.get("summary")
+        if not isinstance(summary, str) or not summary.strip():
+            raise LLMResponseError("Invalid delta response: 'summary' must be a non-empty string")
+
+        return {
+            "score": int(round(score)),
+            "summary": summary.strip(),
+            "delta": str(data.get("delta") or "").strip(),
+        }
+
+
+_clients = {}
+
+
+def get_llm_client(model_name: str = None):
+    """
+    Фабрика LLM-клиента. Класс берется из settings.LLM_CLIENT_CLASS,
+    экземпляр создается при первом обращении и переиспользуется в процессе
+    (конфигурация SDK и модели с explicit-кэшем создаются один раз).
+    """
+    from django.conf import settings
+    from django.utils.module_loading import import_string
+
+    client_path = getattr(settings, "LLM_CLIENT_CLASS", "analytics.services.llm_client.GeminiClient")
+    key = (client_path, model_name)
+    client = _clients.get(key)
+    if client is None:
+        client = import_string(client_path)(model_name=model_name)
+        _clients[key] = client
+    return client
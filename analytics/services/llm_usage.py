@@ -0,0 +1,300 @@
+# analytics/services/llm_usage.py
+"""
+Учет расхода LLM.
+
+Каждый вызов GeminiClient записывается (record_llm_call) в буфер: токены
+запроса и ответа, задержка, модель и назначение. Отклик, вакансия и
+работодатель берутся из области llm_usage_scope, открытой вызывающим
+кодом. Из буфера записи пачками переносятся в журнал LLMUsageRecord,
+одновременно пополняются дневные сводки LLMUsageDaily и LLM-расход
+воронок (LLMUsageLedger.flush, периодически и при заполнении буфера).
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from analytics.models import LLMUsageDaily, LLMUsageRecord
+from analytics.services.funnel_service import FunnelService
+
+logger = logging.getLogger(__name__)
+
+PURPOSE_EVALUATE = 'evaluate'
+PURPOSE_QUESTIONS = 'questions'
+PURPOSE_CHAT = 'chat'
+PURPOSE_OTHER = 'other'
+
+BACKEND_REDIS = "redis"
+BACKEND_MEMORY = "memory"
+
+FLUSH_TASK = "analytics.tasks.flush_llm_usage_task"
+
+# Поля дневной сводки, накапливаемые при сбросе журнала
+ROLLUP_FIELDS = ('calls', 'failures', 'prompt_tokens', 'completion_tokens',
+                 'cached_tokens', 'latency_ms_total', 'cost')
+
+
+@dataclass(frozen=True)
+class UsageScope:
+    """К чему относятся вызовы LLM внутри области"""
+    purpose: str = PURPOSE_OTHER
+    application_id: Optional[int] = None
+    vacancy_id: Optional[int] = None
+    employer_id: Optional[int] = None
+
+
+_scope = contextvars.ContextVar("llm_usage_scope", default=UsageScope())
+
+
+@contextmanager
+def llm_usage_scope(purpose: str, application=None, vacancy=None):
+    """Относит вызовы LLM внутри блока к назначению и отклику/вакансии"""
+    if vacancy is None and application is not None:
+        vacancy = application.vacancy
+    token = _scope.set(UsageScope(
+        purpose=purpose,
+        application_id=application.pk if application is not None else None,
+        vacancy_id=vacancy.pk if vacancy is not None else None,
+        employer_id=vacancy.employer_id if vacancy is not None else None,
+    ))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def usage_tokens(response) -> Tuple[int, int, int]:
+    """(токены запроса, токены ответа с рассуждениями, токены из кэша) из usage_metadata Gemini"""
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return 0, 0, 0
+
+    def count(name):
+        return int(getattr(meta, name, 0) or 0)
+
+    return (
+        count("prompt_token_count"),
+        count("candidates_token_count") + count("thoughts_token_count"),
+        count("cached_content_token_count"),
+    )
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Decimal:
+    """Стоимость вызова по settings.LLM_PRICING ($ за 1M токенов: вход, выход, вход из кэша)"""
+    pricing = getattr(settings, "LLM_PRICING", {})
+    prices = pricing.get(model) or pricing.get("default")
+    if not prices:
+        return Decimal("0")
+    input_price, output_price = Decimal(str(prices[0])), Decimal(str(prices[1]))
+    cached_price = Decimal(str(prices[2])) if len(prices) > 2 else input_price
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    cost = (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1_000_000
+    return cost.quantize(Decimal("0.000001"))
+
+
+# ---------------------------------------------------------------------
+# Буфер записей
+# ---------------------------------------------------------------------
+
+class RedisUsageBuffer:
+    """Общий для всех процессов буфер на списке Redis"""
+    KEY = "llm_usage:buffer"
+
+    def __init__(self, url: str = None):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+
+    def push(self, entry: Dict) -> int:
+        return self.client.rpush(self.KEY, json.dumps(entry))
+
+    def pop(self, count: int) -> List[Dict]:
+        pipe = self.client.pipeline()
+        pipe.lrange(self.KEY, 0, count - 1)
+        pipe.ltrim(self.KEY, count, -1)
+        entries, _ = pipe.execute()
+        return [json.loads(entry) for entry in entries]
+
+    def requeue(self, entries: List[Dict]):
+        if entries:
+            self.client.lpush(self.KEY, *[json.dumps(entry) for entry in reversed(entries)])
+
+
+class InMemoryUsageBuffer:
+    """Буфер в памяти процесса (тесты и локальный запуск в одном процессе)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = deque()
+
+    def push(self, entry: Dict) -> int:
+        with self._lock:
+            self._entries.append(dict(entry))
+            return len(self._entries)
+
+    def pop(self, count: int) -> List[Dict]:
+        with self._lock:
+            return [self._entries.popleft() for _ in range(min(count, len(self._entries)))]
+
+    def requeue(self, entries: List[Dict]):
+        with self._lock:
+            self._entries.extendleft(reversed(entries))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_usage_buffer():
+    """Буфер записей процесса (settings.LLM_USAGE_BUFFER_BACKEND: redis | memory)"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                backend = getattr(settings, "LLM_USAGE_BUFFER_BACKEND", BACKEND_REDIS)
+                _buffer = InMemoryUsageBuffer() if backend == BACKEND_MEMORY else RedisUsageBuffer()
+    return _buffer
+
+
+def _flush_size() -> int:
+    return getattr(settings, "LLM_USAGE_FLUSH_SIZE", 200)
+
+
+def record_llm_call(model: str, response, started: float):
+    """
+    Записывает вызов LLM (response=None — вызов упал). started — time.monotonic()
+    перед вызовом. Учет не должен ломать сам вызов, поэтому ошибки только логируются.
+    """
+    try:
+        scope = _scope.get()
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(response)
+        cost = call_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        size = get_usage_buffer().push({
+            "ts": time.time(),
+            "model": model,
+            "purpose": scope.purpose,
+            "application_id": scope.application_id,
+            "vacancy_id": scope.vacancy_id,
+            "employer_id": scope.employer_id,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_ms": int((time.monotonic() - started) * 1000),
+            "success": response is not None,
+            "cost": str(cost),
+        })
+        if size == _flush_size():
+            # Буфер набрал пачку — сбрасываем, не дожидаясь периодического запуска
+            from project.celery import dispatch
+
+            dispatch(FLUSH_TASK)
+
+        if scope.employer_id and (prompt_tokens or completion_tokens):
+            from analytics.services.llm_budget import LLMBudgetService
+
+            LLMBudgetService().charge(scope.employer_id, prompt_tokens + completion_tokens, cost)
+    except Exception as e:
+        logger.warning("Failed to record LLM usage: %s", e)
+
+
+# ---------------------------------------------------------------------
+# Журнал и сводки
+# ---------------------------------------------------------------------
+
+class LLMUsageLedger:
+    """
+    Перенос записей из буфера в журнал LLMUsageRecord (bulk insert)
+    с пополнением дневных сводок и LLM-расхода воронок вакансий.
+    """
+
+    def __init__(self, buffer=None, batch_size: int = None):
+        self.buffer = buffer or get_usage_buffer()
+        self.batch_size = batch_size or _flush_size()
+
+    def flush(self, max_batches: int = None) -> int:
+        """Сбрасывает буфер пачками по batch_size. Возвращает число перенесенных записей"""
+        flushed = batches = 0
+        while max_batches is None or batches < max_batches:
+            entries = self.buffer.pop(self.batch_size)
+            if not entries:
+                break
+            try:
+                self.store(entries)
+            except Exception:
+                # Записи возвращаются в буфер до следующего сброса
+                self.buffer.requeue(entries)
+                raise
+            flushed += len(entries)
+            batches += 1
+            if len(entries) < self.batch_size:
+                break
+
+        if flushed:
+            logger.info("Flushed %d LLM usage records", flushed)
+        return flushed
+
+    def store(self, entries: List[Dict]):
+        records = [
+            LLMUsageRecord(
+                created_at=datetime.fromtimestamp(entry["ts"], tz=dt_timezone.utc),
+                employer_id=entry.get("employer_id"),
+                vacancy_id=entry.get("vacancy_id"),
+                application_id=entry.get("application_id"),
+                purpose=entry.get("purpose") or PURPOSE_OTHER,
+                model=(entry.get("model") or "")[:64],
+                prompt_tokens=entry.get("prompt_tokens", 0),
+                completion_tokens=entry.get("completion_tokens", 0),
+                cached_tokens=entry.get("cached_tokens", 0),
+                latency_ms=entry.get("latency_ms", 0),
+                success=entry.get("success", True),
+                cost=Decimal(entry.get("cost") or "0"),
+            )
+            for entry in entries
+        ]
+
+        rollups = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+        vacancy_usage = defaultdict(lambda: [0, Decimal("0")])
+        for record in records:
+            key = (timezone.localdate(record.created_at), record.employer_id,
+                   record.vacancy_id, record.purpose, record.model)
+            totals = rollups[key]
+            totals['calls'] += 1
+            totals['failures'] += 0 if record.success else 1
+            totals['prompt_tokens'] += record.prompt_tokens
+            totals['completion_tokens'] += record.completion_tokens
+            totals['cached_tokens'] += record.cached_tokens
+            totals['latency_ms_total'] += record.latency_ms
+            totals['cost'] += record.cost
+            if record.vacancy_id:
+                vacancy_usage[record.vacancy_id][0] += record.prompt_tokens + record.completion_tokens
+                vacancy_usage[record.vacancy_id][1] += record.cost
+
+        with transaction.atomic():
+            LLMUsageRecord.objects.bulk_create(records, batch_size=500)
+            for (day, employer_id, vacancy_id, purpose, model), totals in rollups.items():
+                row, _ = LLMUsageDaily.objects.get_or_create(
+                    day=day, employer_id=employer_id, vacancy_id=vacancy_id, purpose=purpose, model=model
+                )
+                LLMUsageDaily.objects.filter(pk=row.pk).update(
+                    updated_at=timezone.now(),
+                    **{field: F(field) + value for field, value in totals.items()}
+                )
+            funnels = FunnelService()
+            for vacancy_id, (tokens, cost) in vacancy_usage.items():
+                funnels.record_llm_usage(vacancy_id, tokens, cost)
@@ -0,0 +1,114 @@
+# analytics/services/prompt_service.py
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from analytics.models import VacancyPromptCache
+from analytics.services.circuit_breaker import STATE_CLOSED
+from analytics.services.llm_client import PromptPrefix, SYSTEM_INSTRUCTIONS
+
+logger = logging.getLogger(__name__)
+
+# Версия шаблона: меняется вместе с SYSTEM_INSTRUCTIONS/render_vacancy_block
+PROMPT_VERSION = "v1"
+CONTEXT_CACHE_ENABLED = getattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", True)
+CONTEXT_CACHE_TTL = int(getattr(settings, "GEMINI_CONTEXT_CACHE_TTL", 3600))
+# Не пытаться заново создать кэш после неудачи (например, слишком короткий префикс)
+CONTEXT_CACHE_RETRY_AFTER = int(getattr(settings, "GEMINI_CONTEXT_CACHE_RETRY_AFTER", 3600))
+# Запас до истечения кэша, чтобы не отправить запрос в уже удаленный кэш
+CONTEXT_CACHE_MARGIN = 60
+
+
+def render_vacancy_block(vacancy) -> str:
+    """Подготавливает текст вакансии для LLM"""
+    salary = ""
+    if vacancy.salary_from or vacancy.salary_to:
+        salary = f"Зарплатная вилка: {vacancy.salary_from or '—'} - {vacancy.salary_to or '—'}"
+
+    requirements = vacancy.requirements or []
+    if isinstance(requirements, (list, tuple)):
+        requirements = ", ".join(str(r) for r in requirements)
+
+    return "\n".join(filter(None, [
+        vacancy.title,
+        vacancy.description,
+        f"Город: {vacancy.city}" if vacancy.city else "",
+        f"Требуемый опыт: {vacancy.experience_years} лет" if vacancy.experience_years is not None else "",
+        f"Тип занятости: {vacancy.employment_type}" if vacancy.employment_type else "",
+        salary,
+        f"Требования: {requirements}" if requirements else "",
+    ]))
+
+
+def prefix_hash(vacancy_block: str) -> str:
+    return hashlib.sha256(
+        f"{PROMPT_VERSION}\n{SYSTEM_INSTRUCTIONS}\n{vacancy_block}".encode("utf-8")
+    ).hexdigest()
+
+
+class PromptService:
+    """
+    Сервис стабильных префиксов промптов: блок вакансии рендерится и
+    версионируется хэшем, для префикса создается контекстный кэш Gemini.
+    Если кэш недоступен, префикс все равно переиспользуется как текст.
+    """
+
+    def __init__(self, llm=None):
+        self.llm = llm
+
+    def get_prefix(self, vacancy) -> PromptPrefix:
+        block = render_vacancy_block(vacancy)
+        content_hash = prefix_hash(block)
+
+        stored, created = VacancyPromptCache.objects.get_or_create(
+            vacancy=vacancy,
+            defaults={'content_hash': content_hash, 'vacancy_block': block}
+        )
+        if not created and stored.content_hash != content_hash:
+            # Вакансия изменилась — старый кэш Gemini больше не соответствует
+            stored.content_hash = content_hash
+            stored.vacancy_block = block
+            stored.gemini_cache_name = ""
+            stored.gemini_cache_expires_at = None
+            stored.save(update_fields=[
+                'content_hash', 'vacancy_block', 'gemini_cache_name',
+                'gemini_cache_expires_at', 'updated_at'
+            ])
+
+        prefix = PromptPrefix(key=content_hash, vacancy_block=stored.vacancy_block)
+        if CONTEXT_CACHE_ENABLED and self.llm is not None:
+            prefix.cache_name = self._ensure_context_cache(stored, prefix)
+        return prefix
+
+    def _ensure_context_cache(self, stored: VacancyPromptCache, prefix: PromptPrefix) -> str:
+        now = timezone.now()
+        if stored.gemini_cache_name and stored.gemini_cache_expires_at and \
+                stored.gemini_cache_expires_at > now + timedelta(seconds=CONTEXT_CACHE_MARGIN):
+            return stored.gemini_cache_name
+
+        failure_key = f"prompt_cache_failed:{prefix.key}"
+        if cache.get(failure_key):
+            return ""
+        # Пока предохранитель LLM разомкнут, кэш не создаем
+        breaker = getattr(self.llm, 'breaker', None)
+        if breaker is not None and breaker.state() != STATE_CLOSED:
+            return ""
+
+        try:
+            name, expires_at = self.llm.create_context_cache(prefix, CONTEXT_CACHE_TTL)
+        except Exception as e:
+            logger.info("Gemini context cache is not available for vacancy %s: %s",
+                        stored.vacancy_id, e)
+            cache.set(failure_key, True, CONTEXT_CACHE_RETRY_AFTER)
+            return ""
+
+        VacancyPromptCache.objects.filter(pk=stored.pk, content_hash=prefix.key).update(
+            gemini_cache_name=name,
+            gemini_cache_expires_at=expires_at,
+            updated_at=now,
+        )
+        return name
@@ -0,0 +1,207 @@
+# analytics/services/question_bank.py
+import logging
+import re
+import string
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db.models import F
+
+from analytics.models import QuestionTemplate
+from analytics.services.llm_client import MAX_QUESTIONS
+
+logger = logging.getLogger(__name__)
+
+KIND_LOCATION = 'location'
+KIND_EXPERIENCE = 'experience_gap'
+KIND_EMPLOYMENT = 'employment_type'
+KIND_SALARY = 'salary'
+KIND_OTHER = 'other'
+
+# Вид расхождения по тексту из AnalysisService.analyze_discrepancies
+_KIND_PATTERNS = (
+    (KIND_LOCATION, re.compile(r"^Локация")),
+    (KIND_EXPERIENCE, re.compile(r"^Опыт")),
+    (KIND_EMPLOYMENT, re.compile(r"^Формат работы")),
+    (KIND_SALARY, re.compile(r"^Зарплат")),
+)
+
+# Стартовый набор вопросов по видам расхождений
+CURATED_TEMPLATES = {
+    KIND_LOCATION: [
+        "Вакансия предполагает работу в городе {vacancy_city}, а вы находитесь в городе {candidate_city}. "
+        "Готовы ли вы к переезду или регулярным поездкам?",
+    ],
+    KIND_EXPERIENCE: [
+        "Для позиции «{vacancy_title}» нужен опыт от {vacancy_years} лет. "
+        "Расскажите, какой у вас релевантный опыт, в том числе не указанный в резюме?",
+    ],
+    KIND_EMPLOYMENT: [
+        "Формат работы по вакансии — {vacancy_employment_type}, вы указали предпочтение «{candidate_employment_type}». "
+        "Рассмотрите ли вы формат вакансии?",
+    ],
+    KIND_SALARY: [
+        "Какие у вас зарплатные ожидания? Бюджет вакансии: {vacancy_salary}.",
+    ],
+}
+
+CACHE_TTL = 3600
+
+
+def discrepancy_kind(discrepancy: str) -> str:
+    for kind, pattern in _KIND_PATTERNS:
+        if pattern.search(discrepancy or ""):
+            return kind
+    return KIND_OTHER
+
+
+def discrepancy_signature(discrepancies: List[str]) -> str:
+    """
+    Нормализованная сигнатура: отсортированный набор видов расхождений.
+    Расхождение "Локация ... (готов к переезду)" вопроса не требует.
+    """
+    kinds = {
+        discrepancy_kind(d) for d in discrepancies or []
+        if not (discrepancy_kind(d) == KIND_LOCATION and "готов к переезду" in d)
+    }
+    return "+".join(sorted(kinds))
+
+
+def template_context(vacancy, candidate) -> Dict[str, str]:
+    """Значения для подстановки в шаблоны (пустые значения не включаются)"""
+    salary = ""
+    if vacancy.salary_from or vacancy.salary_to:
+        salary = f"{vacancy.salary_from or '—'} - {vacancy.salary_to or '—'}"
+
+    def years(value):
+        return f"{value:g}" if value is not None else ""
+
+    context = {
+        "vacancy_title": vacancy.title or "",
+        "vacancy_city": vacancy.city or "",
+        "vacancy_years": years(vacancy.experience_years),
+        "vacancy_employment_type": vacancy.get_employment_type_display() if vacancy.employment_type else "",
+        "vacancy_salary": salary,
+        "candidate_city": candidate.city or "",
+        "candidate_years": years(candidate.experience_years),
+        "candidate_employment_type": (
+            candidate.get_preferred_employment_type_display() if candidate.preferred_employment_type else ""
+        ),
+    }
+    return {name: value for name, value in context.items() if value}
+
+
+def render_template(template: str, context: Dict[str, str]) -> Optional[str]:
+    """Подставляет значения; None, если для шаблона не хватает данных"""
+    fields = {name for _, name, _, _ in string.Formatter().parse(template) if name}
+    if not fields <= context.keys():
+        return None
+    return template.format_map(context)
+
+
+def templatize(question: str, context: Dict[str, str]) -> str:
+    """Заменяет конкретные значения вакансии/кандидата в вопросе плейсхолдерами"""
+    template = question.replace("{", "{{").replace("}", "}}")
+    # Длинные значения первыми, чтобы "Санкт-Петербург" не разбивался на части
+    for name, value in sorted(context.items(), key=lambda item: -len(item[1])):
+        if len(value) < 3 and not value.isdigit():
+            continue
+        template = re.sub(rf"(?<![\w{{]){re.escape(value)}(?![\w}}])", "{" + name + "}", template)
+    return template
+
+
+class QuestionBank:
+    """
+    Банк уточняющих вопросов по сигнатуре расхождений.
+
+    Вопросы берутся из выученного набора для сигнатуры или собираются
+    из подготовленных шаблонов по видам расхождений. LLM вызывается только
+    для сигнатур, которых еще нет в банке; ее вопросы сохраняются как
+    шаблоны для следующих откликов.
+    """
+
+    def __init__(self, llm=None):
+        # llm — клиент или фабрика без аргументов (клиент создается только при промахе)
+        self.llm = llm
+
+    @staticmethod
+    def _cache_key(signature: str) -> str:
+        return f"question_bank:{signature}"
+
+    def _learned(self, signature: str) -> Optional[List[str]]:
+        templates = cache.get(self._cache_key(signature))
+        if templates is None:
+            templates = QuestionTemplate.objects.filter(signature=signature).values_list(
+                'templates', flat=True
+            ).first() or []
+            cache.set(self._cache_key(signature), templates, CACHE_TTL)
+        return templates or None
+
+    @staticmethod
+    def _curated(signature: str) -> Optional[List[str]]:
+        kinds = signature.split("+") if signature else []
+        if not kinds or any(kind not in CURATED_TEMPLATES for kind in kinds):
+            return None
+        return [CURATED_TEMPLATES[kind][0] for kind in kinds]
+
+    @staticmethod
+    def _render(templates: List[str], context: Dict[str, str]) -> List[str]:
+        questions = [render_template(t, context) for t in templates]
+        return [q for q in questions if q][:MAX_QUESTIONS]
+
+    def lookup(self, vacancy, candidate, discrepancies: List[str]) -> Tuple[List[str], str]:
+        """
+        Вопросы из банка без LLM-вызова.
+        Возвращает (вопросы, источник: learned/curated/"" — не найдено).
+        """
+        signature = discrepancy_signature(discrepancies)
+        if not signature:
+            return [], ""
+        context = template_context(vacancy, candidate)
+
+        for source, templates in (("learned", self._learned(signature)), ("curated", self._curated(signature))):
+            if not templates:
+                continue
+            questions = self._render(templates, context)
+            if questions:
+                if source == "learned":
+                    QuestionTemplate.objects.filter(signature=signature).update(hits=F('hits') + 1)
+                return questions, source
+        return [], ""
+
+    def get_questions(self, vacancy, candidate, discrepancies: List[str],
+                      resume_text: str = "", prefix=None) -> Tuple[List[str], str]:
+        """
+        Вопросы для чата: из банка, а для новой сигнатуры — от LLM
+        (с сохранением в банк). prefix может быть фабрикой, чтобы не
+        готовить префикс промпта без необходимости.
+        Возвращает (вопросы, источник).
+        """
+        questions, source = self.lookup(vacancy, candidate, discrepancies)
+        if questions or self.llm is None:
+            return questions, source
+
+        llm = self.llm() if callable(self.llm) else self.llm
+        questions = llm.generate_questions(
+            prefix=prefix() if callable(prefix) else prefix,
+            resume_text=resume_text,
+            discrepancies=discrepancies
+        ) or []
+        if questions:
+            self.learn(discrepancies, questions, vacancy, candidate)
+        return questions, "llm"
+
+    def learn(self, discrepancies: List[str], questions: List[str], vacancy, candidate):
+        """Сохраняет вопросы LLM как шаблоны для сигнатуры (если ее еще нет в банке)"""
+        signature = discrepancy_signature(discrepancies)
+        if not signature or not questions:
+            return
+        context = template_context(vacancy, candidate)
+        templates = [templatize(q, context) for q in questions[:MAX_QUESTIONS]]
+        _, created = QuestionTemplate.objects.get_or_create(
+            signature=signature,
+            defaults={'templates': templates, 'source': 'learned'}
+        )
+        if created:
+            cache.delete(self._cache_key(signature))
+            logger.info("Question bank learned signature %s (%d templates)", signature, len(templates))
@@ -0,0 +1,146 @@
+# analytics/services/queue_metrics.py
+import logging
+import threading
+import time
+from typing import Dict
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "queue_metrics:{queue}"
+# Счетчики в Redis хранятся хэшем (другой тип значения — другой ключ)
+REDIS_METRICS_KEY = "queue_metrics:h:{queue}"
+METRICS_TTL = 24 * 3600
+# Коэффициент сглаживания скользящего среднего времени ожидания
+EWMA_ALPHA = 0.2
+
+# Атомарное обновление хэша счетчиков: count/total — HINCRBY/HINCRBYFLOAT,
+# max и EWMA считаются в том же скрипте, без гонки get/set между воркерами
+_RECORD_WAIT_SCRIPT = """
+local wait = tonumber(ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'count', 1)
+redis.call('HINCRBYFLOAT', KEYS[1], 'total', ARGV[1])
+local max = tonumber(redis.call('HGET', KEYS[1], 'max') or '0')
+if wait > max then
+    redis.call('HSET', KEYS[1], 'max', ARGV[1])
+end
+local ewma = tonumber(redis.call('HGET', KEYS[1], 'ewma') or '')
+if ewma then
+    ewma = tonumber(ARGV[2]) * wait + (1 - tonumber(ARGV[2])) * ewma
+else
+    ewma = wait
+end
+redis.call('HSET', KEYS[1], 'ewma', tostring(ewma), 'last', ARGV[1], 'updated_at', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# Кэш без Redis (locmem, тесты) живет в процессе — достаточно блокировки процесса
+_local_lock = threading.Lock()
+
+
+def _redis_client():
+    """Клиент Redis из кэша Django или None, если кэш не на Redis"""
+    from django.core.cache.backends.redis import RedisCache
+
+    if isinstance(cache, RedisCache):
+        return cache._cache.get_client(write=True)
+    return None
+
+
+def record_wait(queue: str, wait_seconds: float):
+    """
+    Учитывает время ожидания задачи в очереди (публикация -> старт выполнения).
+    Хранится в общем кэше, поэтому агрегируется по всем воркерам; обновление
+    атомарно (Lua-скрипт в Redis), параллельные записи не теряются.
+    """
+    wait_seconds = max(float(wait_seconds), 0.0)
+    try:
+        client = _redis_client()
+        if client is not None:
+            client.eval(
+                _RECORD_WAIT_SCRIPT, 1, cache.make_key(REDIS_METRICS_KEY.format(queue=queue)),
+                f"{wait_seconds:.6f}", str(EWMA_ALPHA), f"{time.time():.3f}", METRICS_TTL,
+            )
+            return
+
+        key = METRICS_KEY.format(queue=queue)
+        with _local_lock:
+            stats = cache.get(key) or {"count": 0, "total": 0.0, "max": 0.0, "ewma": None}
+            stats["count"] += 1
+            stats["total"] += wait_seconds
+            stats["max"] = max(stats["max"], wait_seconds)
+            stats["last"] = wait_seconds
+            stats["ewma"] = wait_seconds if stats["ewma"] is None else (
+                EWMA_ALPHA * wait_seconds + (1 - EWMA_ALPHA) * stats["ewma"]
+            )
+            stats["updated_at"] = time.time()
+            cache.set(key, stats, METRICS_TTL)
+    except Exception as e:
+        logger.debug("Failed to record queue wait for %s: %s", queue, e)
+
+
+def _read_stats(queue: str) -> Dict:
+    client = _redis_client()
+    if client is None:
+        return cache.get(METRICS_KEY.format(queue=queue)) or {}
+    raw = client.hgetall(cache.make_key(REDIS_METRICS_KEY.format(queue=queue)))
+    stats = {
+        (name.decode() if isinstance(name, bytes) else name): float(value)
+        for name, value in raw.items()
+    }
+    if "count" in stats:
+        stats["count"] = int(stats["count"])
+    return stats
+
+
+def queue_depths() -> Dict[str, int]:
+    """Текущая глубина каждой очереди топологии (по данным брокера)"""
+    from project.celery import app
+
+    depths = {}
+    try:
+        with app.connection_for_read() as connection:
+            channel = connection.default_channel
+            for queue in app.conf.task_queues:
+                try:
+                    depths[queue.name] = channel.queue_declare(queue=queue.name, passive=True).message_count
+                except Exception as e:
+                    logger.debug("Failed to read depth of queue %s: %s", queue.name, e)
+                    depths[queue.name] = None
+    except Exception as e:
+        logger.warning("Broker is not available for queue metrics: %s", e)
+        depths = {queue.name: None for queue in app.conf.task_queues}
+    return depths
+
+
+def queue_metrics() -> Dict[str, Dict]:
+    """Глубина и время ожидания по всем очередям"""
+    from project.celery import QUEUE_TOPOLOGY
+
+    depths = queue_depths()
+    metrics = {}
+    for queue in QUEUE_TOPOLOGY:
+        metrics[queue] = {
+            "depth": depths.get(queue),
+            **wait_summary(queue),
+        }
+    return metrics
+
+
+def wait_summary(queue: str) -> Dict:
+    """Сводка времени ожидания, накопленного record_wait для queue"""
+    try:
+        stats = _read_stats(queue)
+    except Exception as e:
+        logger.debug("Failed to read queue wait for %s: %s", queue, e)
+        stats = {}
+    count = stats.get("count", 0)
+    return {
+        "tasks_started": count,
+        "wait_avg_seconds": round(stats["total"] / count, 3) if count else None,
+        "wait_ewma_seconds": round(stats["ewma"], 3) if stats.get("ewma") is not None else None,
+        "wait_max_seconds": round(stats.get("max", 0.0), 3) if count else None,
+        "wait_last_seconds": round(stats["last"], 3) if "last" in stats else None,
+    }
@@ -0,0 +1,100 @@
+# analytics/services/replay_service.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from analytics.models import AnalysisReplayItem
+from analytics.services.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, llm_circuit_breaker
+from analytics.services.llm_budget import BUDGET_DEFER, LLMBudgetService
+
+REASON_BUDGET_EXCEEDED = 'budget_exceeded'
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayService:
+    """
+    Очередь откликов, оцененных в деградированном режиме (без LLM).
+    Разбирается с ограниченной скоростью, только когда LLM снова доступен.
+    """
+
+    def __init__(self, breaker=None):
+        self.breaker = breaker or llm_circuit_breaker()
+        self.batch_size = getattr(settings, 'LLM_REPLAY_BATCH_SIZE', 20)
+        self.retry_interval = timedelta(seconds=getattr(settings, 'LLM_REPLAY_RETRY_SECONDS', 600))
+
+    def enqueue(self, application_id: int, reason: str):
+        item, created = AnalysisReplayItem.objects.get_or_create(
+            application_id=application_id, defaults={'reason': reason}
+        )
+        if not created and item.reason != reason:
+            AnalysisReplayItem.objects.filter(pk=item.pk).update(reason=reason)
+        if created:
+            logger.info("Application %s queued for LLM replay (%s)", application_id, reason)
+
+    def resolve(self, application_id: int):
+        """Снимает отклик с очереди после полноценного анализа"""
+        AnalysisReplayItem.objects.filter(application_id=application_id).delete()
+
+    def drain(self, limit: int = None) -> int:
+        """
+        Ставит очередную пачку откликов в очередь справедливого планировщика
+        (массовой загрузкой, в пределах лимитов работодателя).
+        При разомкнутом предохранителе ничего не делает, в half-open
+        пропускает один отклик как пробный вызов. Отклики, отложенные из-за
+        бюджета, остаются в очереди, пока бюджет работодателя исчерпан, и не
+        занимают места в пачке.
+        Возвращает число поставленных в очередь откликов.
+        """
+        from analytics.services.fair_scheduler import FairScheduler
+
+        state = self.breaker.state()
+        if state not in (STATE_CLOSED, STATE_HALF_OPEN):
+            logger.info("LLM circuit is %s, replay postponed", state)
+            return 0
+
+        limit = limit or self.batch_size
+        if state == STATE_HALF_OPEN:
+            limit = 1
+
+        now = timezone.now()
+        due = AnalysisReplayItem.objects.filter(
+            Q(last_attempt_at__isnull=True) | Q(last_attempt_at__lt=now - self.retry_interval)
+        )
+        over_budget = self.over_budget_employers(due)
+        with transaction.atomic():
+            ids = list(
+                due.select_for_update(skip_locked=True, of=('self',))
+                .exclude(reason=REASON_BUDGET_EXCEEDED, application__vacancy__employer_id__in=over_budget)
+                .order_by('enqueued_at')
+                .values_list('application_id', flat=True)[:limit]
+            )
+            if not ids:
+                return 0
+            AnalysisReplayItem.objects.filter(application_id__in=ids).update(
+                attempts=F('attempts') + 1, last_attempt_at=now
+            )
+            FairScheduler().enqueue(ids, batch=True)
+
+        logger.info("Queued %d applications for LLM replay", len(ids))
+        return len(ids)
+
+    @staticmethod
+    def over_budget_employers(items) -> list:
+        """Работодатели отложенных по бюджету откликов, чей бюджет все еще исчерпан"""
+        budget = LLMBudgetService()
+        employer_ids = (
+            items.filter(reason=REASON_BUDGET_EXCEEDED).order_by()
+            .values_list('application__vacancy__employer_id', flat=True).distinct()
+        )
+        return [employer_id for employer_id in employer_ids if budget.decision(employer_id) == BUDGET_DEFER]
+
+    def stats(self) -> dict:
+        return {
+            'pending': AnalysisReplayItem.objects.count(),
+            'circuit': self.breaker.snapshot(),
+        }
@@ -0,0 +1,146 @@
+# analytics/services/workflow_service.py
+import hashlib
+import json
+import logging
+from typing import Callable, Dict, List, Optional
+
+from datetime import timedelta
+
+from celery.exceptions import Ignore
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from analytics.models import AnalysisStageState
+from analytics.services.prompt_service import prefix_hash, render_vacancy_block
+from candidates.models import Application
+
+logger = logging.getLogger(__name__)
+
+STAGE_RULE_BASED = 'rule_based'
+STAGE_LLM_EVALUATE = 'llm_evaluate'
+STAGE_QUESTIONS = 'questions'
+STAGE_PERSIST = 'persist'
+STAGE_CHAT_INIT = 'chat_init'
+STAGE_NOTIFY = 'notify'
+
+STAGES = (
+    STAGE_RULE_BASED, STAGE_LLM_EVALUATE, STAGE_QUESTIONS,
+    STAGE_PERSIST, STAGE_CHAT_INIT, STAGE_NOTIFY,
+)
+
+
+def analysis_fingerprint(app: Application, chat_responses: List[str] = None) -> str:
+    """
+    Отпечаток входных данных анализа: вакансия (хэш префикса промпта),
+    резюме и поля кандидата, состояние чата и ответы из него.
+    """
+    candidate = app.candidate
+    chat_session = getattr(app, 'chat_session', None)
+    payload = {
+        "vacancy": prefix_hash(render_vacancy_block(app.vacancy)),
+        "resume": candidate.resume_text or "",
+        "candidate": [
+            candidate.city, candidate.experience_years, candidate.preferred_employment_type,
+            str(candidate.expected_salary) if candidate.expected_salary is not None else None,
+        ],
+        "chat_active": chat_session.is_active if chat_session else None,
+        "chat_responses": chat_responses or [],
+    }
+    return hashlib.sha256(
+        json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def analysis_inputs_hash(app: Application) -> str:
+    """
+    Хэш входов первичной оценки (вакансия и резюме). Пока он не изменился,
+    после чата достаточно инкрементальной переоценки.
+    """
+    vacancy_hash = prefix_hash(render_vacancy_block(app.vacancy))
+    resume = app.candidate.resume_text or ""
+    return hashlib.sha256(f"{vacancy_hash}\n{resume}".encode("utf-8")).hexdigest()
+
+
+class StageInProgress(Ignore):
+    """
+    Стадию с теми же входными данными выполняет другой запуск конвейера.
+    Наследует Ignore: задача завершается без ошибки и повторов, а оставшиеся
+    стадии этого запуска не выполняются.
+    """
+
+
+class WorkflowService:
+    """
+    Чекпоинты стадий конвейера анализа
+    """
+
+    def __init__(self):
+        # Через сколько "running" без обновлений считается брошенным (воркер упал)
+        self.lease = timedelta(seconds=getattr(settings, 'ANALYSIS_STAGE_LEASE_SECONDS', 900))
+
+    def get_output(self, application_id: int, stage: str, fingerprint: str) -> Optional[Dict]:
+        """Результат завершенной стадии или None"""
+        state = AnalysisStageState.objects.filter(
+            application_id=application_id, stage=stage,
+            fingerprint=fingerprint, status='done'
+        ).only('output').first()
+        return state.output if state else None
+
+    def run_stage(self, application_id: int, stage: str, fingerprint: str,
+                  func: Callable[[], Dict], status_on_success: str = 'done') -> Dict:
+        """
+        Выполняет стадию с чекпоинтом: если для этих входных данных стадия уже
+        завершена, возвращает сохраненный результат без повторного выполнения.
+        Стадия захватывается условным UPDATE: если ее выполняет другой запуск
+        с тем же отпечатком, бросает StageInProgress.
+        """
+        cached = self.get_output(application_id, stage, fingerprint)
+        if cached is not None:
+            logger.info("Stage %s for app %s restored from checkpoint", stage, application_id)
+            return cached
+
+        now = timezone.now()
+        state, created = AnalysisStageState.objects.get_or_create(
+            application_id=application_id, stage=stage, fingerprint=fingerprint,
+            defaults={'status': 'running', 'attempts': 1}
+        )
+        if not created:
+            claimed = AnalysisStageState.objects.filter(pk=state.pk).filter(
+                ~Q(status__in=('running', 'done')) | Q(status='running', updated_at__lt=now - self.lease)
+            ).update(status='running', attempts=F('attempts') + 1, updated_at=now)
+            if not claimed:
+                cached = self.get_output(application_id, stage, fingerprint)
+                if cached is not None:
+                    return cached
+                logger.info("Stage %s for app %s is running in another workflow, skipped", stage, application_id)
+                raise StageInProgress(f"Stage {stage} of application {application_id} is already running")
+
+        try:
+            output = func() or {}
+        except Exception as e:
+            AnalysisStageState.objects.filter(pk=state.pk).update(
+                status='failed', error=f"{type(e).__name__}: {e}"[:2000], updated_at=timezone.now()
+            )
+            raise
+
+        AnalysisStageState.objects.filter(pk=state.pk).update(
+            status=status_on_success, output=output, error="", updated_at=timezone.now()
+        )
+        return output
+
+    def stage_outputs(self, application_id: int, fingerprint: str) -> Dict[str, Dict]:
+        """Результаты всех завершенных стадий запуска (включая деградированные)"""
+        return dict(
+            AnalysisStageState.objects.filter(
+                application_id=application_id, fingerprint=fingerprint,
+                status__in=('done', 'degraded')
+            ).values_list('stage', 'output')
+        )
+
+    def status(self, application_id: int) -> List[Dict]:
+        return list(
+            AnalysisStageState.objects.filter(application_id=application_id)
+            .order_by('-updated_at')
+            .values('stage', 'fingerprint', 'status', 'attempts', 'error', 'updated_at')
+        )
@@ -0,0 +1,80 @@
+# analytics/signals.py
+import logging
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from analytics.models import RelevanceResult
+from analytics.services.funnel_service import FunnelService, application_state
+from candidates.models import Application, BotMessage, ChatSession
+from employers.models import Employer
+from jobs.models import Vacancy
+from project.response_cache import SCOPE_VACANCY_LIST, analysis_scope, bump, chat_scope, vacancy_scope
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_init, sender=Application)
+def remember_application_state(sender, instance, **kwargs):
+    """Запоминает состояние отклика при загрузке для расчета дельты воронки"""
+    instance._funnel_state = application_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Application)
+def update_funnel_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        FunnelService().track_application_change(
+            instance, getattr(instance, '_funnel_state', None), created
+        )
+    except Exception as e:
+        # Воронка восстанавливается reconcile-задачей, сохранение отклика не ломаем
+        logger.exception("Funnel update failed for application %s: %s", instance.pk, e)
+    instance._funnel_state = application_state(instance)
+
+
+@receiver(post_delete, sender=Application)
+def update_funnel_on_delete(sender, instance, **kwargs):
+    try:
+        FunnelService().track_application_deleted(instance)
+    except Exception as e:
+        logger.exception("Funnel update failed for deleted application %s: %s", instance.pk, e)
+
+
+# ---------------------------------------------------------------------
+# Версии кэша ответов API (project/response_cache.py)
+# ---------------------------------------------------------------------
+
+@receiver(post_save, sender=Vacancy)
+@receiver(post_delete, sender=Vacancy)
+def bump_vacancy_cache(sender, instance, **kwargs):
+    bump(SCOPE_VACANCY_LIST, vacancy_scope(instance.pk))
+
+
+@receiver(post_save, sender=Employer)
+def bump_employer_vacancies_cache(sender, instance, created, **kwargs):
+    # В ответе вакансии есть название компании
+    if created:
+        return
+    vacancy_ids = list(Vacancy.objects.filter(employer_id=instance.pk).values_list('pk', flat=True))
+    bump(SCOPE_VACANCY_LIST, *(vacancy_scope(pk) for pk in vacancy_ids))
+
+
+@receiver(post_save, sender=RelevanceResult)
+@receiver(post_delete, sender=RelevanceResult)
+def bump_analysis_cache(sender, instance, **kwargs):
+    bump(analysis_scope(instance.application_id))
+
+
+@receiver(post_save, sender=ChatSession)
+@receiver(post_delete, sender=ChatSession)
+def bump_chat_session_cache(sender, instance, **kwargs):
+    bump(chat_scope(instance.pk))
+
+
+@receiver(post_save, sender=BotMessage)
+@receiver(post_delete, sender=BotMessage)
+def bump_chat_message_cache(sender, instance, **kwargs):
+    # В ответе сессии есть счетчик непрочитанных сообщений
+    bump(chat_scope(instance.chat_session_id))
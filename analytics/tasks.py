@@ -1,19 +1,55 @@
 # analytics/tasks.py
 import logging
-from celery import shared_task
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from celery import chain, group, shared_task
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 
-from candidates.models import Application, ChatSession, BotMessage, CandidateResponse
+from candidates.models import Application, ArchivedTranscript, ChatSession, BotMessage, CandidateResponse
 from analytics.models import RelevanceResult
-from analytics.services.llm_client import GeminiClient
+from analytics.services.circuit_breaker import CircuitOpenError
+from analytics.services.llm_budget import (
+    LLMBudgetService, BudgetExceededError, BUDGET_OK, BUDGET_DOWNGRADE, BUDGET_DEFER,
+)
+from analytics.services.llm_client import MAX_QUESTIONS
+from analytics.services.llm_usage import LLMUsageLedger, llm_usage_scope, PURPOSE_EVALUATE
+from analytics.services.replay_service import ReplayService
+from analytics.services.dead_letter_service import DeadLetterService
+from analytics.services.fair_scheduler import FairScheduler
 from analytics.services.analysis_service import AnalysisService
+from analytics.services.answer_extraction import classify_question
 from analytics.services.chat_service import ChatService
+from analytics.services.conversation_memory import ConversationMemory
+from analytics.services.prompt_service import PromptService
+from analytics.services.question_bank import QuestionBank
+from analytics.services.workflow_service import (
+    WorkflowService, StageInProgress, analysis_fingerprint, analysis_inputs_hash,
+    STAGE_RULE_BASED, STAGE_LLM_EVALUATE, STAGE_QUESTIONS,
+    STAGE_PERSIST, STAGE_CHAT_INIT, STAGE_NOTIFY,
+)
+from candidates.services.archive_service import TranscriptArchiveService, transcript_messages
+from candidates.services.dedup_service import DedupService
+from candidates.services.event_buffer import publish_application_event
 
 logger = logging.getLogger(__name__)
 
+# Повторы стадии конвейера при ошибке (с экспоненциальной задержкой)
+STAGE_MAX_RETRIES = 3
+STAGE_TASK_OPTIONS = dict(
+    bind=True,
+    autoretry_for=(Exception,),
+    dont_autoretry_for=(Application.DoesNotExist, StageInProgress),
+    retry_backoff=True,
+    retry_backoff_max=300,
+    max_retries=STAGE_MAX_RETRIES,
+)
+
+FALLBACK_QUESTIONS = [
+    "Расскажите подробнее о вашем опыте работы?",
+    "Какие технологии и инструменты вы используете в работе?",
+    "Что вас привлекло в нашей вакансии?"
+]
+
 
 # analytics/tasks.py (обновленная секция анализа)
 
@@ -21,6 +57,11 @@ logger = logging.getLogger(__name__)
 def analyze_application_task(self, application_id):
     """
     Основная задача анализа отклика с интеграцией чат-бота.
+
+    Запускает конвейер стадий (Celery canvas):
+    (rule-based || LLM-оценка) -> вопросы -> сохранение -> чат -> уведомление.
+    Результат каждой стадии сохраняется в AnalysisStageState по отпечатку
+    входных данных, поэтому повторный запуск продолжает с упавшей стадии.
     """
     try:
         app = Application.objects.select_related(
@@ -28,23 +69,97 @@ def analyze_application_task(self, application_id):
         ).prefetch_related('chat_session').get(pk=application_id)
     except Application.DoesNotExist:
         logger.error("Application %s not found", application_id)
+        FairScheduler().release(application_id, status='dispatched')
         return {"error": "application_not_found", "application_id": application_id}
 
-    vacancy = app.vacancy
-    candidate = app.candidate
-
     logger.info("Starting analysis for application %s: %s -> %s",
-                application_id, candidate.email, vacancy.title)
+                application_id, app.candidate.email, app.vacancy.title)
 
     # -------------------------
-    # 1. Rule-based предварительный анализ
+    # 0. Переиспользование анализа дубликата кандидата
     # -------------------------
-    preliminary_score = 0.0
-    discrepancies = []
+    if not hasattr(app, 'chat_session'):
+        reused = _reuse_duplicate_analysis(app)
+        if reused:
+            FairScheduler().release(application_id, status='dispatched')
+            return reused
+
+    chat_responses = _chat_context_responses(app)
+    fingerprint = analysis_fingerprint(app, chat_responses)
+
+    # Стадии выполняются в той же очереди, куда был отправлен запуск (analysis/batch/chat)
+    delivery_info = getattr(self.request, 'delivery_info', None) or {}
+    options = {}
+    if delivery_info.get('routing_key'):
+        options = {'queue': delivery_info['routing_key'], 'routing_key': delivery_info['routing_key']}
+
+    workflow = build_analysis_workflow(application_id, fingerprint, options)
+    result = workflow.apply_async()
+
+    return {
+        "application_id": application_id,
+        "fingerprint": fingerprint,
+        "workflow_id": result.id,
+    }
+
+
+def build_analysis_workflow(application_id, fingerprint, options=None):
+    """
+    Собирает canvas конвейера анализа. Rule-based и LLM-оценка независимы
+    и выполняются параллельно (chord), остальные стадии — последовательно.
+    """
+    options = options or {}
+
+    def sig(task):
+        return task.si(application_id, fingerprint).set(**options)
+
+    return chain(
+        group(sig(rule_based_stage), sig(llm_evaluate_stage)),
+        sig(questions_stage),
+        sig(persist_stage),
+        sig(chat_init_stage),
+        sig(notify_stage),
+    )
+
 
+def _load_application(application_id):
+    return Application.objects.select_related(
+        "vacancy", "candidate"
+    ).prefetch_related('chat_session').get(pk=application_id)
+
+
+def _chat_context_items(app):
+    """Ответы из завершенной чат-сессии: [(id сообщения, "Вопрос/Ответ")]"""
+    if hasattr(app, 'chat_session') and not app.chat_session.is_active:
+        return _get_chat_response_items(app.chat_session)
+    return []
+
+
+def _chat_context_responses(app):
+    """Ответы из завершенной чат-сессии (для анализа с учетом чата)"""
+    return [text for _, text in _chat_context_items(app)]
+
+
+def _rule_based_discrepancies(app):
+    """Rule-based расхождения и предварительный балл; (None, 0.0) при ошибке анализа"""
     try:
-        analysis_service = AnalysisService()
-        discrepancies, preliminary_score = analysis_service.analyze_discrepancies(vacancy, candidate)
+        return AnalysisService().analyze_discrepancies(app.vacancy, app.candidate)
+    except Exception as e:
+        logger.exception("Rule-based analysis failed for app %s: %s", app.pk, e)
+        return None, 0.0
+
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def rule_based_stage(self, application_id, fingerprint):
+    """
+    Стадия 1. Rule-based предварительный анализ
+    """
+    def run():
+        app = _load_application(application_id)
+        discrepancies, preliminary_score = _rule_based_discrepancies(app)
+        if discrepancies is None:
+            # Ошибка rule-based анализа не останавливает конвейер
+            return {"discrepancies": [], "preliminary_score": 0.0}
 
         # Сохраняем preliminary score в Application
         app.initial_score = preliminary_score
@@ -52,92 +167,271 @@ def analyze_application_task(self, application_id):
 
         logger.info("Preliminary analysis: score=%.1f, discrepancies=%d",
                     preliminary_score, len(discrepancies))
+        return {"discrepancies": discrepancies, "preliminary_score": preliminary_score}
 
-    except Exception as e:
-        logger.exception("Rule-based analysis failed for app %s: %s", application_id, e)
+    return WorkflowService().run_stage(application_id, STAGE_RULE_BASED, fingerprint, run)
 
-    # -------------------------
-    # 2. LLM-анализ через Gemini
-    # -------------------------
-    llm_score = 0.0
-    llm_summary = ""
-    llm_questions = []
 
+@shared_task(bind=True, max_retries=STAGE_MAX_RETRIES)
+def llm_evaluate_stage(self, application_id, fingerprint):
+    """
+    Стадия 2. LLM-анализ через Gemini (параллельно с rule-based).
+    После исчерпания повторов возвращает fallback-результат, чтобы конвейер
+    завершился, но не помечает стадию завершенной — следующий запуск
+    с теми же входными данными повторит LLM-вызов.
+    """
+    def run():
+        app = _load_application(application_id)
+        # Бюджет LLM работодателя: сверх бюджета — дешевая модель или отложенный анализ
+        budget = LLMBudgetService()
+        decision = budget.decision(app.vacancy.employer_id)
+        if decision == BUDGET_DEFER:
+            raise BudgetExceededError(f"LLM budget of employer {app.vacancy.employer_id} exhausted")
+        llm = budget.client(decision)
+        # Контекстный кэш Gemini привязан к основной модели — дешевой передаем префикс текстом
+        prompts = PromptService(llm if decision == BUDGET_OK else None)
+        with llm_usage_scope(PURPOSE_EVALUATE, application=app):
+            output = _evaluate_with_llm(app, llm, prompts)
+        output["budget_downgraded"] = decision == BUDGET_DOWNGRADE
+        return output
+
+    service = WorkflowService()
     try:
-        llm = GeminiClient()
-        vacancy_text = _prepare_vacancy_text(vacancy)
-        resume_text = candidate.resume_text or ""
-
-        # Если есть активная чат-сессия с ответами, используем контекст
-        chat_context_responses = []
-        if hasattr(app, 'chat_session') and not app.chat_session.is_active:
-            chat_context_responses = _get_chat_responses_for_analysis(app.chat_session)
-
-        if chat_context_responses:
-            # Анализ с учетом ответов из чата
-            llm_result = llm.evaluate_with_chat_context(
-                vacancy_text=vacancy_text,
-                resume_text=resume_text,
-                chat_responses=chat_context_responses
-            )
-            logger.info("Using chat context for LLM analysis (%d responses)",
-                        len(chat_context_responses))
-        else:
-            # Стандартный анализ без чата
-            llm_result = llm.evaluate_fit(
-                vacancy_text=vacancy_text,
-                resume_text=resume_text
-            )
+        return service.run_stage(application_id, STAGE_LLM_EVALUATE, fingerprint, run)
+    except (Application.DoesNotExist, StageInProgress):
+        raise
+    except CircuitOpenError:
+        # Предохранитель разомкнут: не ждем LLM, сразу деградированный результат
+        logger.warning("LLM circuit open, degraded analysis for app %s", application_id)
+        return _degraded_llm_stage(service, application_id, fingerprint, 'llm_unavailable',
+                                   "LLM недоступен")
+    except BudgetExceededError:
+        # Бюджет работодателя исчерпан: оценка без LLM, полноценный анализ —
+        # из очереди повторного анализа, когда бюджет освободится
+        logger.info("LLM budget exhausted, deferred analysis for app %s", application_id)
+        return _degraded_llm_stage(service, application_id, fingerprint, 'budget_exceeded',
+                                   "бюджет LLM работодателя исчерпан")
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=min(2 ** self.request.retries * 10, 300))
 
-        llm_score = float(llm_result.get("score", 0.0))
-        llm_summary = llm_result.get("summary", "")
-
-        # ОБНОВЛЕННАЯ ЛОГИКА: Генерируем вопросы почти всегда
-        if not hasattr(app, 'chat_session') or not app.chat_session.is_active:
-            # Запускаем чат если:
-            # 1. Есть расхождения ИЛИ
-            # 2. LLM score < 80 ИЛИ
-            # 3. Просто для сбора дополнительной информации
-            should_start_chat = (
-                    discrepancies or
-                    llm_score < 80 or
-                    len(resume_text.strip()) < 500  # короткое резюме
-            )
+        logger.exception("LLM analysis failed for app %s: %s", application_id, e)
+        return _degraded_llm_stage(service, application_id, fingerprint, 'llm_failed',
+                                   f"LLM analysis failed: {str(e)}")
+
+
+def _evaluate_with_llm(app, llm, prompts):
+    """LLM-оценка отклика (полная, с контекстом чата или инкрементальная)"""
+    vacancy, candidate = app.vacancy, app.candidate
+    # Rule-based расхождения дешевы и детерминированы — считаем их здесь,
+    # чтобы не ждать параллельную стадию
+    discrepancies = _rule_based_discrepancies(app)[0] or []
+
+    resume_text = candidate.resume_text or ""
+    inputs_hash = analysis_inputs_hash(app)
+
+    # Если есть завершенная чат-сессия с ответами, используем контекст
+    chat_items = _chat_context_items(app)
+    chat_context_responses = [text for _, text in chat_items]
+    last_message_id = chat_items[-1][0] if chat_items else None
+    questions_source = "llm"
+
+    if chat_items:
+        base = _delta_base(app, inputs_hash)
+        if base is not None:
+            # Резюме и вакансия не менялись — переоцениваем только по новым ответам
+            return _delta_evaluation(llm, base, chat_items, inputs_hash)
+
+        # Полная переоценка с учетом ответов из чата; длинный диалог
+        # передается через память ограниченного размера
+        if len(chat_items) > getattr(settings, 'CHAT_MEMORY_RECENT_TURNS', 6):
+            chat_context_responses = ConversationMemory(app.chat_session).sync().context_lines()
+        llm_result = llm.evaluate_with_chat_context(
+            prefix=prompts.get_prefix(vacancy),
+            resume_text=resume_text,
+            chat_responses=chat_context_responses
+        )
+        logger.info("Using chat context for LLM analysis (%d responses)",
+                    len(chat_context_responses))
+    else:
+        # Стандартный анализ без чата: балл, выжимка и вопросы одним вызовом.
+        # Если для сигнатуры расхождений вопросы уже есть в банке, LLM их не генерирует
+        bank_questions, bank_source = QuestionBank().lookup(vacancy, candidate, discrepancies)
+        llm_result = llm.analyze_application(
+            prefix=prompts.get_prefix(vacancy),
+            resume_text=resume_text,
+            discrepancies=discrepancies,
+            max_questions=0 if bank_questions else MAX_QUESTIONS
+        )
+        if bank_questions:
+            llm_result["questions"] = bank_questions
+            questions_source = bank_source
 
-            if should_start_chat:
-                try:
-                    llm_questions = llm.generate_questions(
-                        vacancy_text=vacancy_text,
-                        resume_text=resume_text,
-                        discrepancies=discrepancies
-                    ) or []
-                    logger.info("Generated %d questions for chat", len(llm_questions))
-                except Exception as e:
-                    logger.warning("LLM questions generation failed: %s", e)
+    return {
+        "score": float(llm_result.get("score", 0.0)),
+        "summary": llm_result.get("summary", ""),
+        "questions": llm_result.get("questions", []),
+        "questions_source": questions_source,
+        "llm_discrepancies": llm_result.get("discrepancies", []),
+        "analysis_type": "with_chat" if chat_items else "initial",
+        "inputs_hash": inputs_hash,
+        "chat_evaluated_message_id": last_message_id,
+        "failed": False,
+    }
 
-    except Exception as e:
-        logger.exception("LLM analysis failed for app %s: %s", application_id, e)
-        llm_score = preliminary_score
-        llm_summary = f"LLM analysis failed: {str(e)}"
 
-        # Если LLM упал, все равно запускаем чат для сбора информации
-        if not hasattr(app, 'chat_session'):
-            llm_questions = [
-                "Расскажите подробнее о вашем опыте работы?",
-                "Какие технологии и инструменты вы используете в работе?",
-                "Что вас привлекло в нашей вакансии?"
-            ]
+def _delta_base(app, inputs_hash):
+    """
+    Предыдущий результат, от которого можно считать инкрементальную
+    переоценку: полноценный (не деградированный) и по тем же резюме и вакансии.
+    """
+    if not getattr(settings, 'LLM_DELTA_REEVALUATION_ENABLED', True):
+        return None
+    result = RelevanceResult.objects.filter(application_id=app.pk).only('score', 'summary', 'metadata').first()
+    if result is None:
+        return None
+    metadata = result.metadata or {}
+    if metadata.get("degraded") or metadata.get("inputs_hash") != inputs_hash or not result.summary:
+        return None
+    return result
+
+
+def _delta_evaluation(llm, base, chat_items, inputs_hash):
+    """Переоценка по ответам, полученным после прошлой оценки"""
+    evaluated_until = base.metadata.get("chat_evaluated_message_id") or 0
+    new_items = [(msg_id, text) for msg_id, text in chat_items if msg_id > evaluated_until]
+
+    if new_items:
+        llm_result = llm.evaluate_delta(
+            previous_score=base.score,
+            previous_summary=base.summary,
+            new_responses=[text for _, text in new_items]
+        )
+        logger.info("Delta re-evaluation with %d new responses: %.0f -> %d",
+                    len(new_items), base.score, llm_result["score"])
+    else:
+        # Новых ответов нет — прошлая оценка остается в силе без LLM-вызова
+        llm_result = {"score": base.score, "summary": base.summary, "delta": ""}
+
+    return {
+        "score": float(llm_result["score"]),
+        "summary": llm_result["summary"],
+        "questions": [],
+        "llm_discrepancies": base.metadata.get("llm_discrepancies", []),
+        "analysis_type": "chat_delta",
+        "inputs_hash": inputs_hash,
+        "chat_evaluated_message_id": chat_items[-1][0],
+        "base_score": base.score,
+        "score_delta": float(llm_result["score"]) - base.score,
+        "delta_reasoning": llm_result["delta"],
+        "failed": False,
+    }
+
+
+def _degraded_llm_stage(service, application_id, fingerprint, reason, message):
+    """
+    Деградированный выход LLM-стадии: балл берется из rule-based анализа.
+    Сохраняется со статусом degraded — следующий запуск повторит LLM-вызов.
+    """
+    output = {
+        "score": None,
+        "summary": f"[Оценка без LLM: {message}] Предварительный балл по формальным критериям.",
+        "questions": [],
+        "llm_discrepancies": [],
+        "analysis_type": "degraded",
+        "failed": True,
+        "degraded": True,
+        "degraded_reason": reason,
+    }
+    return service.run_stage(
+        application_id, STAGE_LLM_EVALUATE, fingerprint,
+        lambda: output, status_on_success='degraded'
+    )
+
+
+def _stage_status(outputs):
+    """Стадии после деградированной LLM-оценки тоже помечаются degraded"""
+    return 'degraded' if outputs.get(STAGE_LLM_EVALUATE, {}).get("degraded") else 'done'
+
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def questions_stage(self, application_id, fingerprint):
+    """
+    Стадия 3. Вопросы для чата (если чат нужен и еще не запущен)
+    """
+    def run():
+        app = _load_application(application_id)
+        service = WorkflowService()
+        outputs = service.stage_outputs(application_id, fingerprint)
+        rule = outputs.get(STAGE_RULE_BASED, {})
+        llm_out = outputs.get(STAGE_LLM_EVALUATE, {})
+
+        # Чат уже идет или завершен (анализ после чата) — новые вопросы не нужны
+        if hasattr(app, 'chat_session'):
+            return {"questions": []}
+
+        discrepancies = rule.get("discrepancies", [])
+
+        if llm_out.get("failed"):
+            # Если LLM упал, все равно запускаем чат для сбора информации
+            questions, _ = QuestionBank().lookup(app.vacancy, app.candidate, discrepancies)
+            return {"questions": questions or list(FALLBACK_QUESTIONS)}
+
+        resume_text = app.candidate.resume_text or ""
+        llm_score = llm_out.get("score") or 0.0
+
+        # Запускаем чат если:
+        # 1. Есть расхождения ИЛИ
+        # 2. LLM score < 80 ИЛИ
+        # 3. Просто для сбора дополнительной информации
+        should_start_chat = (
+                discrepancies or
+                llm_score < 80 or
+                len(resume_text.strip()) < 500  # короткое резюме
+        )
+        if not should_start_chat:
+            return {"questions": []}
+
+        # Вопросы из банка подставлены LLM-стадией (LLM их не генерировал);
+        # вопросы LLM пополняют банк для этой сигнатуры
+        questions = llm_out.get("questions") or []
+        source = llm_out.get("questions_source") or "llm"
+        if questions and source == "llm":
+            QuestionBank().learn(discrepancies, questions, app.vacancy, app.candidate)
+
+        logger.info("Got %d questions for chat (%s)", len(questions), source or "none")
+        return {"questions": questions}
+
+    service = WorkflowService()
+    status = _stage_status(service.stage_outputs(application_id, fingerprint))
+    return service.run_stage(application_id, STAGE_QUESTIONS, fingerprint, run, status_on_success=status)
+
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def persist_stage(self, application_id, fingerprint):
+    """
+    Стадия 4. Сохранение финального результата
+    """
+    def run():
+        app = _load_application(application_id)
+        outputs = WorkflowService().stage_outputs(application_id, fingerprint)
+        rule = outputs.get(STAGE_RULE_BASED, {})
+        llm_out = outputs.get(STAGE_LLM_EVALUATE, {})
+        degraded = bool(llm_out.get("degraded"))
+        questions = outputs.get(STAGE_QUESTIONS, {}).get("questions", [])
+
+        discrepancies = rule.get("discrepancies", [])
+        preliminary_score = rule.get("preliminary_score", 0.0)
+        final_score = llm_out.get("score")
+        if final_score is None:
+            final_score = preliminary_score
+        summary = llm_out.get("summary", "")
 
-    # -------------------------
-    # 3. Сохранение финального результата
-    # -------------------------
-    final_score = llm_score
-    try:
         with transaction.atomic():
             # Сохраняем финальный score в Application
             app.final_score = final_score
             if not hasattr(app, 'chat_session') or not app.chat_session.is_active:
-                if llm_questions:  # Если есть вопросы, ставим статус чата
+                if questions:  # Если есть вопросы, ставим статус чата
                     app.status = 'chat_in_progress'
                 else:
                     app.status = 'reviewed'
@@ -149,57 +443,94 @@ def analyze_application_task(self, application_id):
                 defaults={
                     "score": final_score,
                     "reasons": discrepancies,
-                    "summary": llm_summary[:1000],
+                    "summary": summary[:1000],
                     "metadata": {
                         "preliminary_score": preliminary_score,
                         "discrepancies_count": len(discrepancies),
-                        "analysis_type": "with_chat" if chat_context_responses else "initial",
-                        "has_chat": bool(llm_questions),
+                        "llm_discrepancies": llm_out.get("llm_discrepancies", []),
+                        "analysis_type": llm_out.get("analysis_type", "initial"),
+                        "has_chat": bool(questions),
+                        "llm_failed": bool(llm_out.get("failed")),
+                        "degraded": degraded,
+                        "degraded_reason": llm_out.get("degraded_reason"),
+                        "budget_downgraded": bool(llm_out.get("budget_downgraded")),
+                        # База для инкрементальной переоценки после чата
+                        "inputs_hash": llm_out.get("inputs_hash"),
+                        "chat_evaluated_message_id": llm_out.get("chat_evaluated_message_id"),
+                        **({
+                            "base_score": llm_out.get("base_score"),
+                            "score_delta": llm_out.get("score_delta"),
+                            "delta_reasoning": llm_out.get("delta_reasoning"),
+                        } if llm_out.get("analysis_type") == "chat_delta" else {}),
+                        "fingerprint": fingerprint,
                         "timestamp": timezone.now().isoformat(),
                     }
                 }
             )
 
+            # Деградированный результат ставим в очередь повторного анализа,
+            # полноценный — снимаем с нее
+            if degraded:
+                ReplayService().enqueue(application_id, llm_out.get("degraded_reason") or 'llm_failed')
+            else:
+                ReplayService().resolve(application_id)
+            # Результат сохранен — записи DLQ по отклику закрыты
+            DeadLetterService().resolve_application(application_id)
+            # LLM-часть анализа завершена — место в планировщике освобождается
+            FairScheduler().release(application_id, status='dispatched')
+
         logger.info("RelevanceResult saved for app %s with score %.1f",
                     application_id, final_score)
+        return {"final_score": final_score, "summary": summary, "degraded": degraded}
 
-    except Exception as e:
-        logger.exception("Failed to save results for app %s: %s", application_id, e)
-        return {
-            "error": "save_failed",
-            "application_id": application_id,
-            "llm_score": final_score
-        }
+    service = WorkflowService()
+    status = _stage_status(service.stage_outputs(application_id, fingerprint))
+    return service.run_stage(application_id, STAGE_PERSIST, fingerprint, run, status_on_success=status)
 
-    # -------------------------
-    # 4. Инициализация чат-сессии если есть вопросы
-    # -------------------------
-    if llm_questions and not hasattr(app, 'chat_session'):
-        try:
-            _initialize_chat_session(app, llm_questions, discrepancies)
-            logger.info("Chat session initialized with %d questions", len(llm_questions))
-        except Exception as e:
-            logger.exception("Failed to initialize chat session for app %s: %s",
-                             application_id, e)
 
-    # -------------------------
-    # 5. Уведомление через Channels (если нужно)
-    # -------------------------
-    _notify_frontend(application_id, final_score, llm_summary)
+@shared_task(**STAGE_TASK_OPTIONS)
+def chat_init_stage(self, application_id, fingerprint):
+    """
+    Стадия 5. Инициализация чат-сессии если есть вопросы
+    """
+    def run():
+        app = _load_application(application_id)
+        outputs = WorkflowService().stage_outputs(application_id, fingerprint)
+        questions = outputs.get(STAGE_QUESTIONS, {}).get("questions", [])
+        discrepancies = outputs.get(STAGE_RULE_BASED, {}).get("discrepancies", [])
 
-    logger.info(
-        "Application %s analysis completed. Final score: %.1f, Chat: %s",
-        application_id, final_score, "initialized" if llm_questions else "not needed"
-    )
+        if not questions or hasattr(app, 'chat_session'):
+            return {"chat_session_id": None}
 
-    return {
-        "application_id": application_id,
-        "preliminary_score": preliminary_score,
-        "llm_score": final_score,
-        "summary": llm_summary,
-        "discrepancies_count": len(discrepancies),
-        "chat_initialized": bool(llm_questions and not hasattr(app, 'chat_session'))
-    }
+        chat_session = _initialize_chat_session(app, questions, discrepancies)
+        logger.info("Chat session initialized with %d questions", len(questions))
+        return {"chat_session_id": chat_session.id}
+
+    return WorkflowService().run_stage(application_id, STAGE_CHAT_INIT, fingerprint, run)
+
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def notify_stage(self, application_id, fingerprint):
+    """
+    Стадия 6. Уведомление через Channels
+    """
+    def run():
+        outputs = WorkflowService().stage_outputs(application_id, fingerprint)
+        persisted = outputs.get(STAGE_PERSIST, {})
+        chat_session_id = outputs.get(STAGE_CHAT_INIT, {}).get("chat_session_id")
+
+        _notify_frontend(application_id, persisted.get("final_score"), persisted.get("summary", ""))
+
+        logger.info(
+            "Application %s analysis completed. Final score: %s, Chat: %s",
+            application_id, persisted.get("final_score"),
+            "initialized" if chat_session_id else "not needed"
+        )
+        return {"notified": True}
+
+    service = WorkflowService()
+    status = _stage_status(service.stage_outputs(application_id, fingerprint))
+    return service.run_stage(application_id, STAGE_NOTIFY, fingerprint, run, status_on_success=status)
 
 
 @shared_task(bind=True)
@@ -222,14 +553,21 @@ def process_chat_completion_task(self, application_id):
             logger.warning("Chat session still active for app %s", application_id)
             return {"error": "chat_still_active", "application_id": application_id}
 
-        # Запускаем финальный анализ
-        return analyze_application_task(application_id)
+        # Финальный анализ — через планировщик (лимиты работодателя, очередь chat),
+        # а не внутри этой задачи
+        task_ids = FairScheduler().enqueue([application_id], chat=True)
+        return {"status": "queued", "application_id": application_id,
+                "task_id": task_ids.get(application_id)}
 
     except Application.DoesNotExist:
         logger.error("Application %s not found for chat completion", application_id)
         return {"error": "application_not_found", "application_id": application_id}
     except Exception as e:
         logger.exception("Chat completion processing failed for app %s: %s", application_id, e)
+        DeadLetterService().record(
+            self.name, args=[application_id], exc=e, stage="chat_completion",
+            application_id=application_id, task_id=self.request.id or "",
+        )
         return {"error": "processing_failed", "application_id": application_id}
 
 
@@ -254,7 +592,7 @@ def timeout_chat_sessions():
         try:
             session.is_active = False
             session.status = 'timeout'
-            session.save()
+            session.save(update_fields=['is_active', 'status', 'updated_at', 'last_activity'])
 
             # Обновляем статус отклика
             session.application.status = 'no_response'
@@ -268,34 +606,136 @@ def timeout_chat_sessions():
     return {"timed_out_sessions": count}
 
 
+@shared_task
+def rebuild_funnels_task(vacancy_ids=None):
+    """
+    Периодическая сверка: полностью пересчитывает воронки вакансий и работодателей
+    """
+    from analytics.services.funnel_service import FunnelService
+
+    rebuilt = FunnelService().rebuild(vacancy_ids)
+    return {"rebuilt_vacancies": rebuilt}
+
+
+@shared_task
+def replay_degraded_analyses_task(limit=None):
+    """
+    Периодически перезапускает анализ откликов, оцененных без LLM.
+    Пока предохранитель LLM разомкнут, ничего не делает.
+    """
+    dispatched = ReplayService().drain(limit)
+    return {"dispatched": dispatched}
+
+
+@shared_task
+def schedule_analyses_task():
+    """
+    Страховочный запуск справедливого планировщика: снимает зависшие
+    анализы и отправляет отклики, если событийный запуск был пропущен.
+    """
+    dispatched = FairScheduler().schedule()
+    return {"dispatched": dispatched}
+
+
+@shared_task
+def flush_llm_usage_task():
+    """
+    Переносит накопленные записи о вызовах LLM в журнал и дневные сводки.
+    Запускается раз в минуту и при заполнении буфера.
+    """
+    flushed = LLMUsageLedger().flush()
+    return {"flushed": flushed}
+
+
+@shared_task
+def reconcile_dead_letters_task():
+    """Сверка: отклики, анализ которых не завершился, записываются в DLQ"""
+    found = DeadLetterService().reconcile()
+    return {"stuck_applications": found}
+
+
+@shared_task
+def archive_chat_transcripts_task(limit=None):
+    """
+    Переносит переписку старых завершенных чат-сессий в сжатый архив
+    (по сессии за транзакцию, без долгих блокировок)
+    """
+    return TranscriptArchiveService().run(limit)
+
+
 # Вспомогательные функции
-def _prepare_vacancy_text(vacancy) -> str:
-    """Подготавливает текст вакансии для LLM"""
-    return " ".join(filter(None, [
-        getattr(vacancy, "title", ""),
-        getattr(vacancy, "description", ""),
-        f"Город: {getattr(vacancy, 'city', '')}",
-        f"Требуемый опыт: {getattr(vacancy, 'experience_years', '')} лет",
-        f"Тип занятости: {getattr(vacancy, 'employment_type', '')}",
-        f"Зарплатная вилка: {getattr(vacancy, 'salary_range', '')}",
-        f"Ключевые навыки: {getattr(vacancy, 'required_skills', '')}",
-    ]))
-
-
-def _get_chat_responses_for_analysis(chat_session):
-    """Извлекает ответы кандидата из чат-сессии для анализа"""
+def _reuse_duplicate_analysis(app):
+    """Копирует результат анализа дубликата кандидата вместо нового LLM-вызова"""
+    try:
+        source = DedupService().find_reusable_result(app)
+    except Exception as e:
+        logger.warning("Duplicate lookup failed for app %s: %s", app.id, e)
+        return None
+
+    if not source:
+        return None
+
+    with transaction.atomic():
+        app.initial_score = source.application.initial_score
+        app.final_score = source.score
+        app.status = 'reviewed'
+        app.save(update_fields=['initial_score', 'final_score', 'status'])
+
+        RelevanceResult.objects.update_or_create(
+            application=app,
+            defaults={
+                "score": source.score,
+                "reasons": source.reasons,
+                "summary": source.summary,
+                "metadata": {
+                    **source.metadata,
+                    "analysis_type": "reused",
+                    "source_application_id": source.application_id,
+                    "timestamp": timezone.now().isoformat(),
+                }
+            }
+        )
+
+    logger.info("Reused analysis of application %s for duplicate application %s",
+                source.application_id, app.id)
+    _notify_frontend(app.id, source.score, source.summary)
+
+    return {
+        "application_id": app.id,
+        "preliminary_score": app.initial_score,
+        "llm_score": source.score,
+        "summary": source.summary,
+        "reused_from": source.application_id,
+        "chat_initialized": False
+    }
+
+
+def _get_chat_response_items(chat_session):
+    """Ответы кандидата с id сообщений, в порядке диалога"""
     responses = []
     try:
+        archived = ArchivedTranscript.objects.filter(chat_session_id=chat_session.pk).first()
+        if archived is not None:
+            messages = transcript_messages(archived)
+            questions = {m['id']: m['text'] for m in messages}
+            return [
+                (m['id'], f"Вопрос: {questions[m['parent_message']]}\nОтвет: {m['text']}")
+                for m in messages
+                if m['sender'] == 'candidate' and m['message_type'] == 'response'
+                and m['parent_message'] in questions
+            ]
+
         candidate_messages = chat_session.messages.filter(
             sender='candidate',
             message_type='response'
-        ).select_related('parent_message')
+        ).select_related('parent_message').order_by('created_at', 'id')
 
         for msg in candidate_messages:
             if msg.parent_message:
-                responses.append(
+                responses.append((
+                    msg.id,
                     f"Вопрос: {msg.parent_message.text}\nОтвет: {msg.text}"
-                )
+                ))
     except Exception as e:
         logger.warning("Failed to extract chat responses: %s", e)
 
@@ -340,7 +780,7 @@ def _initialize_chat_session(application, questions, discrepancies):
                     text=question,
                     is_question=True,
                     question_category=category,
-                    expected_answer_type='text',
+                    expected_answer_type=classify_question(question) or 'text',
                     parent_message=welcome_msg
                 )
 
@@ -357,21 +797,15 @@ def _initialize_chat_session(application, questions, discrepancies):
 def _notify_frontend(application_id, score, summary):
     """Уведомляет фронтенд о результате анализа"""
     try:
-        channel_layer = get_channel_layer()
-        group_name = f"application_{application_id}"
-
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": "analysis.complete",
-                "data": {
-                    "application_id": application_id,
-                    "score": score,
-                    "summary": summary,
-                    "timestamp": timezone.now().isoformat(),
-                }
+        publish_application_event(application_id, {
+            "type": "analysis.complete",
+            "data": {
+                "application_id": application_id,
+                "score": score,
+                "summary": summary,
+                "timestamp": timezone.now().isoformat(),
             }
-        )
+        })
     except Exception as e:
         logger.debug("Frontend notification failed for app %s: %s", application_id, e)
 
@@ -379,19 +813,13 @@ def _notify_frontend(application_id, score, summary):
 def _notify_chat_initialized(application_id, chat_session_id):
     """Уведомляет фронтенд о инициализации чата"""
     try:
-        channel_layer = get_channel_layer()
-        group_name = f"application_{application_id}"
-
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": "chat.initialized",
-                "data": {
-                    "application_id": application_id,
-                    "chat_session_id": chat_session_id,
-                    "timestamp": timezone.now().isoformat(),
-                }
+        publish_application_event(application_id, {
+            "type": "chat.initialized",
+            "data": {
+                "application_id": application_id,
+                "chat_session_id": chat_session_id,
+                "timestamp": timezone.now().isoformat(),
             }
-        )
+        })
     except Exception as e:
         logger.debug("Chat initialization notification failed: %s", e)
\ No newline at end of file
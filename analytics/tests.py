@@ -1,3 +1,836 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from analytics.models import (
+    AnalysisQueueItem, AnalysisReplayItem, AnalysisStageState, DeadLetter, EmployerFunnel, EmployerLLMBudget,
+    LLMUsageDaily, QuestionTemplate, RelevanceResult, VacancyFunnel,
+)
+from analytics.services.answer_extraction import (
+    CATEGORY_SALARY, AnswerExtractionService, extract_answer, extract_experience_years,
+    extract_notice_period, extract_relocation, extract_salary,
+)
+from analytics.services.circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError,
+)
+from analytics.services.conversation_memory import ConversationMemory
+from analytics.services.dead_letter_service import DeadLetterService
+from analytics.services.fair_scheduler import FairScheduler
+from analytics.services.funnel_service import FunnelService
+from analytics.services.llm_budget import BUDGET_DEFER, BUDGET_DOWNGRADE, BUDGET_OK, LLMBudgetService
+from analytics.services.llm_client import GeminiClient, LLMResponseError, PromptPrefix
+from analytics.services.question_bank import QuestionBank, discrepancy_signature, templatize
+from analytics.services.replay_service import ReplayService
+from analytics.services.workflow_service import (
+    STAGE_LLM_EVALUATE, StageInProgress, WorkflowService, analysis_fingerprint,
+)
+from candidates.models import Application, BotMessage, Candidate, CandidateResponse, ChatSession
+from employers.models import Employer
+from jobs.models import Vacancy
+
+
+class ExtractRelocationTests(SimpleTestCase):
+    """Готовность к переезду: отрицание относится к глаголу, а не к любому "нет"/"no" """
+
+    def test_positive_answers_with_negative_tokens(self):
+        for answer in (
+            "Нет проблем, готов переехать",
+            "Yes, no problem",
+            "I don't mind relocating",
+            "Не против переехать",
+            "I wouldn't mind moving",
+        ):
+            with self.subTest(answer=answer):
+                self.assertIs(extract_relocation(answer, expected=True), True)
+
+    def test_negative_answers(self):
+        for answer in (
+            "Нет",
+            "Нет, не готов",
+            "Не готов к переезду",
+            "Пока не планирую переезжать",
+            "No, I can't relocate",
+            "I am not willing to relocate",
+            "I don't want to move",
+        ):
+            with self.subTest(answer=answer):
+                self.assertIs(extract_relocation(answer, expected=True), False)
+
+    def test_positive_answers(self):
+        for answer in ("Да, готов", "Готов", "Sure, I'd be happy to relocate"):
+            with self.subTest(answer=answer):
+                self.assertIs(extract_relocation(answer, expected=True), True)
+
+
+class ExtractSalaryTests(SimpleTestCase):
+    """Зарплата: множитель только отдельным словом, тенге, валюта по умолчанию"""
+
+    def test_multiplier_is_not_taken_from_words(self):
+        cases = {
+            "I expect 5000 monthly": 5000,
+            "500000 kzt": 500000,
+        }
+        for answer, amount in cases.items():
+            with self.subTest(answer=answer):
+                self.assertEqual(extract_salary(answer, expected=True)["amount"], amount)
+
+    def test_bare_number_is_not_multiplied_by_following_word(self):
+        salary = extract_salary("от 200 как минимум", expected=True)
+        # "200" в ответ на вопрос о зарплате — 200 тысяч, но с низкой уверенностью
+        self.assertEqual(salary["amount"], 200000)
+        self.assertLess(salary["confidence"], 0.9)
+
+    def test_multipliers(self):
+        cases = {
+            "150к": 150000,
+            "300 тыс тенге": 300000,
+            "от 200 до 250 тысяч": 200000,
+            "2.5 млн в год": 2500000,
+        }
+        for answer, amount in cases.items():
+            with self.subTest(answer=answer):
+                self.assertEqual(extract_salary(answer, expected=True)["amount"], amount)
+
+    def test_currencies(self):
+        cases = {
+            "500 000 ₸": "KZT",
+            "300 тыс тенге": "KZT",
+            "500000 KZT": "KZT",
+            "200 тыс рублей": "RUB",
+            "$3000 per month": "USD",
+            "400 000": "KZT",
+        }
+        for answer, currency in cases.items():
+            with self.subTest(answer=answer):
+                self.assertEqual(extract_salary(answer, expected=True)["currency"], currency)
+
+    @override_settings(CHAT_DEFAULT_SALARY_CURRENCY="RUB")
+    def test_default_currency_from_settings(self):
+        self.assertEqual(extract_salary("150000", expected=True)["currency"], "RUB")
+
+
+class ExtractNoticeAndExperienceTests(SimpleTestCase):
+
+    def test_notice_period(self):
+        cases = {
+            "через 2 недели": 14,
+            "месяц отработки": 30,
+            "готов выйти сразу": 0,
+            "14 days notice": 14,
+            "in 3 months": 90,
+        }
+        for answer, days in cases.items():
+            with self.subTest(answer=answer):
+                self.assertEqual(extract_notice_period(answer, expected=True), days)
+
+    def test_experience_years(self):
+        cases = {
+            "5 лет": 5.0,
+            "полтора года": 1.5,
+            "полгода": 0.5,
+            "3+ years of experience": 3.0,
+            "8 месяцев": 0.7,
+        }
+        for answer, years in cases.items():
+            with self.subTest(answer=answer):
+                self.assertEqual(extract_experience_years(answer, expected=True), years)
+
+    def test_implausible_experience_is_ignored(self):
+        self.assertIsNone(extract_experience_years("2020 год", expected=True))
+
+
+class AnswerExtractionServiceTests(TestCase):
+
+    def setUp(self):
+        self.candidate = Candidate.objects.create(name="Test", email="test@example.com")
+
+    def test_salary_written_to_candidate(self):
+        AnswerExtractionService._update_candidate(self.candidate, extract_answer("450 000 тенге", CATEGORY_SALARY).data)
+        self.candidate.refresh_from_db()
+        self.assertEqual(self.candidate.expected_salary, Decimal("450000"))
+
+    def test_salary_beyond_field_precision_is_rejected(self):
+        data = {"salary": {"amount": 5e9, "currency": "KZT", "period": "month"}}
+        AnswerExtractionService._update_candidate(self.candidate, data)
+        self.candidate.refresh_from_db()
+        self.assertIsNone(self.candidate.expected_salary)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModel:
+    """Модель Gemini, возвращающая заданные ответы (исключение — упавший вызов)"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return FakeResponse(result)
+
+
+def make_llm_client(model, breaker=None):
+    client = GeminiClient.__new__(GeminiClient)
+    client.model_name = "gemini-test"
+    client.model = model
+    client._cached_models = {}
+    client.breaker = breaker or CircuitBreaker("test-llm")
+    return client
+
+
+@override_settings(LLM_USAGE_BUFFER_BACKEND="memory")
+class ChatContextEvaluationTests(TestCase):
+    """Полная переоценка после чата: негодный ответ — ошибка, а не балл 0"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_valid_response(self):
+        client = make_llm_client(FakeModel('{"score": 72, "summary": "Готов к переезду"}'))
+        result = client.evaluate_with_chat_context(resume_text="resume", chat_responses=["Q: A"])
+        self.assertEqual(result, {"score": 72, "summary": "Готов к переезду"})
+
+    def test_invalid_response_is_repaired(self):
+        model = FakeModel("not json", '{"score": 65, "summary": "ok"}')
+        result = make_llm_client(model).evaluate_with_chat_context(resume_text="resume")
+        self.assertEqual(result["score"], 65)
+        self.assertEqual(len(model.prompts), 2)
+
+    def test_unrepairable_response_raises(self):
+        model = FakeModel("not json", '{"score": 150}')
+        with self.assertRaises(LLMResponseError):
+            make_llm_client(model).evaluate_with_chat_context(resume_text="resume")
+
+
+@override_settings(LLM_USAGE_BUFFER_BACKEND="memory")
+class CachedContentFallbackTests(SimpleTestCase):
+    """На полный промпт откатываемся только при истекшем кэше, прочие ошибки — сбой Gemini"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.breaker = CircuitBreaker("test-llm", failure_threshold=1)
+        self.prefix = PromptPrefix.from_vacancy_text("Python developer")
+        self.prefix.cache_name = "cachedContents/vacancy"
+
+    def make_client(self, cached_result, *full_results):
+        client = make_llm_client(FakeModel(*full_results), breaker=self.breaker)
+        client._cached_models[self.prefix.cache_name] = FakeModel(cached_result)
+        return client
+
+    def test_expired_cache_falls_back_to_full_prompt(self):
+        client = self.make_client(RuntimeError("403 CachedContent expired"), "full")
+        self.assertEqual(client._generate("suffix", self.prefix).text, "full")
+        self.assertEqual(self.prefix.cache_name, "")
+        self.assertEqual(self.breaker.state(), STATE_CLOSED)
+
+    def test_other_errors_are_raised_and_counted(self):
+        client = self.make_client(RuntimeError("503 Service Unavailable"), "full")
+        with self.assertRaises(RuntimeError):
+            client._generate("suffix", self.prefix)
+        self.assertEqual(client.model.prompts, [])
+        self.assertEqual(self.prefix.cache_name, "cachedContents/vacancy")
+        self.assertEqual(self.breaker.state(), STATE_OPEN)
+
+
+class QueueRoutingTests(SimpleTestCase):
+    """Маршруты очередей: без приоритетов сообщений"""
+
+    def test_routes_have_no_message_priority(self):
+        from project.celery import app
+
+        for task_name, route in app.conf.task_routes.items():
+            with self.subTest(task=task_name):
+                self.assertNotIn("priority", route)
+                self.assertEqual(route["queue"], route["routing_key"])
+
+
+def make_application(employer=None, email="candidate@example.com"):
+    if employer is None:
+        user = get_user_model().objects.create_user(username=f"employer-{email}")
+        employer = Employer.objects.create(user=user, company_name="Acme")
+    vacancy = Vacancy.objects.create(employer=employer, title="Python developer")
+    candidate = Candidate.objects.create(name="Test", email=email)
+    return Application.objects.create(vacancy=vacancy, candidate=candidate)
+
+
+class FairSchedulerAllocateTests(SimpleTestCase):
+    """Deficit round-robin: места делятся по весам и не превышают лимит работодателя"""
+
+    def setUp(self):
+        cache.clear()
+        self.scheduler = FairScheduler()
+        self.scheduler.default_tenant_limit = 0
+
+    def test_slots_follow_weights(self):
+        quotas = self.scheduler.allocate({1: 30, 2: 30}, {}, {1: (3, None), 2: (1, None)}, free=8)
+        self.assertEqual(quotas, {1: 6, 2: 2})
+
+    def test_tenant_limit_counts_in_flight(self):
+        quotas = self.scheduler.allocate({1: 30, 2: 30}, {1: 1}, {1: (5, 2)}, free=8)
+        self.assertEqual(quotas, {1: 1, 2: 7})
+
+    def test_bulk_tenant_does_not_starve_others(self):
+        quotas = self.scheduler.allocate({1: 1000, 2: 1}, {}, {}, free=2)
+        self.assertEqual(quotas, {1: 1, 2: 1})
+
+    def test_rotation_continues_between_runs(self):
+        first = self.scheduler.allocate({1: 10, 2: 10, 3: 10}, {}, {}, free=1)
+        second = self.scheduler.allocate({1: 10, 2: 10, 3: 10}, {}, {}, free=1)
+        self.assertEqual((first, second), ({1: 1}, {2: 1}))
+
+
+@override_settings(LLM_SCHEDULER_DISPATCH_TIMEOUT=900, LLM_SCHEDULER_BATCH_DISPATCH_TIMEOUT=3600)
+class FairSchedulerQueueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.scheduler = FairScheduler()
+        self.application = make_application()
+        self.now = timezone.now()
+
+    def queue_item(self, dispatched_minutes_ago=None, **fields):
+        item = AnalysisQueueItem.objects.create(
+            application=self.application, employer=self.application.vacancy.employer, **fields
+        )
+        if dispatched_minutes_ago is not None:
+            item.status = 'dispatched'
+            item.dispatched_at = self.now - timedelta(minutes=dispatched_minutes_ago)
+            item.save(update_fields=['status', 'dispatched_at'])
+        return item
+
+    def heartbeat(self, minutes_ago):
+        state = AnalysisStageState.objects.create(application=self.application, stage='llm_evaluate', fingerprint='f')
+        AnalysisStageState.objects.filter(pk=state.pk).update(updated_at=self.now - timedelta(minutes=minutes_ago))
+
+    def test_stale_dispatch_returns_to_queue(self):
+        item = self.queue_item(dispatched_minutes_ago=20)
+        self.assertEqual(self.scheduler.reap_stale(self.now), 1)
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.dispatched_at), ('waiting', None))
+
+    def test_recent_stage_heartbeat_keeps_dispatch(self):
+        self.queue_item(dispatched_minutes_ago=20)
+        self.heartbeat(minutes_ago=5)
+        self.assertEqual(self.scheduler.reap_stale(self.now), 0)
+
+    def test_batch_waiting_in_celery_queue_is_not_reaped_early(self):
+        self.queue_item(dispatched_minutes_ago=20, batch=True)
+        self.assertEqual(self.scheduler.reap_stale(self.now), 0)
+        self.assertEqual(self.scheduler.reap_stale(self.now + timedelta(hours=1)), 1)
+
+    def test_release_keeps_requeued_waiting_item(self):
+        self.queue_item()
+        self.scheduler.release(self.application.id, status='dispatched')
+        self.assertTrue(AnalysisQueueItem.objects.filter(application=self.application).exists())
+
+    def test_post_chat_analysis_is_scheduled_on_chat_queue(self):
+        from analytics.services.chat_service import ChatService
+        from project.celery import QUEUE_CHAT, TASK_ANALYZE_APPLICATION
+
+        with mock.patch("project.celery.app.send_task") as send_task, \
+                self.captureOnCommitCallbacks(execute=True):
+            ChatService.__new__(ChatService)._finalize_analysis(self.application)
+
+        item = AnalysisQueueItem.objects.get(application=self.application)
+        self.assertTrue(item.chat)
+        send_task.assert_called_once_with(
+            TASK_ANALYZE_APPLICATION, args=(self.application.id,), task_id=item.task_id,
+            queue=QUEUE_CHAT, routing_key=QUEUE_CHAT,
+        )
+
+
+class ChatCompletionTaskTests(TestCase):
+    """Завершение чата ставит финальный анализ в планировщик, а не выполняет его в задаче"""
+
+    def setUp(self):
+        cache.clear()
+        self.application = make_application()
+        ChatSession.objects.create(application=self.application, is_active=False)
+
+    def test_final_analysis_is_enqueued(self):
+        from analytics.tasks import process_chat_completion_task
+        from project.celery import QUEUE_CHAT
+
+        with mock.patch("project.celery.app.send_task") as send_task, \
+                mock.patch("analytics.tasks.analyze_application_task") as analyze, \
+                self.captureOnCommitCallbacks(execute=True):
+            result = process_chat_completion_task.apply(args=(self.application.id,)).get()
+
+        item = AnalysisQueueItem.objects.get(application=self.application)
+        self.assertEqual(result["task_id"], item.task_id)
+        self.assertTrue(item.chat)
+        analyze.assert_not_called()
+        self.assertEqual(send_task.call_args.kwargs["queue"], QUEUE_CHAT)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """closed -> open после серии ошибок -> half-open с одним пробным вызовом"""
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=60)
+
+    def expire_open_period(self):
+        cache.set(self.breaker._key("opened_at"), time.time() - 61, timeout=None)
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state(), STATE_CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state(), STATE_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: "not called")
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state(), STATE_CLOSED)
+
+    def test_half_open_allows_single_probe(self):
+        self.breaker._open()
+        self.expire_open_period()
+        self.assertEqual(self.breaker.state(), STATE_HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_probe_result_closes_or_reopens(self):
+        self.breaker._open()
+        self.expire_open_period()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state(), STATE_OPEN)
+
+        self.expire_open_period()
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(self.breaker.state(), STATE_CLOSED)
+
+
+class ReplayServiceTests(TestCase):
+    """Очередь повторного анализа разбирается только при доступном LLM"""
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker("test-llm", failure_threshold=1, recovery_timeout=60)
+        self.service = ReplayService(breaker=self.breaker)
+        self.applications = [make_application(email=f"c{i}@example.com") for i in range(3)]
+        for application in self.applications:
+            self.service.enqueue(application.id, "llm_unavailable")
+
+    def drain(self, **kwargs):
+        with mock.patch.object(FairScheduler, "enqueue") as enqueue:
+            drained = self.service.drain(**kwargs)
+        return drained, enqueue
+
+    def test_open_circuit_postpones_replay(self):
+        self.breaker._open()
+        drained, enqueue = self.drain()
+        self.assertEqual(drained, 0)
+        enqueue.assert_not_called()
+
+    def test_closed_circuit_queues_batch_through_scheduler(self):
+        drained, enqueue = self.drain(limit=2)
+        self.assertEqual(drained, 2)
+        enqueue.assert_called_once_with([a.id for a in self.applications[:2]], batch=True)
+        self.assertEqual(AnalysisReplayItem.objects.filter(attempts=1).count(), 2)
+
+    def test_half_open_replays_single_probe(self):
+        self.breaker._open()
+        cache.set(self.breaker._key("opened_at"), time.time() - 61, timeout=None)
+        drained, _ = self.drain()
+        self.assertEqual(drained, 1)
+
+    def test_recent_attempts_wait_for_retry_interval(self):
+        self.drain()
+        drained, _ = self.drain()
+        self.assertEqual(drained, 0)
+
+    def test_resolve_removes_item(self):
+        self.service.resolve(self.applications[0].id)
+        self.assertFalse(AnalysisReplayItem.objects.filter(application=self.applications[0]).exists())
+
+
+class DeadLetterServiceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.service = DeadLetterService()
+        self.application = make_application()
+
+    def test_repeated_failure_updates_entry(self):
+        for _ in range(2):
+            self.service.record("analytics.tasks.llm_evaluate_stage", args=[self.application.id],
+                                exc=RuntimeError("boom"))
+        entry = DeadLetter.objects.get()
+        self.assertEqual((entry.stage, entry.attempts, entry.status), ("llm_evaluate", 2, "pending"))
+
+    def test_terminal_failure_frees_only_dispatched_slot(self):
+        item = AnalysisQueueItem.objects.create(
+            application=self.application, employer=self.application.vacancy.employer, status="dispatched"
+        )
+        self.service.record("analytics.tasks.persist_stage", args=[self.application.id], exc=RuntimeError())
+        self.assertFalse(AnalysisQueueItem.objects.filter(pk=item.pk).exists())
+
+        item = AnalysisQueueItem.objects.create(
+            application=self.application, employer=self.application.vacancy.employer
+        )
+        self.service.record("analytics.tasks.persist_stage", args=[self.application.id], exc=RuntimeError())
+        self.assertTrue(AnalysisQueueItem.objects.filter(pk=item.pk).exists())
+
+    def test_replay_restarts_analysis_once_per_application(self):
+        for task_name in ("analytics.tasks.llm_evaluate_stage", "analytics.tasks.questions_stage"):
+            self.service.record(task_name, args=[self.application.id], exc=RuntimeError(), terminal=False)
+        self.service.record("analytics.tasks.rebuild_funnels_task", exc=RuntimeError())
+
+        with mock.patch.object(FairScheduler, "enqueue") as enqueue, \
+                mock.patch("analytics.services.dead_letter_service.dispatch") as dispatch:
+            replayed = self.service.replay(DeadLetter.objects.order_by("pk"))
+
+        self.assertEqual(replayed, 2)
+        enqueue.assert_called_once_with([self.application.id], batch=True)
+        self.assertEqual(dispatch.call_args.args, ("analytics.tasks.rebuild_funnels_task",))
+        self.assertEqual(set(DeadLetter.objects.values_list("status", flat=True)), {"replayed"})
+
+    def test_finished_analysis_resolves_entries(self):
+        self.service.record("analytics.tasks.notify_stage", args=[self.application.id], exc=RuntimeError())
+        self.service.resolve_application(self.application.id)
+        self.assertEqual(DeadLetter.objects.get().status, "resolved")
+
+    def test_reconcile_records_stuck_applications_once(self):
+        Application.objects.filter(pk=self.application.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(self.service.reconcile(), 1)
+        entry = DeadLetter.objects.get()
+        self.assertEqual((entry.task_name, entry.stage), ("analytics.tasks.analyze_application_task", "reconcile"))
+        # Уже записанный в DLQ отклик повторно не находится
+        self.assertEqual(self.service.reconcile(), 0)
+
+    def test_reconcile_skips_queued_applications(self):
+        Application.objects.filter(pk=self.application.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        AnalysisQueueItem.objects.create(application=self.application, employer=self.application.vacancy.employer)
+        self.assertEqual(self.service.reconcile(), 0)
+
+
+@override_settings(LLM_BUDGET_DAILY_TOKENS=0, LLM_BUDGET_MONTHLY_COST=0,
+                   LLM_BUDGET_FALLBACK_MODEL="gemini-lite", LLM_BUDGET_HARD_LIMIT_RATIO=1.5)
+class LLMBudgetTests(TestCase):
+    """Бюджет работодателя: дешевая модель сверх лимита, затем откладывание"""
+
+    def setUp(self):
+        cache.clear()
+        self.service = LLMBudgetService()
+        self.application = make_application()
+        self.employer_id = self.application.vacancy.employer_id
+
+    def set_budget(self, **fields):
+        EmployerLLMBudget.objects.create(employer_id=self.employer_id, **fields)
+
+    def test_no_limits(self):
+        self.service.charge(self.employer_id, 10 ** 9, Decimal("1000"))
+        self.assertEqual(self.service.decision(self.employer_id), BUDGET_OK)
+
+    def test_daily_tokens_downgrade_then_defer(self):
+        self.set_budget(daily_tokens=1000)
+        self.service.charge(self.employer_id, 999, Decimal("0"))
+        self.assertEqual(self.service.decision(self.employer_id), BUDGET_OK)
+        self.service.charge(self.employer_id, 1, Decimal("0"))
+        self.assertEqual(self.service.decision(self.employer_id), BUDGET_DOWNGRADE)
+        self.service.charge(self.employer_id, 500, Decimal("0"))
+        self.assertEqual(self.service.decision(self.employer_id), BUDGET_DEFER)
+
+    def test_defer_action_and_monthly_cost(self):
+        self.set_budget(monthly_cost=Decimal("10"), over_budget_action="defer")
+        self.service.charge(self.employer_id, 100, Decimal("10.5"))
+        self.assertEqual(self.service.decision(self.employer_id), BUDGET_DEFER)
+        self.assertEqual(self.service.decision(None), BUDGET_OK)
+
+    def test_spent_is_restored_from_daily_rollups(self):
+        self.set_budget(daily_tokens=1000)
+        LLMUsageDaily.objects.create(
+            day=timezone.localdate(), employer_id=self.employer_id, purpose="evaluate", model="gemini",
+            prompt_tokens=900, completion_tokens=200, cost=Decimal("0.5"),
+        )
+        self.assertEqual(self.service.spent(self.employer_id), (1100, Decimal("0.5")))
+        self.assertEqual(self.service.decision(self.employer_id), BUDGET_DOWNGRADE)
+
+    def test_budget_deferred_replay_waits_for_budget(self):
+        self.set_budget(daily_tokens=1000, over_budget_action="defer")
+        self.service.charge(self.employer_id, 1000, Decimal("0"))
+        other = make_application(email="other@example.com")
+        replay = ReplayService(breaker=CircuitBreaker("test-llm"))
+        replay.enqueue(self.application.id, "budget_exceeded")
+        replay.enqueue(other.id, "budget_exceeded")
+
+        with mock.patch.object(FairScheduler, "enqueue") as enqueue:
+            self.assertEqual(replay.drain(), 1)
+        enqueue.assert_called_once_with([other.id], batch=True)
+        self.assertEqual(AnalysisReplayItem.objects.get(application=self.application).attempts, 0)
+
+
+class FunnelRollupTests(TestCase):
+    """Воронки обновляются по дельтам сохранений и совпадают с полным пересчетом"""
+
+    def setUp(self):
+        self.application = make_application()
+        self.vacancy_id = self.application.vacancy_id
+        self.employer_id = self.application.vacancy.employer_id
+
+    def funnel(self):
+        funnel = VacancyFunnel.objects.get(vacancy_id=self.vacancy_id)
+        return funnel.total_applications, funnel.status_counts, funnel.scored_count, funnel.score_histogram
+
+    def test_create_update_delete(self):
+        self.assertEqual(self.funnel()[:2], (1, {"new": 1}))
+
+        application = Application.objects.get(pk=self.application.pk)
+        application.status = "reviewed"
+        application.final_score = 85
+        application.save()
+        total, statuses, scored, histogram = self.funnel()
+        self.assertEqual((total, statuses, scored), (1, {"new": 0, "reviewed": 1}, 1))
+        self.assertEqual(histogram[8], 1)
+
+        application.delete()
+        total, statuses, scored, histogram = self.funnel()
+        self.assertEqual((total, statuses.get("reviewed"), scored, sum(histogram)), (0, 0, 0, 0))
+
+    def test_employer_funnel_follows_vacancies(self):
+        employer = self.application.vacancy.employer
+        other_vacancy = Vacancy.objects.create(employer=employer, title="QA")
+        Application.objects.create(vacancy=other_vacancy, candidate=self.application.candidate)
+        self.assertEqual(EmployerFunnel.objects.get(employer_id=self.employer_id).total_applications, 2)
+
+    def test_rebuild_matches_incremental_and_keeps_llm_usage(self):
+        FunnelService().record_llm_usage(self.vacancy_id, 1500, Decimal("0.25"))
+        Application.objects.filter(pk=self.application.pk).update(status="rejected", final_score=42)
+        incremental_total = self.funnel()[0]
+
+        self.assertEqual(FunnelService().rebuild([self.vacancy_id]), 1)
+        funnel = VacancyFunnel.objects.get(vacancy_id=self.vacancy_id)
+        self.assertEqual(funnel.total_applications, incremental_total)
+        self.assertEqual({k: v for k, v in funnel.status_counts.items() if v}, {"rejected": 1})
+        self.assertEqual((funnel.scored_count, funnel.score_histogram[4]), (1, 1))
+        self.assertEqual((funnel.llm_tokens_total, funnel.llm_cost_total), (1500, Decimal("0.25")))
+        self.assertEqual(EmployerFunnel.objects.get(employer_id=self.employer_id).llm_tokens_total, 1500)
+
+
+@override_settings(ANALYSIS_STAGE_LEASE_SECONDS=900)
+class WorkflowCheckpointTests(TestCase):
+    """Стадии конвейера: результат по отпечатку входов, одна стадия — один исполнитель"""
+
+    def setUp(self):
+        self.service = WorkflowService()
+        self.application = make_application()
+        self.fingerprint = "f" * 64
+
+    def run_stage(self, func):
+        return self.service.run_stage(self.application.id, STAGE_LLM_EVALUATE, self.fingerprint, func)
+
+    def state(self):
+        return AnalysisStageState.objects.get(application=self.application, stage=STAGE_LLM_EVALUATE)
+
+    def test_done_stage_is_restored_from_checkpoint(self):
+        func = mock.Mock(return_value={"score": 70})
+        self.assertEqual(self.run_stage(func), {"score": 70})
+        self.assertEqual(self.run_stage(func), {"score": 70})
+        func.assert_called_once()
+
+    def test_failed_stage_is_retried(self):
+        with self.assertRaises(RuntimeError):
+            self.run_stage(mock.Mock(side_effect=RuntimeError("boom")))
+        self.assertEqual(self.state().status, "failed")
+
+        self.assertEqual(self.run_stage(lambda: {"score": 1}), {"score": 1})
+        self.assertEqual((self.state().status, self.state().attempts), ("done", 2))
+
+    def test_running_stage_is_not_run_twice(self):
+        AnalysisStageState.objects.create(application=self.application, stage=STAGE_LLM_EVALUATE,
+                                          fingerprint=self.fingerprint, status="running")
+        func = mock.Mock()
+        with self.assertRaises(StageInProgress):
+            self.run_stage(func)
+        func.assert_not_called()
+
+    def test_abandoned_stage_is_reclaimed_after_lease(self):
+        state = AnalysisStageState.objects.create(application=self.application, stage=STAGE_LLM_EVALUATE,
+                                                  fingerprint=self.fingerprint, status="running")
+        AnalysisStageState.objects.filter(pk=state.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.run_stage(lambda: {"score": 5}), {"score": 5})
+
+    def test_fingerprint_follows_inputs(self):
+        before = analysis_fingerprint(self.application)
+        self.assertEqual(analysis_fingerprint(self.application), before)
+        self.assertNotEqual(analysis_fingerprint(self.application, ["Вопрос: ?\nОтвет: да"]), before)
+        self.application.candidate.resume_text = "Python"
+        self.assertNotEqual(analysis_fingerprint(self.application), before)
+
+
+@override_settings(LLM_USAGE_BUFFER_BACKEND="memory", LLM_DELTA_REEVALUATION_ENABLED=True)
+class DeltaReevaluationTests(TestCase):
+    """После чата переоценка идет от прошлого результата и только по новым ответам"""
+
+    def setUp(self):
+        from analytics.services.workflow_service import analysis_inputs_hash
+
+        cache.clear()
+        self.application = make_application()
+        self.inputs_hash = analysis_inputs_hash(self.application)
+        self.result = RelevanceResult.objects.create(
+            application=self.application, score=60, summary="Подходит частично",
+            metadata={"inputs_hash": self.inputs_hash, "chat_evaluated_message_id": 10},
+        )
+
+    def test_base_requires_same_inputs_and_full_result(self):
+        from analytics.tasks import _delta_base
+
+        self.assertEqual(_delta_base(self.application, self.inputs_hash), self.result)
+        self.assertIsNone(_delta_base(self.application, "other-hash"))
+
+        RelevanceResult.objects.filter(pk=self.result.pk).update(
+            metadata={"inputs_hash": self.inputs_hash, "degraded": True}
+        )
+        self.assertIsNone(_delta_base(self.application, self.inputs_hash))
+
+    def test_only_new_answers_are_sent(self):
+        from analytics.tasks import _delta_evaluation
+
+        model = FakeModel('{"score": 75, "summary": "Готов к переезду", "delta": "+15"}')
+        items = [(9, "Q: old"), (11, "Q: new 1"), (12, "Q: new 2")]
+        output = _delta_evaluation(make_llm_client(model), self.result, items, self.inputs_hash)
+
+        self.assertNotIn("Q: old", model.prompts[0])
+        self.assertIn("Q: new 2", model.prompts[0])
+        self.assertEqual((output["score"], output["score_delta"]), (75.0, 15.0))
+        self.assertEqual(output["chat_evaluated_message_id"], 12)
+
+    def test_no_new_answers_keeps_score_without_llm_call(self):
+        from analytics.tasks import _delta_evaluation
+
+        model = FakeModel()
+        output = _delta_evaluation(make_llm_client(model), self.result, [(10, "Q: old")], self.inputs_hash)
+        self.assertEqual((output["score"], output["score_delta"]), (60.0, 0.0))
+        self.assertEqual(model.prompts, [])
+
+    def test_invalid_delta_response_raises(self):
+        client = make_llm_client(FakeModel('{"score": 140, "summary": "?"}'))
+        with self.assertRaises(LLMResponseError):
+            client.evaluate_delta(60, "summary", ["Q: A"])
+
+
+class ConversationMemoryTests(TestCase):
+    """Память диалога: размер контекста не растет с длиной переписки"""
+
+    def setUp(self):
+        self.chat_session = ChatSession.objects.create(application=make_application())
+
+    def add_turns(self, count, start=0):
+        for i in range(start, start + count):
+            BotMessage.objects.create(chat_session=self.chat_session, sender="bot", text=f"Вопрос {i} " + "x" * 100)
+            BotMessage.objects.create(chat_session=self.chat_session, sender="candidate", text=f"Ответ {i}")
+
+    def memory(self):
+        return ConversationMemory(self.chat_session, recent_turns=4, summary_max_chars=300).sync()
+
+    def test_recent_turns_kept_verbatim_and_older_folded(self):
+        self.add_turns(5)
+        memory = self.memory()
+        self.assertEqual([t["text"] for t in memory.state["recent"]][-1], "Ответ 4")
+        self.assertEqual(len(memory.state["recent"]), 4)
+        self.assertEqual(memory.state["summary"][-1], "Кандидат: Ответ 2")
+        self.assertLessEqual(sum(len(line) + 1 for line in memory.state["summary"]), 300)
+
+    def test_context_size_is_bounded(self):
+        self.add_turns(5)
+        short = len(self.memory().context())
+        self.add_turns(50, start=5)
+        memory = self.memory()
+        self.assertGreater(memory.state["dropped"], 0)
+        self.assertLess(len(memory.context()), short + 400)
+
+    def test_sync_is_incremental_and_persisted(self):
+        self.add_turns(2)
+        memory = self.memory()
+        last_id = memory.state["last_message_id"]
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.session_data["memory"]["last_message_id"], last_id)
+
+        self.add_turns(1, start=2)
+        memory = ConversationMemory(self.chat_session, recent_turns=4, summary_max_chars=300).sync()
+        self.assertEqual(memory.state["recent"][-1]["text"], "Ответ 2")
+        self.assertGreater(memory.state["last_message_id"], last_id)
+
+    def test_extracted_facts_survive_folding(self):
+        question = BotMessage.objects.create(chat_session=self.chat_session, sender="bot", text="Зарплата?")
+        BotMessage.objects.create(chat_session=self.chat_session, sender="candidate", text="300к",
+                                  parent_message=question)
+        CandidateResponse.objects.create(
+            application=self.chat_session.application, question_message=question, answer_text="300к",
+            extracted_data={"salary": {"amount": 300000, "currency": "KZT"}},
+        )
+        self.memory()
+        self.add_turns(20)
+        memory = self.memory()
+        self.assertEqual(memory.state["facts"]["salary"]["amount"], 300000)
+        self.assertTrue(memory.context().startswith("Факты из ответов кандидата: salary="))
+
+
+class QuestionBankTests(TestCase):
+    """Банк вопросов: LLM вызывается только для новой сигнатуры расхождений"""
+
+    LOCATION = "Локация: вакансия в Алматы, кандидат в Астана"
+    EXPERIENCE = "Опыт: требуется 3 лет, у кандидата 1"
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        application = make_application()
+        self.vacancy, self.candidate = application.vacancy, application.candidate
+        self.vacancy.city, self.vacancy.experience_years = "Алматы", 3
+        self.candidate.city = "Астана"
+        self.llm = mock.NonCallableMock()
+
+    def test_signature_ignores_order_and_relocation_ready(self):
+        self.assertEqual(discrepancy_signature([self.LOCATION, self.EXPERIENCE]),
+                         discrepancy_signature([self.EXPERIENCE, self.LOCATION]))
+        self.assertEqual(discrepancy_signature([self.LOCATION + " (готов к переезду)"]), "")
+
+    def test_curated_templates_skip_llm(self):
+        questions, source = QuestionBank(self.llm).get_questions(self.vacancy, self.candidate, [self.LOCATION])
+        self.assertEqual(source, "curated")
+        self.assertIn("Алматы", questions[0])
+        self.assertIn("Астана", questions[0])
+        self.llm.generate_questions.assert_not_called()
+
+    def test_llm_questions_are_learned_as_templates(self):
+        discrepancies = ["Навыки: нет опыта с Kubernetes"]
+        self.llm.generate_questions.return_value = ["Работали ли вы с Kubernetes вне Алматы?"]
+        questions, source = QuestionBank(self.llm).get_questions(self.vacancy, self.candidate, discrepancies)
+        self.assertEqual(source, "llm")
+        self.assertEqual(QuestionTemplate.objects.get(signature="other").templates,
+                         ["Работали ли вы с Kubernetes вне {vacancy_city}?"])
+
+        self.vacancy.city = "Шымкент"
+        questions, source = QuestionBank(self.llm).get_questions(self.vacancy, self.candidate, discrepancies)
+        self.assertEqual((questions, source), (["Работали ли вы с Kubernetes вне Шымкент?"], "learned"))
+        self.assertEqual(self.llm.generate_questions.call_count, 1)
+        self.assertEqual(QuestionTemplate.objects.get(signature="other").hits, 1)
+
+    def test_templatize_escapes_braces_and_skips_short_values(self):
+        self.assertEqual(templatize("Алматы {x} 3 года", {"vacancy_city": "Алматы", "vacancy_years": "3"}),
+                         "{vacancy_city} {{x}} {vacancy_years} года")
@@ -1,7 +1,20 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import RelevanceResultViewSet
+from .views import (
+    RelevanceResultViewSet, VacancyFunnelViewSet, EmployerFunnelViewSet, DeadLetterViewSet,
+    queue_metrics_view, llm_status_view, scheduler_status_view, llm_budget_view,
+)
 
 router = DefaultRouter()
+# Именованные префиксы регистрируются до пустого, иначе их перехватит detail-маршрут
+router.register(r'funnels/vacancies', VacancyFunnelViewSet, basename='vacancy-funnel')
+router.register(r'funnels/employers', EmployerFunnelViewSet, basename='employer-funnel')
+router.register(r'dead-letters', DeadLetterViewSet, basename='dead-letter')
 router.register(r'', RelevanceResultViewSet, basename='relevance')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('queues/metrics/', queue_metrics_view, name='queue-metrics'),
+    path('llm/status/', llm_status_view, name='llm-status'),
+    path('llm/scheduler/', scheduler_status_view, name='llm-scheduler'),
+    path('llm/budget/', llm_budget_view, name='llm-budget'),
+] + router.urls
@@ -1,10 +1,137 @@
-from rest_framework import viewsets
-from .models import RelevanceResult
-from .serializers import RelevanceResultSerializer
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from datetime import timedelta
+
+from rest_framework import viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.response import Response
+from django_filters.rest_framework import DjangoFilterBackend
+from .models import RelevanceResult, VacancyFunnel, EmployerFunnel, DeadLetter
+from .serializers import (
+    RelevanceResultSerializer, VacancyFunnelSerializer, EmployerFunnelSerializer, DeadLetterSerializer
+)
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from project.authentication import user_employer_id
 from project.permissions import IsOwnerOrReadOnly
+from .services.queue_metrics import queue_metrics
+from .services.replay_service import ReplayService
+from .services.dead_letter_service import DeadLetterService
+from .services.fair_scheduler import FairScheduler
+from .services.llm_budget import LLMBudgetService
 
 class RelevanceResultViewSet(viewsets.ModelViewSet):
     queryset = RelevanceResult.objects.select_related('application').all()
     serializer_class = RelevanceResultSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+
+
+class VacancyFunnelViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Воронка откликов по вакансии (готовый rollup, без GROUP BY по откликам).
+    """
+    queryset = VacancyFunnel.objects.all().order_by('vacancy_id')
+    serializer_class = VacancyFunnelSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    lookup_field = 'vacancy'
+
+
+class EmployerFunnelViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Воронка откликов по работодателю.
+    """
+    queryset = EmployerFunnel.objects.all().order_by('employer_id')
+    serializer_class = EmployerFunnelSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    lookup_field = 'employer'
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def queue_metrics_view(request):
+    """
+    Глубина и время ожидания по очередям Celery.
+    """
+    return Response(queue_metrics())
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def llm_status_view(request):
+    """
+    Состояние предохранителя LLM и размер очереди повторного анализа.
+    """
+    return Response(ReplayService().stats())
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def scheduler_status_view(request):
+    """
+    Очередь справедливого планировщика анализа по работодателям:
+    ожидающие, в работе, время ожидания до отправки.
+    """
+    return Response(FairScheduler().stats())
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def llm_budget_view(request):
+    """
+    Бюджет LLM работодателя и расход за текущий день и месяц.
+    """
+    employer_id = user_employer_id(request.user)
+    if employer_id is None:
+        return Response({"detail": "Employer profile not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(LLMBudgetService().status(employer_id))
+
+
+class DeadLetterViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Упавшие задачи анализа (DLQ): просмотр, перезапуск, сверка.
+    """
+    queryset = DeadLetter.objects.all()
+    serializer_class = DeadLetterSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status', 'task_name', 'stage', 'application', 'exception_type']
+
+    @action(detail=True, methods=['POST'])
+    def replay(self, request, pk=None):
+        entry = self.get_object()
+        dispatched = DeadLetterService().replay([entry])
+        return Response({'dispatched': dispatched})
+
+    @action(detail=False, methods=['POST'], url_path='replay-bulk')
+    def replay_bulk(self, request):
+        """
+        Перезапуск по фильтрам (по умолчанию — все ожидающие).
+        Параметры: limit, rate (задач в секунду).
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if 'status' not in request.query_params:
+            queryset = queryset.filter(status='pending')
+        try:
+            limit = int(request.data.get('limit', 500))
+            rate = float(request.data['rate']) if request.data.get('rate') else None
+        except (TypeError, ValueError):
+            return Response({'error': 'limit and rate must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if rate is not None and rate <= 0:
+            return Response({'error': 'rate must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = list(queryset.order_by('created_at')[:limit])
+        dispatched = DeadLetterService().replay(entries, rate_per_second=rate)
+        return Response({'entries': len(entries), 'dispatched': dispatched})
+
+    @action(detail=True, methods=['POST'])
+    def discard(self, request, pk=None):
+        DeadLetterService().discard([self.get_object()])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['POST'])
+    def reconcile(self, request):
+        """Сверка: записывает в DLQ отклики без завершенного анализа"""
+        try:
+            minutes = int(request.data.get('older_than_minutes', 0)) or None
+        except (TypeError, ValueError):
+            return Response({'error': 'older_than_minutes must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        found = DeadLetterService().reconcile(timedelta(minutes=minutes) if minutes else None)
+        return Response({'stuck_applications': found})
@@ -1,7 +1,7 @@
 # candidates/admin.py
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Candidate, Application, ChatSession, BotMessage, CandidateResponse
+from .models import Candidate, Application, ChatSession, BotMessage, CandidateResponse, ArchivedTranscript
 
 
 @admin.register(Candidate)
@@ -15,11 +15,16 @@ class CandidateAdmin(admin.ModelAdmin):
         'willing_to_relocate', 'created_at'
     ]
     search_fields = ['name', 'email', 'resume_text']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'email_normalized', 'phone_normalized']
+    raw_id_fields = ['duplicate_of']
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'email', 'phone', 'city')
         }),
+        ('Дубликаты', {
+            'fields': ('duplicate_of', 'email_normalized', 'phone_normalized'),
+            'classes': ('collapse',)
+        }),
         ('Профессиональная информация', {
             'fields': (
                 'resume_text', 'experience_years', 'education',
@@ -163,6 +168,16 @@ class CandidateResponseAdmin(admin.ModelAdmin):
     answer_preview.short_description = 'Ответ'
 
 
+
+@admin.register(ArchivedTranscript)
+class ArchivedTranscriptAdmin(admin.ModelAdmin):
+    list_display = ['chat_session', 'codec', 'message_count', 'raw_size', 'compressed_size', 'archived_at']
+    list_filter = ['codec']
+    readonly_fields = ['codec', 'message_count', 'raw_size', 'compressed_size', 'archived_at']
+    exclude = ['payload']
+    raw_id_fields = ['chat_session']
+
+
 # Опционально: можно добавить кастомные действия
 def mark_chat_sessions_completed(modeladmin, request, queryset):
     for session in queryset:
@@ -0,0 +1,270 @@
+# candidates/async_views.py
+"""
+Асинхронные представления для чата и опроса результатов анализа.
+
+Работают нативно на ASGI-стеке (project/asgi.py): чтение идет через
+async ORM, синхронные участки (запись ответа в транзакции, отправка
+задачи в брокер) выполняются в пуле потоков, не занимая event loop.
+Формат ответов совпадает с прежними действиями DRF-вьюсетов; политики DRF
+(аутентификация, права, троттлинг из REST_FRAMEWORK) применяются так же.
+"""
+import asyncio
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.views import APIView
+
+from analytics.models import RelevanceResult
+from analytics.services.chat_service import get_chat_service
+from project.celery import TASK_PROCESS_CHAT_COMPLETION, dispatch
+from project.response_cache import acached_json, analysis_scope
+from .models import Application, ArchivedTranscript, BotMessage, ChatSession
+from .serializers import PrefetchedChatMessageSerializer
+from .services.archive_service import transcript_messages
+from .services.analysis_events import AnalysisEventSubscription, EVENT_ANALYSIS_COMPLETE, EventState
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _check_drf_policies(request, args, kwargs):
+    """
+    Аутентификация, права и троттлинг по настройкам DRF, как в APIView.initial
+    (без согласования формата: SSE-ответы не проходят через рендереры).
+    Пользователь выставляется в request.user. Возвращает ответ с ошибкой или None.
+    """
+    view = APIView()
+    view.args, view.kwargs, view.headers = args, kwargs, {}
+    drf_request = view.initialize_request(request, *args, **kwargs)
+    view.request = drf_request
+    try:
+        view.perform_authentication(drf_request)
+        view.check_permissions(drf_request)
+        view.check_throttles(drf_request)
+    except exceptions.APIException as e:
+        response = JsonResponse({"detail": e.detail}, status=e.status_code)
+        if isinstance(e, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            auth_header = view.get_authenticate_header(drf_request)
+            if auth_header:
+                response['WWW-Authenticate'] = auth_header
+            else:
+                response.status_code = 403
+        if getattr(e, 'wait', None):
+            response['Retry-After'] = '%d' % e.wait
+        return response
+    return None
+
+
+def async_api_view(methods):
+    """
+    Аналог @api_view для async-функций: проверка метода, CSRF-исключение
+    (как у APIView), аутентификация/права/троттлинг DRF, ответы об ошибках
+    в формате DRF ({"detail": ...}).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse(
+                    {"detail": f'Метод "{request.method}" не разрешен.'}, status=405
+                )
+            denied = await sync_to_async(_check_drf_policies)(request, args, kwargs)
+            if denied is not None:
+                return denied
+            try:
+                return await view(request, *args, **kwargs)
+            except ObjectDoesNotExist:
+                return JsonResponse({"detail": "Не найдено."}, status=404)
+            except BadRequest as e:
+                return JsonResponse({"detail": str(e)}, status=400)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def _request_data(request) -> dict:
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise BadRequest("Некорректный JSON")
+        if not isinstance(data, dict):
+            raise BadRequest("Ожидался JSON-объект")
+        return data
+    return request.POST
+
+
+async def _dispatch(task_name: str, *args):
+    # Публикация в брокер — сетевой вызов, выполняем вне event loop
+    await sync_to_async(dispatch, thread_sensitive=False)(task_name, *args)
+
+
+def _after_seq(request) -> int:
+    try:
+        return int(request.GET.get('after_seq', 0))
+    except ValueError:
+        raise BadRequest("Некорректный after_seq")
+
+
+@async_api_view(['GET'])
+async def chat_messages(request, pk):
+    """
+    Получение сообщений чат-сессии.
+    ?after_seq=N — только сообщения с seq > N (дозагрузка после переподключения,
+    диапазонное чтение по индексу (chat_session, seq)).
+    """
+    after_seq = _after_seq(request)
+    await ChatSession.objects.filter(pk=pk).values('pk').aget()
+
+    # Переписка старых сессий хранится в сжатом архиве
+    archived = await ArchivedTranscript.objects.filter(chat_session_id=pk).afirst()
+    if archived is not None:
+        messages = await sync_to_async(transcript_messages, thread_sensitive=False)(archived)
+        if after_seq:
+            messages = [m for m in messages if (m.get('seq') or 0) > after_seq]
+        return JsonResponse(messages, safe=False)
+
+    queryset = BotMessage.objects.filter(chat_session_id=pk)
+    if after_seq:
+        queryset = queryset.filter(seq__gt=after_seq)
+    messages = [
+        message async for message in
+        queryset.order_by(F('seq').asc(nulls_first=True), 'created_at', 'id')
+    ]
+    question_ids = [m.pk for m in messages if m.is_question]
+    answered_ids = {
+        question_id async for question_id in
+        BotMessage.objects.filter(
+            parent_message_id__in=question_ids, sender='candidate'
+        ).values_list('parent_message_id', flat=True)
+    } if question_ids else set()
+    serializer = PrefetchedChatMessageSerializer(
+        messages, many=True, context={'answered_ids': answered_ids}
+    )
+    return JsonResponse(serializer.data, safe=False)
+
+
+@async_api_view(['POST'])
+async def chat_send_message(request, pk):
+    """
+    Отправка сообщения от кандидата в чат-сессию.
+    """
+    chat_session = await ChatSession.objects.only('id', 'is_active', 'application_id').aget(pk=pk)
+
+    if not chat_session.is_active:
+        return JsonResponse({"detail": "Чат-сессия завершена"}, status=400)
+
+    message_text = str(_request_data(request).get('message', '')).strip()
+    if not message_text:
+        return JsonResponse({"detail": "Сообщение не может быть пустым"}, status=400)
+
+    # Запись ответа и разбор выполняются транзакционно в синхронном коде сервиса.
+    # Финальный анализ после последнего ответа запускает сам сервис
+    result = await sync_to_async(get_chat_service().process_candidate_response)(chat_session.id, message_text)
+
+    return JsonResponse(result)
+
+
+@async_api_view(['POST'])
+async def chat_complete(request, pk):
+    """
+    Принудительное завершение чат-сессии.
+    """
+    chat_session = await ChatSession.objects.select_related('application').aget(pk=pk)
+
+    if not chat_session.is_active:
+        return JsonResponse({"detail": "Чат-сессия уже завершена"}, status=400)
+
+    await sync_to_async(chat_session.mark_completed)()
+    await _dispatch(TASK_PROCESS_CHAT_COMPLETION, chat_session.application_id)
+
+    return JsonResponse({"detail": "Чат-сессия завершена"})
+
+
+@async_api_view(['GET'])
+async def application_analysis_results(request, pk):
+    """
+    Получение результатов анализа отклика.
+    """
+    async def build():
+        result = await RelevanceResult.objects.filter(application_id=pk).values(
+            'score', 'summary', 'reasons', 'created_at'
+        ).afirst()
+        if result is None:
+            await Application.objects.filter(pk=pk).values('pk').aget()
+            return {"detail": "Результаты анализа еще не готовы"}, 404
+        return result, 200
+
+    # Опрос во время анализа: повторные запросы отвечают из кэша или 304
+    return await acached_json(request, [analysis_scope(pk)], build)
+
+
+def _events_timeout(request) -> float:
+    default = getattr(settings, 'ANALYSIS_EVENTS_POLL_TIMEOUT', 25)
+    try:
+        timeout = float(request.GET.get('timeout', default))
+    except ValueError:
+        raise BadRequest("Некорректный timeout")
+    return max(0.0, min(timeout, getattr(settings, 'ANALYSIS_EVENTS_MAX_TIMEOUT', 60)))
+
+
+def _sse(event_type: str, data: dict, event_id: str) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def _event_stream(application_id: int, known: EventState):
+    """
+    SSE-поток: события по мере появления, комментарий-heartbeat в паузах.
+    Закрывается после analysis.complete или по ANALYSIS_EVENTS_SSE_MAX_SECONDS
+    (клиент переподключается с Last-Event-ID).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, 'ANALYSIS_EVENTS_SSE_MAX_SECONDS', 300)
+    heartbeat = getattr(settings, 'ANALYSIS_EVENTS_SSE_HEARTBEAT', 15)
+
+    async with AnalysisEventSubscription(application_id) as subscription:
+        yield "retry: 3000\n\n"
+        while (remaining := deadline - loop.time()) > 0:
+            events, state = await subscription.next_events(known, min(heartbeat, remaining))
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            known = state
+            for event in events:
+                yield _sse(event["type"], event["data"], state.token)
+            if any(event["type"] == EVENT_ANALYSIS_COMPLETE for event in events):
+                return
+
+
+@async_api_view(['GET'])
+async def application_analysis_events(request, pk):
+    """
+    Ожидание завершения анализа без WebSocket.
+
+    Long-poll (по умолчанию): ответ {"events": [...], "token": "..."} приходит,
+    как только есть analysis.complete / chat.initialized новее токена since,
+    либо по истечении timeout с пустым списком событий.
+    SSE: Accept: text/event-stream (или ?stream=sse), возобновление — Last-Event-ID.
+    """
+    await Application.objects.filter(pk=pk).values('pk').aget()
+    known = EventState.from_token(request.GET.get('since') or request.META.get('HTTP_LAST_EVENT_ID'))
+
+    if request.GET.get('stream') == 'sse' or 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+        response = StreamingHttpResponse(_event_stream(pk, known), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    timeout = _events_timeout(request)
+    async with AnalysisEventSubscription(pk) as subscription:
+        events, state = await subscription.next_events(known, timeout)
+    return JsonResponse({"events": events, "token": state.token}, encoder=DjangoJSONEncoder)
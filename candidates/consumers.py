@@ -4,7 +4,7 @@ from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from utils.ws_token import verify_ws_token
 from candidates.models import Application, BotMessage
 from asgiref.sync import sync_to_async
-from analytics.tasks import process_candidate_message_task
+from candidates.services.event_buffer import apublish_application_event, get_event_buffer, parse_event_id
 
 class ApplicationConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
@@ -28,6 +28,37 @@ class ApplicationConsumer(AsyncJsonWebsocketConsumer):
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
+        # Возобновление: досылаем события после last_event_id из буфера.
+        # Живые события, пришедшие в группу во время досылки, обработаются
+        # после connect и отсеются по id.
+        self.last_event_id = params.get("last_event_id") or None
+        if self.last_event_id:
+            await self.replay_missed_events()
+
+    async def replay_missed_events(self):
+        try:
+            events, truncated = await sync_to_async(get_event_buffer().read_after, thread_sensitive=False)(
+                self.application_id, self.last_event_id
+            )
+        except Exception:
+            await self.send_json({"type": "resync.required"})
+            return
+        if truncated:
+            # Часть пропущенного вытеснена из буфера — клиенту нужна перезагрузка по REST
+            await self.send_json({"type": "resync.required"})
+        for event_id, message in events:
+            await self.dispatch({**message, "event_id": event_id})
+
+    async def send_event(self, event, payload):
+        """Отправка события клиенту с id из буфера (повторы после досылки отбрасываются)"""
+        event_id = event.get("event_id")
+        if event_id:
+            if self.last_event_id and parse_event_id(event_id) <= parse_event_id(self.last_event_id):
+                return
+            self.last_event_id = event_id
+            payload = {**payload, "id": event_id}
+        await self.send_json(payload)
+
     async def disconnect(self, close_code):
         if hasattr(self, "group_name"):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
@@ -41,35 +72,28 @@ class ApplicationConsumer(AsyncJsonWebsocketConsumer):
             if not text:
                 await self.send_json({"type": "error", "message": "empty_message"})
                 return
-            # сохранить сообщение синхронно в БД
+            # сохранить сообщение синхронно в БД; ответы на вопросы чата
+            # (разбор, следующий вопрос, финальный анализ) обрабатывает
+            # POST /chat-sessions/<id>/send_message/
             await sync_to_async(BotMessage.objects.create)(
                 application_id=self.application_id,
                 sender="candidate",
                 text=text,
                 metadata=meta,
             )
-            # триггерить фоновую задачу, чтобы LLM сгенерировал ответ/вопрос
-            try:
-                await process_candidate_message_task.delay(self.application_id, text, meta)
-            except Exception:
-                # если Celery недоступен — можно вызвать обработчик локально (не делаем здесь)
-                pass
 
             # подтвердить приём
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "message.from.candidate",
-                    "text": text,
-                    "meta": meta,
-                }
-            )
+            await apublish_application_event(self.application_id, {
+                "type": "message.from.candidate",
+                "text": text,
+                "meta": meta,
+            }, channel_layer=self.channel_layer)
         else:
             await self.send_json({"type": "error", "message": "unknown_type"})
 
     # group message handler to broadcast candidate message back if needed
     async def message_from_candidate(self, event):
-        await self.send_json({
+        await self.send_event(event, {
             "type": "candidate.message",
             "text": event["text"],
             "meta": event.get("meta", {}),
@@ -77,7 +101,7 @@ class ApplicationConsumer(AsyncJsonWebsocketConsumer):
 
     # бот отправляет сообщения в группу (see tasks)
     async def bot_message(self, event):
-        await self.send_json({
+        await self.send_event(event, {
             "type": "bot.message",
             "text": event["text"],
             "meta": event.get("meta", {}),
@@ -85,9 +109,16 @@ class ApplicationConsumer(AsyncJsonWebsocketConsumer):
 
     # relevance update
     async def relevance_update(self, event):
-        await self.send_json({
+        await self.send_event(event, {
             "type": "relevance.update",
             "score": event["score"],
             "reasons": event.get("reasons", []),
             "summary": event.get("summary", ""),
         })
+
+    # события конвейера анализа (see analytics.tasks notify/chat_init)
+    async def analysis_complete(self, event):
+        await self.send_event(event, {"type": "analysis.complete", **event.get("data", {})})
+
+    async def chat_initialized(self, event):
+        await self.send_event(event, {"type": "chat.initialized", **event.get("data", {})})
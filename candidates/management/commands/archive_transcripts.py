@@ -0,0 +1,28 @@
+# candidates/management/commands/archive_transcripts.py
+from django.core.management.base import BaseCommand
+
+from candidates.services.archive_service import TranscriptArchiveService
+
+
+class Command(BaseCommand):
+    help = "Переносит переписку старых завершенных чат-сессий в сжатый архив"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="Срок без активности, дней (по умолчанию CHAT_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--limit", type=int, default=None, help="Не более N сессий за запуск")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только посчитать сессии, подходящие для архивации")
+
+    def handle(self, *args, **options):
+        service = TranscriptArchiveService(retention_days=options["days"], batch_size=options["batch_size"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"Eligible sessions: {service.eligible_sessions().count()}")
+            return
+
+        result = service.run(limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result['sessions']} sessions ({result['messages']} messages)"
+        ))
@@ -0,0 +1,80 @@
+# candidates/management/commands/backfill_message_seq.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Q
+
+from candidates.models import BotMessage, ChatSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Проставляет BotMessage.seq для старых сообщений: legacy-сообщения отклика "
+        "привязываются к его чат-сессии, ненумерованные сообщения получают номера "
+        "после уже выданных (выданные номера не меняются)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только посчитать сессии, которым нужна нумерация")
+
+    def sessions_to_backfill(self):
+        """Сессии с ненумерованными сообщениями или legacy-сообщениями отклика"""
+        return (
+            ChatSession.objects
+            .filter(Q(messages__seq__isnull=True) |
+                    Q(application__messages__chat_session__isnull=True))
+            .order_by("pk")
+            .values_list("pk", "application_id")
+            .distinct()
+        )
+
+    def backfill_session(self, chat_session_id, application_id) -> int:
+        """
+        Нумерует ненумерованные сообщения одной сессии в короткой транзакции.
+        Уже выданные номера не меняются (клиенты держат их как курсоры after_seq),
+        новые продолжают максимальный номер сессии.
+        """
+        with transaction.atomic():
+            # Блокировка сессии: новые сообщения (allocate_seq) ждут окончания нумерации
+            last_seq = (
+                ChatSession.objects.select_for_update().filter(pk=chat_session_id)
+                .values_list("last_seq", flat=True).get()
+            )
+
+            BotMessage.objects.filter(
+                application_id=application_id, chat_session__isnull=True
+            ).update(chat_session_id=chat_session_id)
+
+            max_seq = BotMessage.objects.filter(
+                chat_session_id=chat_session_id
+            ).aggregate(m=Max("seq"))["m"] or 0
+            messages = list(
+                BotMessage.objects.filter(chat_session_id=chat_session_id, seq__isnull=True)
+                .order_by("created_at", "id").only("pk", "seq")
+            )
+            start = max(last_seq, max_seq)
+            for seq, message in enumerate(messages, start + 1):
+                message.seq = seq
+            BotMessage.objects.bulk_update(messages, ["seq"], batch_size=500)
+            ChatSession.objects.filter(pk=chat_session_id).update(last_seq=start + len(messages))
+        return len(messages)
+
+    def handle(self, *args, **options):
+        sessions = self.sessions_to_backfill()
+        if options["dry_run"]:
+            self.stdout.write(f"Sessions to backfill: {sessions.count()}")
+            return
+
+        total_sessions = total_messages = 0
+        for chat_session_id, application_id in sessions.iterator(chunk_size=options["chunk_size"]):
+            total_messages += self.backfill_session(chat_session_id, application_id)
+            total_sessions += 1
+            if total_sessions % 1000 == 0:
+                self.stdout.write(f"  {total_sessions} sessions...")
+
+        legacy_left = BotMessage.objects.filter(chat_session__isnull=True).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {total_sessions} sessions ({total_messages} messages); "
+            f"{legacy_left} legacy messages without a chat session left as is"
+        ))
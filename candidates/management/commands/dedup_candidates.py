@@ -0,0 +1,76 @@
+# candidates/management/commands/dedup_candidates.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from candidates.models import Candidate
+from candidates.services.dedup_service import DedupService
+
+
+class Command(BaseCommand):
+    help = "Индексирует резюме (MinHash/LSH) и кластеризует дубликаты кандидатов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=float, default=None,
+                            help="Порог похожести резюме (по умолчанию DEDUP_SIMILARITY_THRESHOLD)")
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--skip-index", action="store_true",
+                            help="Не пересчитывать сигнатуры, использовать сохраненные")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только показать найденные кластеры")
+
+    def handle(self, *args, **options):
+        service = DedupService(threshold=options["threshold"])
+        chunk_size = options["chunk_size"]
+
+        # 1. Индексация
+        if not options["skip_index"]:
+            indexed = 0
+            for candidate in Candidate.objects.order_by("pk").iterator(chunk_size=chunk_size):
+                service.index_candidate(candidate)
+                indexed += 1
+            self.stdout.write(f"Indexed {indexed} candidates")
+
+        # 2. Кластеризация (union-find по найденным парам дубликатов)
+        parent = {}
+
+        def find(pk):
+            parent.setdefault(pk, pk)
+            while parent[pk] != pk:
+                parent[pk] = parent[parent[pk]]
+                pk = parent[pk]
+            return pk
+
+        def union(a, b):
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                # Корнем кластера всегда становится самый ранний кандидат
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        for candidate in Candidate.objects.order_by("pk").iterator(chunk_size=chunk_size):
+            for duplicate, _similarity in service.find_duplicates(candidate):
+                union(candidate.pk, duplicate.pk)
+
+        clusters = {}
+        for pk in parent:
+            clusters.setdefault(find(pk), []).append(pk)
+        clusters = {root: members for root, members in clusters.items() if len(members) > 1}
+
+        self.stdout.write(f"Found {len(clusters)} duplicate clusters")
+        if options["dry_run"]:
+            for root, members in sorted(clusters.items()):
+                self.stdout.write(f"  {root}: {sorted(members)}")
+            return
+
+        # 3. Сохранение связей duplicate_of
+        updates = []
+        for candidate in Candidate.objects.only("pk", "duplicate_of").order_by("pk").iterator(chunk_size=chunk_size):
+            root = find(candidate.pk) if candidate.pk in parent else candidate.pk
+            duplicate_of_id = root if root != candidate.pk else None
+            if candidate.duplicate_of_id != duplicate_of_id:
+                candidate.duplicate_of_id = duplicate_of_id
+                updates.append(candidate)
+
+        with transaction.atomic():
+            Candidate.objects.bulk_update(updates, ["duplicate_of"], batch_size=chunk_size)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {len(updates)} candidates"))
@@ -0,0 +1,36 @@
+# candidates/management/commands/import_candidates.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from candidates.services.intake_service import BulkIntakeService, SUPPORTED_FORMATS, detect_format
+
+
+class Command(BaseCommand):
+    help = "Потоковый импорт кандидатов и откликов из файла JSONL/CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу импорта")
+        parser.add_argument("--format", dest="fmt", choices=SUPPORTED_FORMATS, default=None,
+                            help="Формат файла (по умолчанию определяется по расширению)")
+        parser.add_argument("--vacancy", type=int, default=None,
+                            help="Вакансия для строк без vacancy_id")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--no-analysis", action="store_true",
+                            help="Не ставить анализ откликов в очередь")
+
+    def handle(self, *args, **options):
+        fmt = options["fmt"] or detect_format(options["path"])
+        service = BulkIntakeService(
+            default_vacancy_id=options["vacancy"],
+            batch_size=options["batch_size"],
+            dispatch_analysis=not options["no_analysis"],
+        )
+
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+                report = service.run(stream, fmt)
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2, default=str))
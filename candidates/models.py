@@ -1,5 +1,7 @@
 # candidates/models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.core.validators import MinValueValidator, MaxValueValidator
 from jobs.models import Vacancy
 
@@ -59,6 +61,33 @@ class Candidate(models.Model):
         verbose_name="Период отработки (дней)"
     )
 
+    # Поля для поиска дубликатов
+    email_normalized = models.CharField(
+        max_length=254,
+        blank=True,
+        db_index=True,
+        verbose_name="Нормализованный email"
+    )
+    phone_normalized = models.CharField(
+        max_length=32,
+        blank=True,
+        db_index=True,
+        verbose_name="Нормализованный телефон"
+    )
+    resume_minhash = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="MinHash-сигнатура резюме"
+    )
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicates',
+        verbose_name="Дубликат кандидата"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -85,6 +114,36 @@ class Candidate(models.Model):
             self.experience_years is not None
         ])
 
+    @property
+    def cluster_root_id(self):
+        """ID основного кандидата в кластере дубликатов"""
+        return self.duplicate_of_id or self.id
+
+
+class CandidateLSHBucket(models.Model):
+    """
+    LSH-корзина MinHash-сигнатуры резюме (одна строка на полосу сигнатуры)
+    """
+    candidate = models.ForeignKey(
+        Candidate,
+        on_delete=models.CASCADE,
+        related_name='lsh_buckets',
+        verbose_name="Кандидат"
+    )
+    band = models.PositiveSmallIntegerField(verbose_name="Полоса")
+    bucket = models.BigIntegerField(verbose_name="Хэш корзины")
+
+    class Meta:
+        verbose_name = "LSH-корзина кандидата"
+        verbose_name_plural = "LSH-корзины кандидатов"
+        indexes = [
+            models.Index(fields=["band", "bucket"]),
+        ]
+        unique_together = ("candidate", "band")
+
+    def __str__(self):
+        return f"{self.candidate_id}: {self.band}/{self.bucket}"
+
 
 APPLICATION_STATUS_CHOICES = (
     ("new", "Новый"),
@@ -212,6 +271,8 @@ class ChatSession(models.Model):
         auto_now=True,
         verbose_name="Последняя активность"
     )
+    # Последний выданный номер сообщения (BotMessage.seq)
+    last_seq = models.PositiveIntegerField(default=0, verbose_name="Последний номер сообщения")
 
     class Meta:
         verbose_name = "Сессия чата"
@@ -229,12 +290,31 @@ class ChatSession(models.Model):
     def mark_completed(self):
         self.is_active = False
         self.status = 'completed'
-        self.save()
+        # last_seq не сохраняется: номера сообщений выдает allocate_seq в БД,
+        # а значение в этом экземпляре может быть устаревшим
+        self.save(update_fields=['is_active', 'status', 'updated_at', 'last_activity'])
 
         self.application.chat_completed_at = self.updated_at
         self.application.status = 'reviewed'
         self.application.save()
 
+    @classmethod
+    def allocate_seq(cls, chat_session_id: int) -> int:
+        """
+        Следующий номер сообщения в сессии. Вызывать внутри транзакции:
+        UPDATE блокирует строку сессии до коммита, номера выдаются строго по порядку.
+        Номер не меньше максимального уже выданного, даже если last_seq
+        перезаписали устаревшим значением.
+        """
+        max_seq = (
+            BotMessage.objects.filter(chat_session_id=OuterRef('pk'))
+            .order_by().values('chat_session_id').annotate(m=Max('seq')).values('m')
+        )
+        cls.objects.filter(pk=chat_session_id).update(
+            last_seq=Greatest(F('last_seq'), Coalesce(Subquery(max_seq), Value(0))) + 1
+        )
+        return cls.objects.filter(pk=chat_session_id).values_list('last_seq', flat=True).get()
+
 
 class BotMessage(models.Model):
     """
@@ -306,6 +386,9 @@ class BotMessage(models.Model):
         verbose_name="Родительское сообщение"
     )
 
+    # Порядковый номер в сессии (монотонный, без коллизий created_at)
+    seq = models.PositiveIntegerField(null=True, blank=True, verbose_name="Номер в сессии")
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     read_at = models.DateTimeField(null=True, blank=True, verbose_name="Прочитано")
 
@@ -327,11 +410,31 @@ class BotMessage(models.Model):
             models.Index(fields=["is_question"]),
             models.Index(fields=["message_type"]),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=["chat_session", "seq"], name="botmessage_session_seq_uniq"),
+        ]
 
     def __str__(self):
         sender = "Бот" if self.sender == "bot" else "Кандидат"
         return f"[{self.created_at.strftime('%H:%M')}] {sender}: {self.text[:50]}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # Новое сообщение привязывается к обеим связям: сессии и отклику
+            if self.chat_session_id is None and self.application_id is not None:
+                self.chat_session_id = ChatSession.objects.filter(
+                    application_id=self.application_id
+                ).values_list('pk', flat=True).first()
+            elif self.application_id is None and self.chat_session_id is not None:
+                self.application_id = self.chat_session.application_id
+
+            if self.chat_session_id is not None and self.seq is None:
+                with transaction.atomic():
+                    self.seq = ChatSession.allocate_seq(self.chat_session_id)
+                    super().save(*args, **kwargs)
+                return
+        super().save(*args, **kwargs)
+
     def mark_as_read(self):
         if not self.read_at:
             self.read_at = models.DateTimeField(auto_now=True)
@@ -393,4 +496,35 @@ class CandidateResponse(models.Model):
         unique_together = ("application", "question_message")
 
     def __str__(self):
-        return f"Ответ {self.id} на вопрос {self.question_message.id}"
\ No newline at end of file
+        return f"Ответ {self.id} на вопрос {self.question_message.id}"
+
+
+class ArchivedTranscript(models.Model):
+    """
+    Сжатая переписка завершенной чат-сессии, перенесенная из BotMessage
+    (см. candidates/services/archive_service.py)
+    """
+    CODEC_CHOICES = (
+        ('zstd', 'zstd'),
+        ('zlib', 'zlib'),
+    )
+
+    chat_session = models.OneToOneField(
+        ChatSession,
+        on_delete=models.CASCADE,
+        related_name='archived_transcript',
+        verbose_name="Сессия чата"
+    )
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES, verbose_name="Сжатие")
+    payload = models.BinaryField(verbose_name="Сообщения (сжатый JSON)")
+    message_count = models.PositiveIntegerField(default=0, verbose_name="Сообщений")
+    raw_size = models.PositiveIntegerField(default=0, verbose_name="Размер JSON, байт")
+    compressed_size = models.PositiveIntegerField(default=0, verbose_name="Размер после сжатия, байт")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата архивации")
+
+    class Meta:
+        verbose_name = "Архив переписки"
+        verbose_name_plural = "Архивы переписки"
+
+    def __str__(self):
+        return f"Архив чата {self.chat_session_id} ({self.message_count} сообщений)"
@@ -15,9 +15,9 @@ class CandidateSerializer(serializers.ModelSerializer):
             'experience_years', 'education', 'languages',
             'preferred_employment_type', 'expected_salary', 'skills',
             'willing_to_relocate', 'notice_period', 'has_complete_profile',
-            'created_at', 'updated_at'
+            'duplicate_of', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'duplicate_of', 'created_at', 'updated_at']
 
 
 class ApplicationSerializer(serializers.ModelSerializer):
@@ -50,9 +50,9 @@ class BotMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = BotMessage
         fields = [
-            'id', 'application', 'sender', 'text', 'created_at', 'metadata'
+            'id', 'application', 'seq', 'sender', 'text', 'created_at', 'metadata'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'seq', 'created_at']
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -63,11 +63,23 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = BotMessage
         fields = [
-            'id', 'sender', 'message_type', 'text', 'is_question',
+            'id', 'seq', 'sender', 'message_type', 'text', 'is_question',
             'question_category', 'expected_answer_type', 'is_answered',
             'parent_message', 'created_at', 'read_at', 'metadata'
         ]
-        read_only_fields = ['id', 'created_at', 'is_answered']
+        read_only_fields = ['id', 'seq', 'created_at', 'is_answered']
+
+
+class PrefetchedChatMessageSerializer(ChatMessageSerializer):
+    """
+    Сообщения чата без запроса на каждое сообщение: отвеченные вопросы
+    передаются в context['answered_ids'] (нужно для async-представлений)
+    """
+
+    is_answered = serializers.SerializerMethodField()
+
+    def get_is_answered(self, obj):
+        return obj.pk in self.context.get('answered_ids', ())
 
 
 class ChatSessionSerializer(serializers.ModelSerializer):
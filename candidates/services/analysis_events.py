@@ -0,0 +1,141 @@
+# candidates/services/analysis_events.py
+"""
+События анализа отклика для клиентов без WebSocket (long-poll и SSE).
+
+Источник событий — та же группа channel layer application_<id>, в которую
+задачи анализа шлют analysis.complete и chat.initialized. Токен
+возобновления описывает уже известное клиенту состояние (версия
+RelevanceResult и id чат-сессии): по нему события, случившиеся между
+запросами, восстанавливаются из БД и не теряются.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from channels.layers import get_channel_layer
+
+from analytics.models import RelevanceResult
+from candidates.models import ChatSession
+
+logger = logging.getLogger(__name__)
+
+EVENT_ANALYSIS_COMPLETE = "analysis.complete"
+EVENT_CHAT_INITIALIZED = "chat.initialized"
+EVENT_TYPES = (EVENT_ANALYSIS_COMPLETE, EVENT_CHAT_INITIALIZED)
+
+
+@dataclass(frozen=True)
+class EventState:
+    """Известное клиенту состояние: версия результата (мкс) и id чат-сессии"""
+    result_version: int = 0
+    chat_session_id: int = 0
+
+    @property
+    def token(self) -> str:
+        return f"{self.result_version}.{self.chat_session_id}"
+
+    @classmethod
+    def from_token(cls, token: Optional[str]) -> "EventState":
+        try:
+            result_version, chat_session_id = (token or "").split(".", 1)
+            return cls(int(result_version), int(chat_session_id))
+        except ValueError:
+            return cls()
+
+
+def _event(event_type: str, data: dict) -> dict:
+    return {"type": event_type, "data": data}
+
+
+async def current_state(application_id: int) -> Tuple[EventState, List[dict]]:
+    """
+    Текущее состояние отклика и события, которые его описывают
+    (в порядке, в котором их шлет конвейер анализа).
+    """
+    events = []
+    chat = await ChatSession.objects.filter(application_id=application_id).values(
+        'pk', 'created_at'
+    ).afirst()
+    if chat:
+        events.append(_event(EVENT_CHAT_INITIALIZED, {
+            "application_id": application_id,
+            "chat_session_id": chat['pk'],
+            "timestamp": chat['created_at'].isoformat(),
+        }))
+
+    result = await RelevanceResult.objects.filter(application_id=application_id).values(
+        'score', 'summary', 'updated_at'
+    ).afirst()
+    if result:
+        events.append(_event(EVENT_ANALYSIS_COMPLETE, {
+            "application_id": application_id,
+            "score": result['score'],
+            "summary": result['summary'],
+            "timestamp": result['updated_at'].isoformat(),
+        }))
+
+    state = EventState(
+        result_version=int(result['updated_at'].timestamp() * 1_000_000) if result else 0,
+        chat_session_id=chat['pk'] if chat else 0,
+    )
+    return state, events
+
+
+def missed_events(known: EventState, state: EventState, events: List[dict]) -> List[dict]:
+    """События из текущего состояния, которых клиент с токеном known еще не видел"""
+    missed = []
+    for event in events:
+        if event["type"] == EVENT_CHAT_INITIALIZED and state.chat_session_id != known.chat_session_id:
+            missed.append(event)
+        elif event["type"] == EVENT_ANALYSIS_COMPLETE and state.result_version > known.result_version:
+            missed.append(event)
+    return missed
+
+
+class AnalysisEventSubscription:
+    """
+    Подписка на группу application_<id> на время запроса.
+    Подписываемся до чтения состояния из БД, чтобы не пропустить событие
+    между проверкой и ожиданием.
+    """
+
+    def __init__(self, application_id: int):
+        self.application_id = application_id
+        self.group_name = f"application_{application_id}"
+        self.channel_layer = get_channel_layer()
+        self.channel_name = None
+
+    async def __aenter__(self) -> "AnalysisEventSubscription":
+        self.channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def next_events(self, known: EventState, timeout: float) -> Tuple[List[dict], EventState]:
+        """
+        События новее known: сразу, если они уже есть в БД, иначе первое
+        пришедшее в группу за timeout секунд. Возвращает (события, новое состояние).
+        """
+        state, events = await current_state(self.application_id)
+        missed = missed_events(known, state, events)
+        if missed:
+            return missed, state
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return [], known
+            try:
+                message = await asyncio.wait_for(self.channel_layer.receive(self.channel_name), remaining)
+            except asyncio.TimeoutError:
+                return [], known
+            if message.get("type") not in EVENT_TYPES:
+                continue
+            # Состояние перечитываем: токен должен соответствовать БД
+            state, _ = await current_state(self.application_id)
+            return [_event(message["type"], message.get("data", {}))], state
@@ -0,0 +1,152 @@
+# candidates/services/archive_service.py
+import json
+import logging
+import zlib
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from candidates.models import ArchivedTranscript, BotMessage, CandidateResponse, ChatSession
+from candidates.serializers import PrefetchedChatMessageSerializer
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен, без него используется zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVABLE_STATUSES = ('completed', 'timeout', 'abandoned')
+
+
+def compress(data: bytes):
+    """(кодек, сжатые данные): zstd, если установлен zstandard, иначе zlib"""
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    payload = bytes(payload)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd transcripts")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def decode_transcript(codec: str, payload: bytes) -> List[Dict]:
+    """Сообщения из архива в формате ChatMessageSerializer"""
+    return json.loads(decompress(codec, payload))
+
+
+def transcript_messages(archived: ArchivedTranscript) -> List[Dict]:
+    return decode_transcript(archived.codec, archived.payload)
+
+
+class TranscriptArchiveService:
+    """
+    Перенос переписки старых завершенных чат-сессий из BotMessage
+    в сжатый архив (одна запись ArchivedTranscript на сессию).
+
+    Каждая сессия архивируется в своей короткой транзакции. Вопросы,
+    на которые ссылаются CandidateResponse, остаются в BotMessage (их
+    удаление каскадом удалило бы разобранные ответы); остальные сообщения
+    удаляются. Чтение переписки архивных сессий идет из архива.
+    """
+
+    def __init__(self, retention_days: int = None, batch_size: int = None):
+        self.retention = timedelta(days=retention_days or getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 90))
+        self.batch_size = batch_size or getattr(settings, 'CHAT_ARCHIVE_BATCH_SIZE', 100)
+
+    def eligible_sessions(self):
+        """Завершенные сессии без активности дольше срока хранения, еще не в архиве"""
+        from analytics.services.dead_letter_service import ACTIVE_STATUSES
+
+        return (
+            ChatSession.objects
+            .filter(is_active=False, status__in=ARCHIVABLE_STATUSES,
+                    last_activity__lt=timezone.now() - self.retention,
+                    archived_transcript__isnull=True)
+            # Отклики, анализ которых еще может быть перезапущен, не трогаем
+            .exclude(application__replay_item__isnull=False)
+            .exclude(application__dead_letters__status__in=ACTIVE_STATUSES)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+            .distinct()
+        )
+
+    def archive_session(self, chat_session_id: int) -> int:
+        """Архивирует одну сессию. Возвращает число перенесенных сообщений"""
+        with transaction.atomic():
+            session = (
+                ChatSession.objects.select_for_update(skip_locked=True)
+                .filter(pk=chat_session_id, is_active=False).first()
+            )
+            if session is None or ArchivedTranscript.objects.filter(chat_session_id=chat_session_id).exists():
+                return 0
+
+            messages = list(
+                BotMessage.objects.filter(chat_session_id=chat_session_id)
+                .order_by(F('seq').asc(nulls_first=True), 'created_at', 'id')
+            )
+            if not messages:
+                return 0
+            # Как в async_views.chat_messages: отвеченными бывают только вопросы
+            question_ids = {m.pk for m in messages if m.is_question}
+            answered_ids = {
+                m.parent_message_id for m in messages
+                if m.sender == 'candidate' and m.parent_message_id in question_ids
+            }
+            data = PrefetchedChatMessageSerializer(
+                messages, many=True, context={'answered_ids': answered_ids}
+            ).data
+
+            raw = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+            codec, payload = compress(raw)
+            ArchivedTranscript.objects.create(
+                chat_session_id=chat_session_id, codec=codec, payload=payload,
+                message_count=len(messages), raw_size=len(raw), compressed_size=len(payload),
+            )
+
+            referenced = set(
+                CandidateResponse.objects.filter(question_message__chat_session_id=chat_session_id)
+                .values_list('question_message_id', flat=True)
+            )
+            BotMessage.objects.filter(
+                pk__in=[m.pk for m in messages if m.pk not in referenced]
+            ).delete()
+
+        return len(messages)
+
+    def run(self, limit: Optional[int] = None) -> Dict[str, int]:
+        """
+        Архивирует подходящие сессии пачками по batch_size (не более limit).
+        Сессии, заблокированные другими транзакциями, пропускаются до следующего запуска.
+        """
+        sessions = messages = 0
+        last_pk = 0
+        while limit is None or sessions < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - sessions)
+            batch = list(self.eligible_sessions().filter(pk__gt=last_pk)[:size])
+            if not batch:
+                break
+            for chat_session_id in batch:
+                try:
+                    archived = self.archive_session(chat_session_id)
+                except Exception as e:
+                    logger.exception("Failed to archive chat session %s: %s", chat_session_id, e)
+                    continue
+                if archived:
+                    sessions += 1
+                    messages += archived
+            last_pk = batch[-1]
+
+        if sessions:
+            logger.info("Archived %d chat sessions (%d messages)", sessions, messages)
+        return {"sessions": sessions, "messages": messages}
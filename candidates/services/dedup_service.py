@@ -0,0 +1,279 @@
+# candidates/services/dedup_service.py
+import hashlib
+import logging
+import random
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from candidates.models import Application, Candidate, CandidateLSHBucket
+
+logger = logging.getLogger(__name__)
+
+# Параметры MinHash/LSH: NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+MINHASH_PERMUTATIONS = int(getattr(settings, "DEDUP_MINHASH_PERMUTATIONS", 64))
+LSH_BANDS = int(getattr(settings, "DEDUP_LSH_BANDS", 16))
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = int(getattr(settings, "DEDUP_SHINGLE_SIZE", 3))
+SIMILARITY_THRESHOLD = float(getattr(settings, "DEDUP_SIMILARITY_THRESHOLD", 0.8))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+", flags=re.UNICODE)
+
+# Фиксированный seed — сигнатуры должны совпадать между процессами и запусками
+_rng = random.Random(20240917)
+_PERMUTATIONS = [
+    (_rng.randint(1, _MERSENNE_PRIME - 1), _rng.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+_GMAIL_DOMAINS = ("gmail.com", "googlemail.com")
+
+
+def normalize_email(email: str) -> str:
+    """Приводит email к каноническому виду (регистр, +теги, точки в gmail)"""
+    email = (email or "").strip().lower()
+    if "@" not in email:
+        return email
+    local, domain = email.rsplit("@", 1)
+    local = local.split("+", 1)[0]
+    if domain in _GMAIL_DOMAINS:
+        local = local.replace(".", "")
+        domain = "gmail.com"
+    return f"{local}@{domain}"
+
+
+def normalize_phone(phone: str) -> str:
+    """Оставляет только цифры, 8XXXXXXXXXX приводит к +7XXXXXXXXXX"""
+    digits = re.sub(r"\D", "", phone or "")
+    if not digits:
+        return ""
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return f"+{digits}"
+
+
+def _shingles(text: str) -> set:
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {
+        " ".join(words[i:i + SHINGLE_SIZE])
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def compute_minhash(text: str) -> List[int]:
+    """
+    Считает MinHash-сигнатуру текста по словесным шинглам.
+    Для пустого текста возвращает пустой список.
+    """
+    shingles = _shingles(text)
+    if not shingles:
+        return []
+
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big")
+        for s in shingles
+    ]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def lsh_buckets(signature: Sequence[int]) -> List[Tuple[int, int]]:
+    """Разбивает сигнатуру на полосы и возвращает список (band, bucket_hash)"""
+    if len(signature) != MINHASH_PERMUTATIONS:
+        return []
+
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(
+            ",".join(map(str, rows)).encode("ascii"), digest_size=8
+        ).digest()
+        buckets.append((band, int.from_bytes(digest, "big", signed=True)))
+    return buckets
+
+
+def estimate_similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """Оценка коэффициента Жаккара по двум сигнатурам"""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class DedupService:
+    """
+    Сервис поиска дубликатов кандидатов: точное совпадение email/телефона
+    и MinHash/LSH по тексту резюме.
+    """
+
+    def __init__(self, threshold: float = None):
+        self.threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+
+    def index_candidate(self, candidate: Candidate, save: bool = True) -> Candidate:
+        """
+        Пересчитывает нормализованные поля и MinHash-сигнатуру кандидата,
+        перестраивает его LSH-корзины.
+        """
+        candidate.email_normalized = normalize_email(candidate.email)
+        candidate.phone_normalized = normalize_phone(candidate.phone)
+        candidate.resume_minhash = compute_minhash(candidate.resume_text)
+
+        if save:
+            with transaction.atomic():
+                candidate.save(update_fields=[
+                    'email_normalized', 'phone_normalized', 'resume_minhash'
+                ])
+                CandidateLSHBucket.objects.filter(candidate=candidate).delete()
+                CandidateLSHBucket.objects.bulk_create([
+                    CandidateLSHBucket(candidate=candidate, band=band, bucket=bucket)
+                    for band, bucket in lsh_buckets(candidate.resume_minhash)
+                ])
+        return candidate
+
+    def find_duplicates(self, candidate: Candidate) -> List[Tuple[Candidate, float]]:
+        """
+        Возвращает вероятные дубликаты кандидата в виде [(кандидат, похожесть)],
+        отсортированные по убыванию похожести.
+        Кандидаты-претенденты выбираются через индекс LSH-корзин, а не полным перебором.
+        """
+        matches: Dict[int, float] = {}
+
+        exact_q = Q()
+        if candidate.email_normalized:
+            exact_q |= Q(email_normalized=candidate.email_normalized)
+        if candidate.phone_normalized:
+            exact_q |= Q(phone_normalized=candidate.phone_normalized)
+        if exact_q:
+            for pk in Candidate.objects.filter(exact_q).exclude(pk=candidate.pk).values_list('pk', flat=True):
+                matches[pk] = 1.0
+
+        buckets = lsh_buckets(candidate.resume_minhash)
+        if buckets:
+            bucket_q = Q()
+            for band, bucket in buckets:
+                bucket_q |= Q(band=band, bucket=bucket)
+
+            candidate_ids = set(
+                CandidateLSHBucket.objects.filter(bucket_q)
+                .exclude(candidate_id=candidate.pk)
+                .values_list('candidate_id', flat=True)
+            ) - set(matches)
+
+            for pk, signature in Candidate.objects.filter(pk__in=candidate_ids).values_list('pk', 'resume_minhash'):
+                similarity = estimate_similarity(candidate.resume_minhash, signature)
+                if similarity >= self.threshold:
+                    matches[pk] = similarity
+
+        if not matches:
+            return []
+
+        candidates = Candidate.objects.in_bulk(list(matches))
+        return sorted(
+            ((candidates[pk], score) for pk, score in matches.items() if pk in candidates),
+            key=lambda item: (-item[1], item[0].pk)
+        )
+
+    def register_candidate(self, candidate: Candidate) -> Optional[Candidate]:
+        """
+        Индексирует нового кандидата и связывает его с кластером дубликатов.
+        Возвращает основного кандидата кластера или None, если дубликатов нет.
+        """
+        self.index_candidate(candidate)
+        duplicates = self.find_duplicates(candidate)
+        if not duplicates:
+            return None
+
+        best_match, similarity = duplicates[0]
+        root_id = best_match.cluster_root_id
+        if root_id == candidate.pk:
+            return None
+
+        candidate.duplicate_of_id = root_id
+        candidate.save(update_fields=['duplicate_of'])
+        logger.info("Candidate %s linked as duplicate of %s (similarity=%.2f)",
+                    candidate.pk, root_id, similarity)
+        return Candidate.objects.get(pk=root_id)
+
+    def reindex_candidate(self, candidate: Candidate) -> Optional[Candidate]:
+        """
+        Переиндексирует измененного кандидата и пересвязывает его с кластером:
+        после правки email, телефона или резюме он может попасть в другой
+        кластер или перестать быть дубликатом. Кандидаты, привязанные к нему
+        как к основному, переходят в новый кластер вместе с ним.
+        Возвращает основного кандидата кластера или None, если дубликатов нет.
+        """
+        self.index_candidate(candidate)
+
+        root_id, similarity = None, None
+        for duplicate, score in self.find_duplicates(candidate):
+            # Собственные дубликаты кандидата не делают его дубликатом
+            if duplicate.duplicate_of_id != candidate.pk:
+                root_id, similarity = duplicate.cluster_root_id, score
+                break
+
+        with transaction.atomic():
+            if root_id is not None:
+                Candidate.objects.filter(duplicate_of=candidate).update(duplicate_of_id=root_id)
+            if candidate.duplicate_of_id != root_id:
+                candidate.duplicate_of_id = root_id
+                candidate.save(update_fields=['duplicate_of'])
+                if root_id is not None:
+                    logger.info("Candidate %s relinked as duplicate of %s (similarity=%.2f)",
+                                candidate.pk, root_id, similarity)
+                else:
+                    logger.info("Candidate %s unlinked from its duplicate cluster", candidate.pk)
+
+        return Candidate.objects.get(pk=root_id) if root_id is not None else None
+
+    def cluster_ids(self, candidate: Candidate) -> List[int]:
+        """ID всех кандидатов кластера дубликатов (включая самого кандидата)"""
+        root_id = candidate.cluster_root_id
+        ids = set(Candidate.objects.filter(
+            Q(pk=root_id) | Q(duplicate_of_id=root_id)
+        ).values_list('pk', flat=True))
+        ids.add(candidate.pk)
+        return sorted(ids)
+
+    def find_reusable_result(self, application: Application):
+        """
+        Ищет готовый результат анализа дубликата кандидата на ту же вакансию.
+        Возвращает RelevanceResult или None.
+        """
+        from analytics.models import RelevanceResult
+
+        candidate = application.candidate
+        if not candidate.duplicate_of_id and not candidate.duplicates.exists():
+            return None
+
+        cluster = [pk for pk in self.cluster_ids(candidate) if pk != candidate.pk]
+        if not cluster:
+            return None
+
+        results = (
+            RelevanceResult.objects
+            .select_related('application__candidate')
+            .filter(
+                application__vacancy_id=application.vacancy_id,
+                application__candidate_id__in=cluster,
+            )
+            .exclude(application_id=application.pk)
+            # Деградированные (без LLM) результаты не переиспользуем
+            .exclude(metadata__degraded=True)
+            .order_by('-updated_at')
+        )
+        # Результат переиспользуем только если резюме действительно совпадает
+        for result in results:
+            other = result.application.candidate
+            if (other.resume_text or "") == (candidate.resume_text or ""):
+                return result
+            if estimate_similarity(candidate.resume_minhash, other.resume_minhash) >= self.threshold:
+                return result
+        return None
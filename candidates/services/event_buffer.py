@@ -0,0 +1,138 @@
+# candidates/services/event_buffer.py
+"""
+Буфер исходящих событий отклика для возобновляемых WebSocket-сессий.
+
+Каждое событие группы application_<id> сначала дописывается в ограниченный
+по длине Redis Stream отклика и получает id записи, затем рассылается в
+группу с этим id. Переподключившийся клиент передает последний полученный
+id, и ApplicationConsumer досылает пропущенное из буфера.
+"""
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND_REDIS = "redis"
+BACKEND_MEMORY = "memory"
+
+
+def group_name(application_id: int) -> str:
+    return f"application_{application_id}"
+
+
+def parse_event_id(event_id: Optional[str]) -> Tuple[int, int]:
+    """id записи стрима "<ms>-<seq>" -> кортеж для сравнения; некорректный id -> (0, 0)"""
+    try:
+        ms, _, seq = (event_id or "").partition("-")
+        return int(ms), int(seq or 0)
+    except ValueError:
+        return 0, 0
+
+
+def _maxlen() -> int:
+    return getattr(settings, "EVENT_BUFFER_MAXLEN", 200)
+
+
+def _ttl() -> int:
+    return getattr(settings, "EVENT_BUFFER_TTL", 24 * 3600)
+
+
+class RedisStreamEventBuffer:
+    """Буфер на Redis Streams: XADD с MAXLEN ~ и TTL ключа"""
+
+    def __init__(self, url: str = None):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+
+    @staticmethod
+    def _key(application_id: int) -> str:
+        return f"events:application:{application_id}"
+
+    def append(self, application_id: int, message: Dict) -> str:
+        key = self._key(application_id)
+        pipe = self.client.pipeline()
+        pipe.xadd(key, {"message": json.dumps(message, ensure_ascii=False, default=str)},
+                  maxlen=_maxlen(), approximate=True)
+        pipe.expire(key, _ttl())
+        event_id, _ = pipe.execute()
+        return event_id
+
+    def read_after(self, application_id: int, last_event_id: str, count: int = None) -> Tuple[List[Tuple[str, Dict]], bool]:
+        """
+        События после last_event_id и признак потери: True, если часть
+        пропущенного уже вытеснена из буфера (нужна полная перезагрузка по REST).
+        """
+        key = self._key(application_id)
+        count = count or _maxlen()
+        entries = self.client.xrange(key, min=f"({last_event_id}", max="+", count=count)
+        oldest = self.client.xrange(key, min="-", max="+", count=1)
+        truncated = bool(oldest) and parse_event_id(oldest[0][0]) > parse_event_id(last_event_id)
+        return [(event_id, json.loads(fields["message"])) for event_id, fields in entries], truncated
+
+
+class InMemoryEventBuffer:
+    """Буфер в памяти процесса (тесты и локальный запуск без Redis)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = defaultdict(lambda: deque(maxlen=_maxlen()))
+        self._counter = 0
+
+    def append(self, application_id: int, message: Dict) -> str:
+        with self._lock:
+            self._counter += 1
+            event_id = f"{self._counter}-0"
+            self._streams[application_id].append((event_id, dict(message)))
+        return event_id
+
+    def read_after(self, application_id: int, last_event_id: str, count: int = None) -> Tuple[List[Tuple[str, Dict]], bool]:
+        last = parse_event_id(last_event_id)
+        with self._lock:
+            stream = list(self._streams.get(application_id, ()))
+        entries = [(event_id, dict(message)) for event_id, message in stream if parse_event_id(event_id) > last]
+        truncated = bool(stream) and parse_event_id(stream[0][0]) > last
+        return entries[:count or _maxlen()], truncated
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_event_buffer():
+    """Буфер событий процесса (settings.EVENT_BUFFER_BACKEND: redis | memory)"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                backend = getattr(settings, "EVENT_BUFFER_BACKEND", BACKEND_REDIS)
+                _buffer = InMemoryEventBuffer() if backend == BACKEND_MEMORY else RedisStreamEventBuffer()
+    return _buffer
+
+
+def _buffered(application_id: int, message: Dict) -> Dict:
+    try:
+        event_id = get_event_buffer().append(application_id, message)
+    except Exception as e:
+        # Без буфера событие все равно доставляется подключенным клиентам
+        logger.warning("Event buffer append failed for application %s: %s", application_id, e)
+        return message
+    return {**message, "event_id": event_id}
+
+
+def publish_application_event(application_id: int, message: Dict):
+    """Записывает событие в буфер и рассылает в группу отклика (синхронный код)"""
+    async_to_sync(get_channel_layer().group_send)(group_name(application_id), _buffered(application_id, message))
+
+
+async def apublish_application_event(application_id: int, message: Dict, channel_layer=None):
+    """То же для async-кода (consumer)"""
+    message = await sync_to_async(_buffered, thread_sensitive=False)(application_id, message)
+    await (channel_layer or get_channel_layer()).group_send(group_name(application_id), message)
@@ -0,0 +1,157 @@
+# candidates/services/export_service.py
+import csv
+import json
+import logging
+from itertools import islice
+from typing import Dict, Iterator, List
+
+from django.conf import settings
+from django.db.models import Q
+
+from candidates.models import ArchivedTranscript, BotMessage
+from candidates.services.archive_service import decode_transcript
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = int(getattr(settings, "EXPORT_CHUNK_SIZE", 1000))
+
+# csv — обычный CSV, excel_csv — CSV для Excel (BOM + ';'), jsonl — JSON Lines
+EXPORT_FORMATS = ("csv", "excel_csv", "jsonl")
+
+EXPORT_COLUMNS = (
+    'application_id', 'status', 'created_at', 'initial_score', 'final_score',
+    'vacancy_id', 'vacancy_title',
+    'candidate_id', 'candidate_name', 'candidate_email', 'candidate_phone',
+    'candidate_city', 'experience_years', 'expected_salary',
+    'relevance_score', 'relevance_summary', 'relevance_reasons',
+    'transcript',
+)
+
+_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "excel_csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+class ApplicationExporter:
+    """
+    Потоковая выгрузка откликов с баллами и транскриптами чатов.
+
+    Отклики читаются через .iterator(chunk_size=...), на каждую пачку
+    выполняется фиксированное число запросов (отклики+кандидат+результат
+    одним JOIN и один запрос на сообщения), поэтому память не зависит
+    от размера выгрузки.
+    """
+
+    def __init__(self, queryset, fmt: str = "csv", chunk_size: int = None,
+                 include_transcript: bool = True):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        self.fmt = fmt
+        self.chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+        self.include_transcript = include_transcript
+        self.queryset = (
+            queryset
+            .select_related('candidate', 'vacancy', 'relevance_result')
+            # Тяжелые поля, которые не попадают в выгрузку
+            .defer('meta', 'candidate__resume_text', 'candidate__resume_minhash',
+                   'relevance_result__metadata')
+            .order_by('id')
+        )
+
+    @property
+    def content_type(self) -> str:
+        return _CONTENT_TYPES[self.fmt]
+
+    @property
+    def filename(self) -> str:
+        extension = "jsonl" if self.fmt == "jsonl" else "csv"
+        return f"applications.{extension}"
+
+    def iter_chunks(self) -> Iterator[List]:
+        iterator = self.queryset.iterator(chunk_size=self.chunk_size)
+        while True:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _transcripts(self, application_ids: List[int]) -> Dict[int, str]:
+        """Агрегирует переписку по откликам пачки одним запросом"""
+        if not self.include_transcript or not application_ids:
+            return {}
+
+        messages = (
+            BotMessage.objects
+            .filter(Q(chat_session__application_id__in=application_ids) |
+                    Q(application_id__in=application_ids))
+            .order_by('created_at', 'id')
+            .values_list('chat_session__application_id', 'application_id', 'sender', 'text')
+        )
+
+        transcripts: Dict[int, List[str]] = {}
+        for session_app_id, legacy_app_id, sender, text in messages:
+            app_id = session_app_id or legacy_app_id
+            transcripts.setdefault(app_id, []).append(f"{sender}: {text}")
+
+        # Переписка архивных сессий — из сжатого архива
+        archived = ArchivedTranscript.objects.filter(
+            chat_session__application_id__in=application_ids
+        ).values_list('chat_session__application_id', 'codec', 'payload')
+        for app_id, codec, payload in archived:
+            transcripts[app_id] = [f"{m['sender']}: {m['text']}" for m in decode_transcript(codec, payload)]
+        return {app_id: "\n".join(lines) for app_id, lines in transcripts.items()}
+
+    def iter_rows(self) -> Iterator[Dict]:
+        for chunk in self.iter_chunks():
+            transcripts = self._transcripts([app.id for app in chunk])
+            for app in chunk:
+                candidate = app.candidate
+                result = getattr(app, 'relevance_result', None)
+                yield {
+                    'application_id': app.id,
+                    'status': app.status,
+                    'created_at': app.created_at.isoformat() if app.created_at else None,
+                    'initial_score': app.initial_score,
+                    'final_score': app.final_score,
+                    'vacancy_id': app.vacancy.id,
+                    'vacancy_title': app.vacancy.title,
+                    'candidate_id': candidate.id,
+                    'candidate_name': candidate.name,
+                    'candidate_email': candidate.email,
+                    'candidate_phone': candidate.phone,
+                    'candidate_city': candidate.city,
+                    'experience_years': candidate.experience_years,
+                    'expected_salary': str(candidate.expected_salary) if candidate.expected_salary is not None else None,
+                    'relevance_score': result.score if result else None,
+                    'relevance_summary': result.summary if result else None,
+                    'relevance_reasons': result.reasons if result else [],
+                    'transcript': transcripts.get(app.id, ""),
+                }
+
+    def stream(self) -> Iterator[str]:
+        """Генератор строк выгрузки для StreamingHttpResponse"""
+        if self.fmt == "jsonl":
+            for row in self.iter_rows():
+                yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+            return
+
+        excel = self.fmt == "excel_csv"
+        writer = csv.writer(_Echo(), delimiter=";" if excel else ",")
+        if excel:
+            # BOM, чтобы Excel корректно распознал UTF-8
+            yield "\ufeff"
+        yield writer.writerow(EXPORT_COLUMNS)
+        for row in self.iter_rows():
+            row['relevance_reasons'] = "; ".join(map(str, row['relevance_reasons'] or []))
+            yield writer.writerow([
+                "" if row[column] is None else row[column] for column in EXPORT_COLUMNS
+            ])
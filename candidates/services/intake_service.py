@@ -0,0 +1,390 @@
+# candidates/services/intake_service.py
+import csv
+import io
+import json
+import logging
+import time
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from analytics.services.funnel_service import FunnelService
+from candidates.models import Application, Candidate, CandidateLSHBucket
+from candidates.services.dedup_service import DedupService, lsh_buckets, normalize_email
+from jobs.models import Vacancy
+
+logger = logging.getLogger(__name__)
+
+INTAKE_BATCH_SIZE = int(getattr(settings, "INTAKE_BATCH_SIZE", 500))
+INTAKE_MAX_ERRORS = int(getattr(settings, "INTAKE_MAX_ERRORS", 1000))
+
+SUPPORTED_FORMATS = ("jsonl", "csv")
+
+# Поля кандидата, которые можно передать в файле импорта
+CANDIDATE_FIELDS = (
+    'name', 'email', 'phone', 'resume_text', 'city', 'experience_years',
+    'education', 'languages', 'preferred_employment_type', 'expected_salary',
+    'skills', 'willing_to_relocate', 'notice_period',
+)
+_LIST_FIELDS = ('languages', 'skills')
+_EMPLOYMENT_TYPES = {choice for choice, _label in Candidate.EMPLOYMENT_TYPE_CHOICES}
+_TRUE_VALUES = {"1", "true", "yes", "y", "да"}
+_FALSE_VALUES = {"0", "false", "no", "n", "нет"}
+# Отработка дольше года — ошибка в данных (например, дата вместо числа дней)
+MAX_NOTICE_PERIOD_DAYS = 365
+
+
+class RowError(ValueError):
+    """Ошибка валидации строки файла импорта"""
+
+
+def detect_format(filename: str, default: str = "jsonl") -> str:
+    """Определяет формат файла по расширению"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return default
+
+
+def iter_rows(stream: io.TextIOBase, fmt: str) -> Iterator[Tuple[int, object]]:
+    """
+    Построчно читает JSONL/CSV без загрузки всего файла в память.
+    Возвращает пары (номер строки, dict или исключение разбора).
+    """
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, RowError(f"invalid_json: {e.msg}")
+                continue
+            if not isinstance(row, dict):
+                yield line_no, RowError("row_is_not_object")
+                continue
+            yield line_no, row
+    elif fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # line_num указывает на последнюю прочитанную строку файла (с учетом заголовка)
+            yield reader.line_num, row
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _clean_list(value) -> list:
+    if value in (None, ""):
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    text = str(value).strip()
+    if text.startswith("["):
+        try:
+            parsed = json.loads(text)
+            if isinstance(parsed, list):
+                return [str(v).strip() for v in parsed if str(v).strip()]
+        except json.JSONDecodeError:
+            pass
+    return [part.strip() for part in text.replace(";", ",").split(",") if part.strip()]
+
+
+def _clean_bool(value) -> Optional[bool]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise RowError(f"invalid_boolean: {value}")
+
+
+def _clean_salary(value) -> Decimal:
+    """Зарплата, округленная до точности поля; не помещающаяся в поле — ошибка строки"""
+    field = Candidate._meta.get_field('expected_salary')
+    amount = Decimal(str(value).strip().replace(" ", ""))
+    if not amount.is_finite() or not 0 <= amount < 10 ** (field.max_digits - field.decimal_places):
+        raise RowError(f"expected_salary_out_of_range: {value}")
+    return amount.quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def clean_row(row: Dict, default_vacancy_id: Optional[int] = None) -> Tuple[Dict, Optional[int]]:
+    """
+    Валидирует и приводит типы полей строки импорта.
+    Возвращает (поля кандидата, id вакансии или None).
+    """
+    data = {}
+    for field in CANDIDATE_FIELDS:
+        if field in row and row[field] not in (None, ""):
+            data[field] = row[field]
+
+    email = str(data.get('email', '')).strip()
+    if not email:
+        raise RowError("email_required")
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise RowError(f"invalid_email: {email}")
+    data['email'] = email
+
+    if not str(data.get('name', '')).strip():
+        raise RowError("name_required")
+
+    for field in ('name', 'phone', 'resume_text', 'city', 'education'):
+        if field in data:
+            data[field] = str(data[field]).strip()
+
+    # Числа проверяются здесь, по строке: значение вне диапазона поля
+    # иначе уронило бы bulk_create всей пачки
+    try:
+        if 'experience_years' in data:
+            data['experience_years'] = float(data['experience_years'])
+            if not 0 <= data['experience_years'] <= 50:
+                raise RowError("experience_years_out_of_range")
+        if 'notice_period' in data:
+            data['notice_period'] = int(data['notice_period'])
+            if not 0 <= data['notice_period'] <= MAX_NOTICE_PERIOD_DAYS:
+                raise RowError("notice_period_out_of_range")
+        if 'expected_salary' in data:
+            data['expected_salary'] = _clean_salary(data['expected_salary'])
+    except (TypeError, ValueError, InvalidOperation) as e:
+        if isinstance(e, RowError):
+            raise
+        raise RowError(f"invalid_number: {e}")
+
+    if 'willing_to_relocate' in data:
+        data['willing_to_relocate'] = _clean_bool(data['willing_to_relocate'])
+
+    if 'preferred_employment_type' in data and data['preferred_employment_type'] not in _EMPLOYMENT_TYPES:
+        raise RowError(f"invalid_employment_type: {data['preferred_employment_type']}")
+
+    for field in _LIST_FIELDS:
+        if field in data:
+            data[field] = _clean_list(data[field])
+
+    vacancy_id = row.get('vacancy_id') or row.get('vacancy') or default_vacancy_id
+    if vacancy_id not in (None, ""):
+        try:
+            vacancy_id = int(vacancy_id)
+        except (TypeError, ValueError):
+            raise RowError(f"invalid_vacancy_id: {vacancy_id}")
+    else:
+        vacancy_id = None
+
+    return data, vacancy_id
+
+
+class BulkIntakeService:
+    """
+    Потоковый импорт кандидатов и откликов из JSONL/CSV.
+
+    Кандидаты upsert'ятся по нормализованному email пачками, отклики создаются
+    через bulk_create(ignore_conflicts=True), анализ ставится в очередь одной
+    групповой отправкой на пачку. Связи с нечеткими дубликатами (LSH) после
+    импорта проставляет команда dedup_candidates (она же заполняет
+    email_normalized для кандидатов, созданных до появления дедупликации).
+    """
+
+    def __init__(self, default_vacancy_id: int = None, batch_size: int = None,
+                 dispatch_analysis: bool = True):
+        self.default_vacancy_id = default_vacancy_id
+        self.batch_size = batch_size or INTAKE_BATCH_SIZE
+        self.dispatch_analysis = dispatch_analysis
+        self.dedup = DedupService()
+        self.report = {
+            "rows": 0,
+            "candidates_created": 0,
+            "candidates_updated": 0,
+            "applications_created": 0,
+            "applications_existing": 0,
+            "analysis_dispatched": 0,
+            "errors": [],
+            "errors_truncated": False,
+        }
+
+    def run(self, stream: io.TextIOBase, fmt: str) -> Dict:
+        """Импортирует весь поток и возвращает отчет с ошибками по строкам"""
+        started = time.monotonic()
+        batch: List[Tuple[int, Dict, Optional[int]]] = []
+
+        line_no = 0
+        try:
+            for line_no, row in iter_rows(stream, fmt):
+                self.report["rows"] += 1
+                if isinstance(row, Exception):
+                    self._add_error(line_no, str(row))
+                    continue
+                try:
+                    data, vacancy_id = clean_row(row, self.default_vacancy_id)
+                except RowError as e:
+                    self._add_error(line_no, str(e))
+                    continue
+
+                batch.append((line_no, data, vacancy_id))
+                if len(batch) >= self.batch_size:
+                    self._process_batch(batch)
+                    batch = []
+        except UnicodeDecodeError as e:
+            # Дальше ошибки кодировки файл не читается; уже прочитанные строки импортируются
+            self._add_error(line_no + 1, f"invalid_encoding: {e.reason}")
+
+        if batch:
+            self._process_batch(batch)
+
+        elapsed = time.monotonic() - started
+        self.report["elapsed_seconds"] = round(elapsed, 3)
+        self.report["rows_per_second"] = round(self.report["rows"] / elapsed, 1) if elapsed else None
+        logger.info("Bulk intake finished: %s rows, %s candidates created, %s applications created, %s errors",
+                    self.report["rows"], self.report["candidates_created"],
+                    self.report["applications_created"], len(self.report["errors"]))
+        return self.report
+
+    def _add_error(self, line_no: int, error: str):
+        if len(self.report["errors"]) >= INTAKE_MAX_ERRORS:
+            self.report["errors_truncated"] = True
+            return
+        self.report["errors"].append({"row": line_no, "error": error})
+
+    def _process_batch(self, batch: List[Tuple[int, Dict, Optional[int]]]):
+        # Проверяем вакансии одним запросом на пачку
+        vacancy_ids = {vacancy_id for _, _, vacancy_id in batch if vacancy_id}
+        known_vacancies = set(
+            Vacancy.objects.filter(pk__in=vacancy_ids).values_list('pk', flat=True)
+        ) if vacancy_ids else set()
+
+        rows = []
+        for line_no, data, vacancy_id in batch:
+            if vacancy_id and vacancy_id not in known_vacancies:
+                self._add_error(line_no, f"vacancy_not_found: {vacancy_id}")
+                continue
+            rows.append((line_no, data, vacancy_id))
+        if not rows:
+            return
+
+        try:
+            with transaction.atomic():
+                candidates_by_email = self._upsert_candidates(rows)
+                new_application_ids = self._create_applications(rows, candidates_by_email)
+        except Exception as e:
+            logger.exception("Bulk intake batch failed: %s", e)
+            for line_no, _, _ in rows:
+                self._add_error(line_no, f"batch_failed: {e}")
+            return
+
+        if self.dispatch_analysis and new_application_ids:
+            self._dispatch_analysis(new_application_ids)
+
+    def _upsert_candidates(self, rows) -> Dict[str, Candidate]:
+        # Внутри пачки последняя строка с тем же email перекрывает предыдущие
+        merged: Dict[str, Dict] = {}
+        for _, data, _ in rows:
+            key = normalize_email(data['email'])
+            merged.setdefault(key, {}).update(data)
+
+        existing = {}
+        for candidate in Candidate.objects.filter(email_normalized__in=list(merged)).order_by('pk'):
+            # Если дубликатов по email несколько, обновляем основного (самого раннего)
+            existing.setdefault(candidate.email_normalized, candidate)
+
+        to_create, to_update, update_fields = [], [], set()
+        for key, data in merged.items():
+            candidate = existing.get(key)
+            if candidate is None:
+                candidate = Candidate(**data)
+                self.dedup.index_candidate(candidate, save=False)
+                to_create.append(candidate)
+            else:
+                for field, value in data.items():
+                    setattr(candidate, field, value)
+                # bulk_update не выставляет auto_now поля
+                candidate.updated_at = timezone.now()
+                update_fields.update(data)
+                self.dedup.index_candidate(candidate, save=False)
+                to_update.append(candidate)
+
+        created = Candidate.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if to_update:
+            update_fields.update({'email_normalized', 'phone_normalized', 'resume_minhash', 'updated_at'})
+            Candidate.objects.bulk_update(to_update, list(update_fields), batch_size=self.batch_size)
+            CandidateLSHBucket.objects.filter(candidate__in=to_update).delete()
+
+        CandidateLSHBucket.objects.bulk_create([
+            CandidateLSHBucket(candidate=candidate, band=band, bucket=bucket)
+            for candidate in list(created) + to_update
+            for band, bucket in lsh_buckets(candidate.resume_minhash)
+        ], batch_size=self.batch_size * 4)
+
+        self.report["candidates_created"] += len(created)
+        self.report["candidates_updated"] += len(to_update)
+
+        result = dict(existing)
+        for candidate in created:
+            result[candidate.email_normalized] = candidate
+        return result
+
+    def _create_applications(self, rows, candidates_by_email) -> List[int]:
+        pairs = set()
+        for _, data, vacancy_id in rows:
+            if vacancy_id:
+                candidate = candidates_by_email[normalize_email(data['email'])]
+                pairs.add((vacancy_id, candidate.pk))
+        if not pairs:
+            return []
+
+        candidate_ids = {candidate_id for _, candidate_id in pairs}
+        vacancy_ids = {vacancy_id for vacancy_id, _ in pairs}
+        existing_pairs = set(
+            Application.objects.filter(candidate_id__in=candidate_ids, vacancy_id__in=vacancy_ids)
+            .values_list('vacancy_id', 'candidate_id')
+        )
+        new_pairs = pairs - existing_pairs
+
+        # ignore_conflicts защищает unique_together от параллельных импортов
+        Application.objects.bulk_create(
+            [Application(vacancy_id=vacancy_id, candidate_id=candidate_id,
+                         meta={'source': 'bulk_intake'})
+             for vacancy_id, candidate_id in new_pairs],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+        new_ids, vacancy_counts = [], Counter()
+        for pk, vacancy_id, candidate_id in (
+            Application.objects.filter(candidate_id__in=candidate_ids, vacancy_id__in=vacancy_ids)
+            .values_list('pk', 'vacancy_id', 'candidate_id')
+        ):
+            if (vacancy_id, candidate_id) in new_pairs:
+                new_ids.append(pk)
+                vacancy_counts[vacancy_id] += 1
+
+        # bulk_create не вызывает сигналы — переносим созданные отклики в воронки явно
+        FunnelService().track_bulk_created(vacancy_counts)
+
+        self.report["applications_created"] += len(new_ids)
+        self.report["applications_existing"] += len(pairs & existing_pairs)
+        return new_ids
+
+    def _dispatch_analysis(self, application_ids: Iterable[int]):
+        from analytics.services.fair_scheduler import FairScheduler
+
+        application_ids = list(application_ids)
+        try:
+            # Через справедливый планировщик: массовая загрузка получает свою долю
+            # LLM, не вытесняя анализы других работодателей; отправка — в batch-очередь
+            FairScheduler().enqueue(application_ids, batch=True)
+            self.report["analysis_dispatched"] += len(application_ids)
+        except Exception as e:
+            logger.exception("Failed to dispatch analysis for %d applications: %s",
+                             len(application_ids), e)
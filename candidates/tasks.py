@@ -0,0 +1,33 @@
+# candidates/tasks.py
+import io
+import logging
+
+from celery import shared_task
+from django.core.files.storage import default_storage
+
+from candidates.services.intake_service import BulkIntakeService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def bulk_import_task(path, fmt, default_vacancy_id=None, dispatch_analysis=True):
+    """
+    Импорт файла, загруженного через bulk-import API (очередь batch).
+    Файл лежит в default_storage и удаляется после импорта; результат
+    задачи — отчет BulkIntakeService.
+    """
+    service = BulkIntakeService(
+        default_vacancy_id=default_vacancy_id,
+        dispatch_analysis=dispatch_analysis,
+    )
+    try:
+        with default_storage.open(path, 'rb') as upload:
+            # utf-8-sig убирает BOM, который добавляют выгрузки из Excel
+            stream = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+            return service.run(stream, fmt)
+    finally:
+        try:
+            default_storage.delete(path)
+        except OSError as e:
+            logger.warning("Failed to delete bulk import file %s: %s", path, e)
@@ -1,3 +1,619 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient
+from rest_framework.throttling import BaseThrottle
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from analytics.models import RelevanceResult
+from candidates.models import Application, ArchivedTranscript, BotMessage, Candidate, CandidateResponse, ChatSession
+from candidates.services.analysis_events import (
+    EVENT_ANALYSIS_COMPLETE, EVENT_CHAT_INITIALIZED, AnalysisEventSubscription, EventState, missed_events,
+)
+from candidates.consumers import ApplicationConsumer
+from candidates.services import event_buffer
+from candidates.services.archive_service import TranscriptArchiveService, compress, decompress
+from candidates.services.dedup_service import (
+    LSH_BANDS, DedupService, compute_minhash, estimate_similarity, lsh_buckets, normalize_email,
+    normalize_phone,
+)
+from candidates.services.event_buffer import InMemoryEventBuffer, parse_event_id, publish_application_event
+from candidates.services.export_service import ApplicationExporter
+from candidates.services.intake_service import BulkIntakeService, RowError, clean_row
+from employers.models import Employer
+from jobs.models import Vacancy
+from project.celery import QUEUE_BATCH, TASK_BULK_IMPORT
+from utils.ws_token import generate_ws_token
+
+
+def make_chat_session(email="candidate@example.com"):
+    user = get_user_model().objects.create_user(username=f"employer-{email}")
+    employer = Employer.objects.create(user=user, company_name="Acme")
+    vacancy = Vacancy.objects.create(employer=employer, title="Python developer")
+    candidate = Candidate.objects.create(name="Test", email=email)
+    application = Application.objects.create(vacancy=vacancy, candidate=candidate)
+    return ChatSession.objects.create(application=application)
+
+
+class CleanRowTests(SimpleTestCase):
+    """Числовые поля проверяются по строке, до пачки"""
+
+    def row(self, **fields):
+        return {"name": "Test", "email": "test@example.com", **fields}
+
+    def test_salary_is_rounded_to_field_precision(self):
+        data, _ = clean_row(self.row(expected_salary="150 000.555"))
+        self.assertEqual(data["expected_salary"], Decimal("150000.56"))
+
+    def test_invalid_numbers_are_row_errors(self):
+        for fields in (
+            {"expected_salary": "1e12"},
+            {"expected_salary": "-5"},
+            {"expected_salary": "NaN"},
+            {"expected_salary": "много"},
+            {"notice_period": "20240101"},
+            {"experience_years": "inf"},
+        ):
+            with self.subTest(fields=fields):
+                with self.assertRaises(RowError):
+                    clean_row(self.row(**fields))
+
+
+class BulkIntakeServiceTests(TestCase):
+
+    def run_import(self, content: bytes, fmt="jsonl"):
+        stream = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8-sig", newline="")
+        return BulkIntakeService(dispatch_analysis=False).run(stream, fmt)
+
+    def test_out_of_range_row_does_not_fail_batch(self):
+        report = self.run_import(
+            b'{"name": "A", "email": "a@example.com", "expected_salary": 5000000000}\n'
+            b'{"name": "B", "email": "b@example.com", "expected_salary": 300000}\n'
+        )
+        self.assertEqual(report["candidates_created"], 1)
+        self.assertEqual([error["row"] for error in report["errors"]], [1])
+        self.assertEqual(Candidate.objects.get().email, "b@example.com")
+
+    def test_non_utf8_content_is_reported(self):
+        report = self.run_import(
+            b'{"name": "A", "email": "a@example.com"}\n'
+            + '{"name": "Иван", "email": "b@example.com"}\n'.encode("cp1251")
+        )
+        self.assertTrue(report["errors"])
+        self.assertTrue(report["errors"][0]["error"].startswith("invalid_encoding"))
+
+
+class BulkImportViewTests(TestCase):
+    """Импорт через API уходит в фоновую задачу, ответ — 202"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+
+    def upload(self, content: bytes, name="candidates.jsonl"):
+        return self.client.post(
+            "/api/candidates/candidates/bulk-import/",
+            {"file": SimpleUploadedFile(name, content), "vacancy": "7"},
+            format="multipart",
+        )
+
+    def test_import_is_queued(self):
+        with mock.patch("project.celery.app.send_task") as send_task:
+            send_task.return_value.id = "task-1"
+            response = self.upload(b'{"name": "A", "email": "a@example.com"}\n')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["task_id"], "task-1")
+        task_name = send_task.call_args.args[0]
+        path, fmt, vacancy_id, dispatch_analysis = send_task.call_args.kwargs["args"]
+        self.assertEqual((task_name, fmt, vacancy_id, dispatch_analysis), (TASK_BULK_IMPORT, "jsonl", 7, True))
+        self.assertTrue(path.startswith("imports/"))
+
+    def test_non_utf8_file_is_rejected(self):
+        with mock.patch("project.celery.app.send_task") as send_task:
+            response = self.upload("name,email\nИван,a@example.com\n".encode("cp1251"), name="c.csv")
+        self.assertEqual(response.status_code, 400)
+        send_task.assert_not_called()
+
+    def test_status_returns_report(self):
+        report = {"rows": 1, "errors": []}
+        with mock.patch("project.celery.app.AsyncResult") as async_result:
+            async_result.return_value.state = "SUCCESS"
+            async_result.return_value.successful.return_value = True
+            async_result.return_value.result = report
+            response = self.client.get("/api/candidates/candidates/bulk-import/task-1/")
+        self.assertEqual(response.json(), {"task_id": "task-1", "status": "success", "report": report})
+
+    def test_route_is_batch_queue(self):
+        from project.celery import app
+
+        self.assertEqual(app.conf.task_routes[TASK_BULK_IMPORT]["queue"], QUEUE_BATCH)
+
+
+RESUME = (
+    "Senior Python developer with eight years of experience building Django and Celery services, "
+    "designing PostgreSQL schemas, tuning Redis caches, running Kubernetes deployments, mentoring "
+    "junior engineers, leading code reviews and migrating a monolith to event driven microservices "
+    "for a large online marketplace in Almaty with strong focus on testing and observability"
+)
+
+
+class NormalizationTests(SimpleTestCase):
+
+    def test_email(self):
+        cases = {
+            " Ivan.Petrov+hh@Gmail.com ": "ivanpetrov@gmail.com",
+            "ivan.petrov@googlemail.com": "ivanpetrov@gmail.com",
+            "Ivan.Petrov+work@mail.ru": "ivan.petrov@mail.ru",
+            "not-an-email": "not-an-email",
+        }
+        for email, expected in cases.items():
+            with self.subTest(email=email):
+                self.assertEqual(normalize_email(email), expected)
+
+    def test_phone(self):
+        cases = {
+            "8 (701) 123-45-67": "+77011234567",
+            "+7 701 123 45 67": "+77011234567",
+            "+1-202-555-0100": "+12025550100",
+            "нет": "",
+        }
+        for phone, expected in cases.items():
+            with self.subTest(phone=phone):
+                self.assertEqual(normalize_phone(phone), expected)
+
+
+class LSHBandingTests(SimpleTestCase):
+    """Полосы LSH: похожие резюме попадают в общую корзину, разные — нет"""
+
+    def shared_bands(self, text_a, text_b):
+        return set(lsh_buckets(compute_minhash(text_a))) & set(lsh_buckets(compute_minhash(text_b)))
+
+    def test_identical_resumes_share_every_band(self):
+        self.assertEqual(len(self.shared_bands(RESUME, RESUME)), LSH_BANDS)
+        self.assertEqual(estimate_similarity(compute_minhash(RESUME), compute_minhash(RESUME)), 1.0)
+
+    def test_near_duplicate_shares_a_band(self):
+        edited = RESUME.replace("eight years", "nine years")
+        self.assertTrue(self.shared_bands(RESUME, edited))
+
+    def test_unrelated_resumes_share_no_band(self):
+        other = ("Accountant with tax reporting background, payroll, 1C, audits of small retail "
+                 "companies, preparing VAT declarations and quarterly financial statements")
+        self.assertFalse(self.shared_bands(RESUME, other))
+
+    def test_empty_resume_has_no_buckets(self):
+        self.assertEqual(lsh_buckets(compute_minhash("")), [])
+
+
+class DedupRelinkTests(TestCase):
+    """Правка кандидата пересвязывает его с кластером в том же вызове"""
+
+    def setUp(self):
+        self.service = DedupService()
+        self.root = Candidate.objects.create(name="Ivan", email="ivan@example.com", resume_text=RESUME)
+        self.service.register_candidate(self.root)
+
+    def create(self, **fields):
+        candidate = Candidate.objects.create(name="Other", **fields)
+        self.service.register_candidate(candidate)
+        return candidate
+
+    def test_update_links_new_duplicate(self):
+        candidate = self.create(email="other@example.com", resume_text="Accountant")
+        self.assertIsNone(candidate.duplicate_of_id)
+
+        candidate.email = "Ivan+new@Example.com"
+        candidate.save()
+        root = self.service.reindex_candidate(candidate)
+
+        self.assertEqual(root, self.root)
+        candidate.refresh_from_db()
+        self.assertEqual(candidate.duplicate_of_id, self.root.pk)
+
+    def test_update_unlinks_former_duplicate(self):
+        candidate = self.create(email="other@example.com", resume_text=RESUME)
+        self.assertEqual(candidate.duplicate_of_id, self.root.pk)
+
+        candidate.resume_text = "Accountant with tax reporting background"
+        candidate.save()
+        self.assertIsNone(self.service.reindex_candidate(candidate))
+        candidate.refresh_from_db()
+        self.assertIsNone(candidate.duplicate_of_id)
+
+    def test_root_keeps_its_duplicates_when_joining_another_cluster(self):
+        duplicate = self.create(email="ivan2@example.com", resume_text=RESUME)
+        other = self.create(email="anna@example.com", resume_text="Accountant")
+
+        self.root.email = "anna@example.com"
+        self.root.save()
+        self.service.reindex_candidate(self.root)
+
+        self.root.refresh_from_db()
+        duplicate.refresh_from_db()
+        self.assertEqual((self.root.duplicate_of_id, duplicate.duplicate_of_id), (other.pk, other.pk))
+
+
+class DenyThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        return False
+
+    def wait(self):
+        return 30
+
+
+class AsyncViewPolicyTests(TestCase):
+    """Async-представления чата применяют аутентификацию, права и троттлинг DRF"""
+
+    def setUp(self):
+        cache.clear()
+        self.chat_session = make_chat_session()
+        self.url = f"/api/candidates/chat-sessions/{self.chat_session.pk}/messages/"
+
+    def test_anonymous_read_with_default_policy(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_method_not_allowed(self):
+        self.assertEqual(self.client.delete(self.url).status_code, 405)
+
+    def test_missing_session_is_404(self):
+        response = self.client.get("/api/candidates/chat-sessions/999999/messages/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_permission_classes_are_applied(self):
+        with mock.patch.object(APIView, "permission_classes", [IsAuthenticated]):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 401)
+            self.assertIn("Bearer", response["WWW-Authenticate"])
+
+            user = self.chat_session.application.vacancy.employer.user
+            token = AccessToken.for_user(user)
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f"Bearer {token}")
+            self.assertEqual(response.status_code, 200)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(response.status_code, 401)
+
+    def test_throttling_is_applied(self):
+        with mock.patch.object(APIView, "throttle_classes", [DenyThrottle]):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+    def test_post_is_csrf_exempt(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        self.chat_session.is_active = False
+        self.chat_session.save()
+        response = client.post(f"/api/candidates/chat-sessions/{self.chat_session.pk}/send_message/",
+                               {"message": "hi"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class MessageSequenceTests(TestCase):
+    """Номера сообщений в сессии: монотонные, устойчивые к устаревшему last_seq"""
+
+    def setUp(self):
+        self.chat_session = make_chat_session()
+
+    def message(self, text, **fields):
+        return BotMessage.objects.create(chat_session=self.chat_session, sender="bot", text=text, **fields)
+
+    def test_messages_are_numbered_in_order(self):
+        seqs = [self.message(f"m{i}").seq for i in range(3)]
+        self.assertEqual(seqs, [1, 2, 3])
+        self.assertEqual(BotMessage.objects.get(seq=1).application_id, self.chat_session.application_id)
+
+    def test_stale_session_save_does_not_reuse_numbers(self):
+        stale = ChatSession.objects.get(pk=self.chat_session.pk)
+        self.message("first")
+        self.message("second")
+        stale.save()
+        ChatSession.objects.filter(pk=stale.pk).update(last_seq=0)
+        self.assertEqual(self.message("third").seq, 3)
+
+    def test_after_seq_returns_only_newer_messages(self):
+        for i in range(4):
+            self.message(f"m{i}")
+        url = f"/api/candidates/chat-sessions/{self.chat_session.pk}/messages/"
+        response = self.client.get(url, {"after_seq": 2})
+        self.assertEqual([m["seq"] for m in response.json()], [3, 4])
+        self.assertEqual(self.client.get(url, {"after_seq": "x"}).status_code, 400)
+
+    def test_backfill_numbers_after_existing_seq(self):
+        self.message("numbered")
+        application = self.chat_session.application
+        BotMessage.objects.bulk_create([
+            BotMessage(chat_session=self.chat_session, application=application, sender="bot", text="unnumbered"),
+            BotMessage(application=application, sender="candidate", text="legacy"),
+        ])
+
+        call_command("backfill_message_seq", stdout=io.StringIO())
+
+        self.assertEqual(
+            list(BotMessage.objects.order_by("seq").values_list("text", "seq")),
+            [("numbered", 1), ("unnumbered", 2), ("legacy", 3)],
+        )
+        self.assertEqual(BotMessage.objects.filter(chat_session__isnull=True).count(), 0)
+        self.assertEqual(ChatSession.objects.get(pk=self.chat_session.pk).last_seq, 3)
+        self.assertEqual(self.message("new").seq, 4)
+
+
+class ApplicationExportTests(TestCase):
+    """Потоковая выгрузка: строки с транскриптом, фиксированное число запросов на пачку"""
+
+    def setUp(self):
+        self.chat_session = make_chat_session()
+        self.application = self.chat_session.application
+        question = BotMessage.objects.create(chat_session=self.chat_session, sender="bot", text="Опыт?")
+        BotMessage.objects.create(chat_session=self.chat_session, sender="candidate", text="5 лет",
+                                  parent_message=question)
+
+    def export(self, fmt, **kwargs):
+        exporter = ApplicationExporter(Application.objects.all(), fmt=fmt, **kwargs)
+        return "".join(exporter.stream())
+
+    def test_jsonl_row_includes_transcript(self):
+        rows = [json.loads(line) for line in self.export("jsonl").splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["application_id"], self.application.id)
+        self.assertEqual(rows[0]["transcript"], "bot: Опыт?\ncandidate: 5 лет")
+
+    def test_excel_csv_has_bom_and_semicolons(self):
+        content = self.export("excel_csv", include_transcript=False)
+        self.assertTrue(content.startswith("\ufeffapplication_id;status;"))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.export("jsonl", chunk_size=100)
+            return len(queries)
+
+        before = count_queries()
+        for i in range(3):
+            make_chat_session(email=f"more{i}@example.com")
+        self.assertEqual(count_queries(), before)
+
+    def test_view_streams_attachment(self):
+        response = self.client.get("/api/candidates/applications/export/", {"fmt": "jsonl"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="applications.jsonl"', response["Content-Disposition"])
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1)
+
+        response = self.client.get("/api/candidates/applications/export/", {"fmt": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+
+class EventStateTests(SimpleTestCase):
+    """Токен возобновления и события, пропущенные между запросами"""
+
+    def test_token_round_trip(self):
+        state = EventState(result_version=123, chat_session_id=7)
+        self.assertEqual(EventState.from_token(state.token), state)
+        self.assertEqual(EventState.from_token("garbage"), EventState())
+        self.assertEqual(EventState.from_token(None), EventState())
+
+    def test_missed_events(self):
+        events = [{"type": EVENT_CHAT_INITIALIZED, "data": {}}, {"type": EVENT_ANALYSIS_COMPLETE, "data": {}}]
+        state = EventState(result_version=2, chat_session_id=5)
+        self.assertEqual(missed_events(EventState(), state, events), events)
+        self.assertEqual(missed_events(EventState(1, 5), state, events), events[1:])
+        self.assertEqual(missed_events(state, state, events), [])
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class AnalysisEventsTests(TestCase):
+    """Long-poll и SSE по завершению анализа без WebSocket"""
+
+    def setUp(self):
+        cache.clear()
+        self.chat_session = make_chat_session()
+        self.application = self.chat_session.application
+        self.url = f"/api/candidates/applications/{self.application.pk}/analysis_events/"
+
+    def test_existing_state_is_returned_immediately(self):
+        RelevanceResult.objects.create(application=self.application, score=80, summary="ok")
+        body = self.client.get(self.url, {"timeout": 0}).json()
+        self.assertEqual([e["type"] for e in body["events"]], [EVENT_CHAT_INITIALIZED, EVENT_ANALYSIS_COMPLETE])
+        self.assertEqual(body["events"][1]["data"]["score"], 80)
+
+        body = self.client.get(self.url, {"timeout": 0, "since": body["token"]}).json()
+        self.assertEqual(body["events"], [])
+
+    def test_timeout_returns_empty_events(self):
+        ChatSession.objects.filter(pk=self.chat_session.pk).delete()
+        body = self.client.get(self.url, {"timeout": 0}).json()
+        self.assertEqual(body, {"events": [], "token": EventState().token})
+
+    def test_bad_timeout_and_missing_application(self):
+        self.assertEqual(self.client.get(self.url, {"timeout": "soon"}).status_code, 400)
+        response = self.client.get("/api/candidates/applications/999999/analysis_events/")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_sse_stream_sends_state_and_closes_after_completion(self):
+        await RelevanceResult.objects.acreate(application=self.application, score=80, summary="ok")
+        response = await self.async_client.get(self.url, {"stream": "sse"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertLess(body.index(f"event: {EVENT_CHAT_INITIALIZED}"), body.index(f"event: {EVENT_ANALYSIS_COMPLETE}"))
+
+    async def test_group_event_wakes_subscription(self):
+        known = EventState(chat_session_id=self.chat_session.pk)
+        async with AnalysisEventSubscription(self.application.pk) as subscription:
+            await subscription.channel_layer.group_send(subscription.group_name, {
+                "type": EVENT_ANALYSIS_COMPLETE, "data": {"score": 55},
+            })
+            events, state = await subscription.next_events(known, timeout=1)
+        self.assertEqual(events, [{"type": EVENT_ANALYSIS_COMPLETE, "data": {"score": 55}}])
+        self.assertEqual(state.chat_session_id, self.chat_session.pk)
+
+
+class TranscriptArchiveTests(TestCase):
+    """Переписка старых завершенных сессий переносится в сжатый архив"""
+
+    def setUp(self):
+        self.chat_session = make_chat_session()
+        self.question = BotMessage.objects.create(chat_session=self.chat_session, sender="bot", text="Зарплата?",
+                                                  is_question=True)
+        BotMessage.objects.create(chat_session=self.chat_session, sender="candidate", text="300к",
+                                  parent_message=self.question)
+        thanks = BotMessage.objects.create(chat_session=self.chat_session, sender="bot", text="Спасибо!")
+        BotMessage.objects.create(chat_session=self.chat_session, sender="candidate", text="И вам",
+                                  parent_message=thanks)
+        CandidateResponse.objects.create(application=self.chat_session.application,
+                                         question_message=self.question, answer_text="300к")
+        self.url = f"/api/candidates/chat-sessions/{self.chat_session.pk}/messages/"
+
+    def finish(self, days_ago=120):
+        ChatSession.objects.filter(pk=self.chat_session.pk).update(
+            is_active=False, status="completed", last_activity=timezone.now() - timedelta(days=days_ago)
+        )
+
+    def test_codec_round_trip(self):
+        codec, payload = compress(b"transcript" * 100)
+        self.assertEqual(decompress(codec, payload), b"transcript" * 100)
+
+    def test_archived_transcript_reads_like_live_one(self):
+        self.finish()
+        before = self.client.get(self.url).json()
+
+        self.assertEqual(TranscriptArchiveService().run(), {"sessions": 1, "messages": 4})
+        archived = ArchivedTranscript.objects.get(chat_session=self.chat_session)
+        self.assertEqual(archived.message_count, 4)
+        self.assertEqual(self.client.get(self.url).json(), before)
+
+    def test_referenced_questions_are_kept(self):
+        self.finish()
+        TranscriptArchiveService().run()
+        self.assertEqual(list(BotMessage.objects.filter(chat_session=self.chat_session)), [self.question])
+        self.assertTrue(CandidateResponse.objects.filter(question_message=self.question).exists())
+
+    def test_recent_and_active_sessions_are_skipped(self):
+        self.assertEqual(TranscriptArchiveService().run(), {"sessions": 0, "messages": 0})
+        self.finish(days_ago=1)
+        self.assertEqual(TranscriptArchiveService().run(), {"sessions": 0, "messages": 0})
+        self.assertEqual(BotMessage.objects.filter(chat_session=self.chat_session).count(), 4)
+
+    def test_run_is_idempotent(self):
+        self.finish()
+        TranscriptArchiveService().run()
+        self.assertEqual(TranscriptArchiveService().run(), {"sessions": 0, "messages": 0})
+        self.assertEqual(TranscriptArchiveService().archive_session(self.chat_session.pk), 0)
+
+
+class InMemoryEventBufferTests(SimpleTestCase):
+    """Буфер событий: чтение после id и признак вытеснения пропущенного"""
+
+    def test_parse_event_id(self):
+        self.assertEqual(parse_event_id("1700000000000-3"), (1700000000000, 3))
+        self.assertLess(parse_event_id("9-0"), parse_event_id("10-0"))
+        self.assertEqual(parse_event_id("garbage"), (0, 0))
+
+    def test_read_after(self):
+        buffer = InMemoryEventBuffer()
+        first = buffer.append(1, {"type": "bot.message", "text": "a"})
+        buffer.append(2, {"type": "bot.message", "text": "other"})
+        buffer.append(1, {"type": "bot.message", "text": "b"})
+        events, truncated = buffer.read_after(1, first)
+        self.assertEqual([message["text"] for _, message in events], ["b"])
+        self.assertFalse(truncated)
+
+    @override_settings(EVENT_BUFFER_MAXLEN=2)
+    def test_evicted_events_report_truncation(self):
+        buffer = InMemoryEventBuffer()
+        first = buffer.append(1, {"text": "a"})
+        for text in "bcd":
+            buffer.append(1, {"text": text})
+        events, truncated = buffer.read_after(1, first)
+        self.assertEqual([message["text"] for _, message in events], ["c", "d"])
+        self.assertTrue(truncated)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ResumableApplicationEventsTests(TestCase):
+    """Переподключившийся WebSocket-клиент получает пропущенные события по last_event_id"""
+
+    def setUp(self):
+        self.application = make_chat_session().application
+        patcher = mock.patch.object(event_buffer, "_buffer", InMemoryEventBuffer())
+        self.buffer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self, last_event_id=None):
+        """WebSocket-подключение к ApplicationConsumer (channels.testing требует daphne)"""
+        query = f"token={generate_ws_token(self.application.pk)}"
+        if last_event_id:
+            query += f"&last_event_id={last_event_id}"
+        communicator = ApplicationCommunicator(ApplicationConsumer.as_asgi(), {
+            "type": "websocket", "path": "/ws/application/", "query_string": query.encode(),
+            "headers": [], "subprotocols": [],
+        })
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual((await communicator.receive_output())["type"], "websocket.accept")
+        return communicator
+
+    @staticmethod
+    async def disconnect(communicator):
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait()
+
+    async def receive_json(self, communicator):
+        return json.loads((await communicator.receive_output())["text"])
+
+    def test_published_events_carry_buffer_id(self):
+        publish_application_event(self.application.pk, {"type": "bot.message", "text": "Привет"})
+        events, _ = self.buffer.read_after(self.application.pk, "0-0")
+        self.assertEqual(events[0][1], {"type": "bot.message", "text": "Привет"})
+
+    def test_publish_without_buffer_still_delivers(self):
+        with mock.patch.object(self.buffer, "append", side_effect=ConnectionError("redis down")), \
+                self.assertLogs("candidates.services.event_buffer", "WARNING"), \
+                mock.patch("candidates.services.event_buffer.get_channel_layer") as get_layer:
+            get_layer.return_value.group_send = mock.AsyncMock()
+            publish_application_event(self.application.pk, {"type": "bot.message", "text": "Привет"})
+        get_layer.return_value.group_send.assert_awaited_once_with(
+            f"application_{self.application.pk}", {"type": "bot.message", "text": "Привет"}
+        )
+
+    async def test_reconnect_replays_missed_events(self):
+        seen = self.buffer.append(self.application.pk, {"type": "bot.message", "text": "seen"})
+        self.buffer.append(self.application.pk, {"type": "bot.message", "text": "missed"})
+
+        communicator = await self.connect(last_event_id=seen)
+        message = await self.receive_json(communicator)
+        self.assertEqual((message["type"], message["text"]), ("bot.message", "missed"))
+        self.assertTrue(await communicator.receive_nothing())
+        await self.disconnect(communicator)
+
+    async def test_evicted_history_requires_resync(self):
+        with override_settings(EVENT_BUFFER_MAXLEN=1):
+            seen = self.buffer.append(self.application.pk, {"type": "bot.message", "text": "seen"})
+            self.buffer.append(self.application.pk, {"type": "bot.message", "text": "missed"})
+            self.buffer.append(self.application.pk, {"type": "bot.message", "text": "latest"})
+
+        communicator = await self.connect(last_event_id=seen)
+        self.assertEqual(await self.receive_json(communicator), {"type": "resync.required"})
+        self.assertEqual((await self.receive_json(communicator))["text"], "latest")
+        await self.disconnect(communicator)
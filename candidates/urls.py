@@ -1,7 +1,7 @@
 # candidates/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
 
 router = DefaultRouter()
 router.register(r'candidates', views.CandidateViewSet)
@@ -11,5 +11,16 @@ router.register(r'bot-messages', views.BotMessageViewSet)
 router.register(r'candidate-responses', views.CandidateResponseViewSet)
 
 urlpatterns = [
+    # Async-представления (ASGI): чат и опрос результатов анализа
+    path('chat-sessions/<int:pk>/messages/', async_views.chat_messages,
+         name='chatsession-messages'),
+    path('chat-sessions/<int:pk>/send_message/', async_views.chat_send_message,
+         name='chatsession-send-message'),
+    path('chat-sessions/<int:pk>/complete/', async_views.chat_complete,
+         name='chatsession-complete'),
+    path('applications/<int:pk>/analysis_results/', async_views.application_analysis_results,
+         name='application-analysis-results'),
+    path('applications/<int:pk>/analysis_events/', async_views.application_analysis_events,
+         name='application-analysis-events'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -3,9 +3,15 @@ from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+import codecs
+import uuid
 
 from .models import Candidate, Application, BotMessage, ChatSession, CandidateResponse
 from .serializers import (
@@ -13,11 +19,18 @@ from .serializers import (
     ApplicationSerializer,
     BotMessageSerializer,
     ChatSessionSerializer,
-    CandidateResponseSerializer,
-    ChatMessageSerializer
+    CandidateResponseSerializer
 )
-from analytics.tasks import analyze_application_task, process_chat_completion_task
-from analytics.services.chat_service import ChatService
+from project.celery import TASK_BULK_IMPORT, app as celery_app, dispatch
+from project.response_cache import CachedResponseMixin, chat_scope
+from analytics.services.chat_service import get_chat_service
+from analytics.services.fair_scheduler import FairScheduler
+from candidates.services.dedup_service import DedupService
+from candidates.services.export_service import ApplicationExporter, EXPORT_FORMATS
+from candidates.services.intake_service import SUPPORTED_FORMATS, detect_format
+
+# Сколько байт начала файла импорта проверяется на UTF-8 до постановки в очередь
+IMPORT_ENCODING_PROBE_BYTES = 64 * 1024
 
 
 class CandidateViewSet(viewsets.ModelViewSet):
@@ -39,6 +52,108 @@ class CandidateViewSet(viewsets.ModelViewSet):
             'applications'
         ).order_by('-created_at')
 
+    def perform_create(self, serializer):
+        """
+        Создание кандидата с привязкой к кластеру дубликатов.
+        """
+        candidate = serializer.save()
+        DedupService().register_candidate(candidate)
+
+    def perform_update(self, serializer):
+        """
+        Обновление кандидата с переиндексацией и пересвязкой кластера дубликатов.
+        """
+        candidate = serializer.save()
+        DedupService().reindex_candidate(candidate)
+
+    @action(detail=True, methods=['GET'])
+    def duplicates(self, request, pk=None):
+        """
+        Вероятные дубликаты кандидата с оценкой похожести.
+        """
+        candidate = self.get_object()
+        duplicates = DedupService().find_duplicates(candidate)
+        return Response([
+            {
+                "candidate": CandidateSerializer(duplicate).data,
+                "similarity": round(similarity, 3),
+            }
+            for duplicate, similarity in duplicates
+        ])
+
+    @action(detail=False, methods=['POST'], url_path='bulk-import',
+            parser_classes=[MultiPartParser, FormParser])
+    def bulk_import(self, request):
+        """
+        Фоновый импорт кандидатов и откликов из файла JSONL/CSV.
+
+        Параметры формы: file, fmt (jsonl|csv, по умолчанию по расширению),
+        vacancy (вакансия по умолчанию для строк без vacancy_id),
+        analyze (false — не запускать анализ).
+        Файл сохраняется и импортируется задачей в очереди batch; ответ 202
+        с task_id, отчет — по GET bulk-import/<task_id>/.
+        """
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response(
+                {"detail": "Файл не передан"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fmt = request.data.get('fmt') or detect_format(upload.name)
+        if fmt not in SUPPORTED_FORMATS:
+            return Response(
+                {"detail": f"Неподдерживаемый формат: {fmt}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        vacancy_id = request.data.get('vacancy') or None
+        if vacancy_id is not None:
+            try:
+                vacancy_id = int(vacancy_id)
+            except (TypeError, ValueError):
+                return Response(
+                    {"detail": f"Некорректная вакансия: {vacancy_id}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        dispatch_analysis = str(request.data.get('analyze', 'true')).lower() not in ('0', 'false', 'no')
+
+        # Файл не в UTF-8 (например, выгрузка Excel в cp1251) отклоняем сразу;
+        # ошибку кодировки дальше по файлу импорт запишет в отчет
+        head = upload.read(IMPORT_ENCODING_PROBE_BYTES)
+        upload.seek(0)
+        try:
+            codecs.getincrementaldecoder('utf-8-sig')().decode(head, final=False)
+        except UnicodeDecodeError:
+            return Response(
+                {"detail": "Файл должен быть в кодировке UTF-8"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        path = default_storage.save(f"imports/{uuid.uuid4().hex}.{fmt}", upload)
+        try:
+            result = dispatch(TASK_BULK_IMPORT, path, fmt, vacancy_id, dispatch_analysis)
+        except Exception:
+            default_storage.delete(path)
+            raise
+        return Response(
+            {"task_id": result.id, "status": "queued"},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    @action(detail=False, methods=['GET'], url_path=r'bulk-import/(?P<task_id>[^/.]+)')
+    def bulk_import_status(self, request, task_id=None):
+        """
+        Состояние фонового импорта; после завершения — отчет с ошибками по строкам.
+        """
+        result = celery_app.AsyncResult(task_id)
+        data = {"task_id": task_id, "status": result.state.lower()}
+        if result.successful():
+            data["report"] = result.result
+        elif result.failed():
+            data["detail"] = str(result.result)
+        return Response(data)
+
 
 class ApplicationViewSet(viewsets.ModelViewSet):
     """
@@ -52,6 +167,8 @@ class ApplicationViewSet(viewsets.ModelViewSet):
 
     serializer_class = ApplicationSerializer
     permission_classes = [AllowAny]  # AllowAny для всего
+    # Чтения, которые можно отдавать с реплики БД (project/db_router.py)
+    replica_actions = ('list', 'retrieve', 'export')
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['vacancy', 'status', 'candidate']
     search_fields = [
@@ -67,12 +184,12 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         with transaction.atomic():
             application = serializer.save()
 
-            # Запускаем анализ в фоне
-            task = analyze_application_task.delay(application.id)
+            # Ставим анализ в очередь планировщика; задача уйдет после коммита
+            task_ids = FairScheduler().enqueue([application.id])
 
             # Сохраняем ID задачи в метаданные
             application.meta.update({
-                'analysis_task_id': task.id,
+                'analysis_task_id': task_ids.get(application.id),
                 'created_from_ip': self.get_client_ip()
             })
             application.save()
@@ -98,7 +215,7 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         Получение сообщений чата для отклика.
         """
         application = self.get_object()
-        messages = application.messages.all().order_by('created_at')
+        messages = application.messages.all().order_by(F('seq').asc(nulls_first=True), 'created_at', 'id')
         serializer = BotMessageSerializer(messages, many=True)
         return Response(serializer.data)
 
@@ -131,7 +248,7 @@ class ApplicationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        chat_service = ChatService()
+        chat_service = get_chat_service()
         chat_session = chat_service.initialize_chat_for_application(application.id)
 
         if chat_session:
@@ -143,29 +260,39 @@ class ApplicationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    @action(detail=True, methods=['GET'])
-    def analysis_results(self, request, pk=None):
-        """
-        Получение результатов анализа отклика.
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
         """
-        from analytics.models import RelevanceResult
+        Потоковая выгрузка откликов с баллами и транскриптами чатов.
 
-        application = self.get_object()
-
-        try:
-            relevance_result = RelevanceResult.objects.get(application=application)
-            return Response({
-                "score": relevance_result.score,
-                "summary": relevance_result.summary,
-                "reasons": relevance_result.reasons,
-                "created_at": relevance_result.created_at
-            })
-        except RelevanceResult.DoesNotExist:
+        Параметры: fmt (csv|excel_csv|jsonl), фильтры vacancy/status/candidate,
+        min_score, transcript=false — без переписки.
+        """
+        fmt = request.query_params.get('fmt', 'csv')
+        if fmt not in EXPORT_FORMATS:
             return Response(
-                {"detail": "Результаты анализа еще не готовы"},
-                status=status.HTTP_404_NOT_FOUND
+                {"detail": f"Неподдерживаемый формат: {fmt}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
+        queryset = self.filter_queryset(Application.objects.all())
+        min_score = request.query_params.get('min_score')
+        if min_score:
+            try:
+                queryset = queryset.filter(final_score__gte=float(min_score))
+            except ValueError:
+                return Response(
+                    {"detail": "min_score должен быть числом"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        include_transcript = request.query_params.get('transcript', 'true').lower() not in ('0', 'false', 'no')
+        exporter = ApplicationExporter(queryset, fmt=fmt, include_transcript=include_transcript)
+
+        response = StreamingHttpResponse(exporter.stream(), content_type=exporter.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{exporter.filename}"'
+        return response
+
     def get_client_ip(self):
         """
         Получение IP адреса клиента.
@@ -178,9 +305,10 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         return ip
 
 
-class ChatSessionViewSet(viewsets.ReadOnlyModelViewSet):
+class ChatSessionViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для чтения чат-сессий.
+    Сообщения, отправка ответа и завершение — async-представления (async_views).
     """
     queryset = ChatSession.objects.select_related(
         'application',
@@ -195,62 +323,8 @@ class ChatSessionViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['is_active', 'status', 'application']
 
-    @action(detail=True, methods=['GET'])
-    def messages(self, request, pk=None):
-        """
-        Получение сообщений чат-сессии.
-        """
-        chat_session = self.get_object()
-        messages = chat_session.messages.all().order_by('created_at')
-        serializer = ChatMessageSerializer(messages, many=True)
-        return Response(serializer.data)
-
-    @action(detail=True, methods=['POST'])
-    def send_message(self, request, pk=None):
-        """
-        Отправка сообщения от кандидата в чат-сессию.
-        """
-        chat_session = self.get_object()
-
-        if not chat_session.is_active:
-            return Response(
-                {"detail": "Чат-сессия завершена"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        message_text = request.data.get('message', '').strip()
-        if not message_text:
-            return Response(
-                {"detail": "Сообщение не может быть пустым"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        chat_service = ChatService()
-        result = chat_service.process_candidate_response(chat_session.id, message_text)
-
-        # Если чат завершен, запускаем финальный анализ
-        if result.get('status') == 'completed':
-            process_chat_completion_task.delay(chat_session.application.id)
-
-        return Response(result)
-
-    @action(detail=True, methods=['POST'])
-    def complete(self, request, pk=None):
-        """
-        Принудительное завершение чат-сессии.
-        """
-        chat_session = self.get_object()
-
-        if not chat_session.is_active:
-            return Response(
-                {"detail": "Чат-сессия уже завершена"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        chat_session.mark_completed()
-        process_chat_completion_task.delay(chat_session.application.id)
-
-        return Response({"detail": "Чат-сессия завершена"})
+    def detail_cache_scopes(self, pk):
+        return [chat_scope(pk)]
 
 
 class BotMessageViewSet(viewsets.ModelViewSet):
@@ -0,0 +1,21 @@
+# employers/signals.py
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from employers.models import Employer
+from project.authentication import invalidate_user_cache
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Сбрасывает кэш аутентификации при изменении пользователя"""
+    invalidate_user_cache(instance.pk)
+
+
+@receiver(post_save, sender=Employer)
+@receiver(post_delete, sender=Employer)
+def invalidate_cached_employer(sender, instance, **kwargs):
+    """id работодателя хранится в кэше пользователя — сбрасываем его"""
+    invalidate_user_cache(instance.user_id)
@@ -1,3 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from employers.models import Employer
+from project import authentication
+from project.authentication import CachedJWTAuthentication, load_auth_user, user_employer_id
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    """Пользователь и его работодатель берутся из кэша, кэш сбрасывается сигналами"""
+
+    def setUp(self):
+        cache.clear()
+        authentication._local.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(authentication._local.clear)
+        self.user = get_user_model().objects.create_user(username="employer")
+        self.employer = Employer.objects.create(user=self.user, company_name="Acme")
+
+    def authenticate(self):
+        return CachedJWTAuthentication().get_user(AccessToken.for_user(self.user))
+
+    def test_repeated_requests_skip_database(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual(user_employer_id(user), self.employer.pk)
+
+    def test_returns_copies(self):
+        self.assertIsNot(load_auth_user(self.user.pk), load_auth_user(self.user.pk))
+
+    def test_user_without_employer(self):
+        Employer.objects.filter(pk=self.employer.pk).delete()
+        authentication.invalidate_user_cache(self.user.pk)
+        user = self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertIsNone(user_employer_id(user))
+
+    def test_deactivation_invalidates_cache(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_employer_change_invalidates_cache(self):
+        Employer.objects.filter(pk=self.employer.pk).delete()
+        authentication.invalidate_user_cache(self.user.pk)
+        self.authenticate()
+        employer = Employer.objects.create(user=self.user, company_name="Acme 2")
+        self.assertEqual(user_employer_id(self.authenticate()), employer.pk)
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        token = AccessToken.for_user(self.user)
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            CachedJWTAuthentication().get_user(token)
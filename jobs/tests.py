@@ -1,3 +1,161 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from employers.models import Employer
+from jobs.models import Vacancy
+from project import db_router
+from project.db_router import PRIMARY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from project.response_cache import etag_matches
+
+
+class EtagMatchTests(SimpleTestCase):
+
+    def test_if_none_match_forms(self):
+        factory = RequestFactory()
+        for header, expected in (
+            ('"abc"', True),
+            ('"x", "abc"', True),
+            ('W/"abc"', True),
+            ("*", True),
+            ('"other"', False),
+            ("", False),
+        ):
+            with self.subTest(header=header):
+                request = factory.get("/", HTTP_IF_NONE_MATCH=header)
+                self.assertIs(etag_matches(request, '"abc"'), expected)
+
+
+class VacancyResponseCacheTests(TestCase):
+    """ETag/304 для чтения вакансий; сохранение вакансии или компании меняет ETag"""
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(username="employer")
+        self.employer = Employer.objects.create(user=user, company_name="Acme")
+        self.vacancy = Vacancy.objects.create(employer=self.employer, title="Python developer")
+        self.client = APIClient()
+        self.url = f"/api/jobs/vacancies/{self.vacancy.pk}/"
+
+    def test_not_modified_with_matching_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_saving_vacancy_invalidates_cached_response(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vacancy.title = "Senior Python developer"
+            self.vacancy.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["title"], "Senior Python developer")
+
+    def test_list_is_invalidated_by_employer_rename(self):
+        etag = self.client.get("/api/jobs/vacancies/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employer.company_name = "Acme Corp"
+            self.employer.save()
+
+        response = self.client.get("/api/jobs/vacancies/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        etag = self.client.get("/api/jobs/vacancies/")["ETag"]
+        response = self.client.get("/api/jobs/vacancies/?page=1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+def viewset_view(action, replica_actions=None):
+    """Заглушка вьюсет-представления DRF: as_view() выставляет actions и cls"""
+    def view(request):
+        return HttpResponse()
+    view.actions = {"get": action}
+    view.cls = type("View", (), {"replica_actions": replica_actions} if replica_actions else {})
+    return view
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=["replica_1"])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Чтения на реплику только для разрешенных действий и без записи в запросе"""
+
+    def setUp(self):
+        db_router._replica_health.clear()
+        self.addCleanup(db_router._replica_health.clear)
+        patcher = mock.patch.object(db_router, "replica_lag", return_value=0.0)
+        self.replica_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def run_request(self, request, view, body=None):
+        """Проходит middleware; body выполняется внутри запроса и получает router"""
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            if body:
+                body(self.router)
+            seen["db"] = self.router.db_for_read(Vacancy)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(request), seen["db"]
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertIsNone(self.router.db_for_read(Vacancy))
+
+    def test_list_reads_from_replica(self):
+        response, db = self.run_request(self.factory.get("/"), viewset_view("list"))
+        self.assertEqual(db, "replica_1")
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_custom_actions_need_opt_in(self):
+        _, db = self.run_request(self.factory.get("/"), viewset_view("stats"))
+        self.assertIsNone(db)
+        _, db = self.run_request(self.factory.get("/"), viewset_view("stats", replica_actions=("stats",)))
+        self.assertEqual(db, "replica_1")
+
+    def test_write_pins_request_and_client_to_primary(self):
+        response, db = self.run_request(
+            self.factory.get("/"), viewset_view("list"), body=lambda router: router.db_for_write(Vacancy)
+        )
+        self.assertIsNone(db)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        request = self.factory.get("/")
+        request.COOKIES[PRIMARY_COOKIE] = response.cookies[PRIMARY_COOKIE].value
+        _, db = self.run_request(request, viewset_view("list"))
+        self.assertIsNone(db)
+
+    def test_lagging_replica_is_skipped_and_check_is_cached(self):
+        self.replica_lag.return_value = 60.0
+        with self.assertLogs("project.db_router", "WARNING"):
+            _, db = self.run_request(self.factory.get("/"), viewset_view("list"))
+        self.assertIsNone(db)
+        self.run_request(self.factory.get("/"), viewset_view("list"))
+        self.assertEqual(self.replica_lag.call_count, 1)
+
+    def test_unavailable_replica_is_skipped(self):
+        self.replica_lag.side_effect = RuntimeError("connection refused")
+        with self.assertLogs("project.db_router", "WARNING"):
+            _, db = self.run_request(self.factory.get("/"), viewset_view("list"))
+        self.assertIsNone(db)
+
+    def test_unsafe_methods_use_primary(self):
+        _, db = self.run_request(self.factory.post("/"), viewset_view("list"))
+        self.assertIsNone(db)
+
+    def test_replicas_do_not_migrate(self):
+        self.assertIs(self.router.allow_migrate("replica_1", "jobs"), False)
+        self.assertIsNone(self.router.allow_migrate("default", "jobs"))
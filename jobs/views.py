@@ -1,9 +1,16 @@
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
+from project.response_cache import CachedResponseMixin, SCOPE_VACANCY_LIST, vacancy_scope
 from .models import Vacancy
 from .serializers import VacancySerializer
 
-class VacancyViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Vacancy.objects.all()
+class VacancyViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Vacancy.objects.select_related('employer').all()
     serializer_class = VacancySerializer
-    permission_classes = [AllowAny]
\ No newline at end of file
+    permission_classes = [AllowAny]
+
+    def list_cache_scopes(self):
+        return [SCOPE_VACANCY_LIST]
+
+    def detail_cache_scopes(self, pk):
+        return [vacancy_scope(pk)]
@@ -0,0 +1,123 @@
+# project/authentication.py
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# Признак "профиля работодателя нет" (None в кэше означает промах)
+NO_EMPLOYER = 0
+
+_local = {}
+_local_lock = threading.Lock()
+LOCAL_MAX_ENTRIES = 10000
+
+
+def _cache_key(user_id) -> str:
+    return f"auth:user:{user_id}"
+
+
+def _local_get(user_id):
+    # id из токена — строка, в сигналах — pk модели; ключи приводятся к str
+    user_id = str(user_id)
+    entry = _local.get(user_id)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at < time.monotonic():
+        _local.pop(user_id, None)
+        return None
+    return user
+
+
+def _local_set(user_id, user):
+    ttl = getattr(settings, 'AUTH_USER_LOCAL_TTL', 10)
+    with _local_lock:
+        if len(_local) >= LOCAL_MAX_ENTRIES:
+            _local.clear()
+        _local[str(user_id)] = (time.monotonic() + ttl, user)
+
+
+def invalidate_user_cache(user_id):
+    """
+    Сбрасывает кэш пользователя (при изменении пользователя или работодателя).
+    Локальные кэши других процессов истекают сами через AUTH_USER_LOCAL_TTL.
+    """
+    if user_id is None:
+        return
+    _local.pop(str(user_id), None)
+    cache.delete(_cache_key(user_id))
+
+
+def load_auth_user(user_id):
+    """
+    Пользователь с id профиля работодателя (атрибут _employer_id).
+    Порядок: локальный кэш процесса -> общий кэш (Redis) -> БД.
+    Возвращает копию, чтобы запросы не делили один экземпляр.
+    """
+    from django.contrib.auth import get_user_model
+    from employers.models import Employer
+
+    user = _local_get(user_id)
+    if user is None:
+        user = cache.get(_cache_key(user_id))
+        if user is None:
+            User = get_user_model()
+            user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            if user is None:
+                return None
+            user._employer_id = Employer.objects.filter(user_id=user.pk).values_list(
+                'pk', flat=True
+            ).first() or NO_EMPLOYER
+            cache.set(_cache_key(user_id), user, getattr(settings, 'AUTH_USER_CACHE_TTL', 300))
+        _local_set(user_id, user)
+    return copy.copy(user)
+
+
+def user_employer_id(user):
+    """
+    id профиля работодателя пользователя или None.
+    Для пользователей из CachedJWTAuthentication — без запроса к БД.
+    """
+    if not user or not user.is_authenticated:
+        return None
+    employer_id = getattr(user, '_employer_id', None)
+    if employer_id is None:
+        from employers.models import Employer
+        employer_id = Employer.objects.filter(user_id=user.pk).values_list('pk', flat=True).first() or NO_EMPLOYER
+        user._employer_id = employer_id
+    return employer_id or None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication без запроса пользователя на каждый запрос:
+    пользователь и id его работодателя берутся из кэша с коротким TTL,
+    кэш сбрасывается при изменении пользователя или работодателя
+    (employers/signals.py).
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = load_auth_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if getattr(api_settings, 'CHECK_USER_IS_ACTIVE', True) and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            from rest_framework_simplejwt.utils import get_md5_hash_password
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -1,8 +1,219 @@
 # project/celery.py
+import logging
 import os
+import time
+
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import before_task_publish, celeryd_init, task_failure, task_prerun, worker_process_init
+from kombu import Exchange, Queue
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
 app = Celery("project")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+# ---------------------------------------------------------------------
+# Топология очередей
+# ---------------------------------------------------------------------
+# chat        — интерактивные ходы чата (кандидат ждет ответа)
+# analysis    — первичный анализ нового отклика
+# batch       — массовый импорт, пересчеты, replay
+# maintenance — периодические служебные задачи
+#
+# Каждую очередь обслуживает отдельный воркер, например:
+#   celery -A project worker -Q chat -n chat@%h
+#   celery -A project worker -Q analysis -n analysis@%h
+#   celery -A project worker -Q batch -n batch@%h
+#   celery -A project worker -Q maintenance -n maintenance@%h
+# Concurrency/prefetch такого воркера берутся из QUEUE_TOPOLOGY,
+# если не заданы явно в командной строке.
+#
+# Приоритетов сообщений нет: у всех сообщений одной очереди он был бы
+# одинаковым, а между очередями порядок не задает ни Redis, ни RabbitMQ.
+# Чат не ждет за анализом и batch за счет отдельных воркеров на очередь.
+
+QUEUE_CHAT = "chat"
+QUEUE_ANALYSIS = "analysis"
+QUEUE_BATCH = "batch"
+QUEUE_MAINTENANCE = "maintenance"
+
+QUEUE_TOPOLOGY = {
+    QUEUE_CHAT: {
+        "concurrency": int(os.getenv("CELERY_CHAT_CONCURRENCY", 4)),
+        "prefetch_multiplier": 1,
+    },
+    QUEUE_ANALYSIS: {
+        "concurrency": int(os.getenv("CELERY_ANALYSIS_CONCURRENCY", 8)),
+        "prefetch_multiplier": 1,
+    },
+    QUEUE_BATCH: {
+        "concurrency": int(os.getenv("CELERY_BATCH_CONCURRENCY", 8)),
+        "prefetch_multiplier": 4,
+    },
+    QUEUE_MAINTENANCE: {
+        "concurrency": int(os.getenv("CELERY_MAINTENANCE_CONCURRENCY", 1)),
+        "prefetch_multiplier": 1,
+    },
+}
+
+app.conf.task_queues = [
+    Queue(name, Exchange(name, type="direct"), routing_key=name)
+    for name in QUEUE_TOPOLOGY
+]
+app.conf.task_default_queue = QUEUE_ANALYSIS
+app.conf.task_default_exchange = QUEUE_ANALYSIS
+app.conf.task_default_routing_key = QUEUE_ANALYSIS
+
+
+# Имена задач для отправки без импорта модулей задач (и LLM SDK) в веб-процессе
+TASK_ANALYZE_APPLICATION = "analytics.tasks.analyze_application_task"
+TASK_PROCESS_CHAT_COMPLETION = "analytics.tasks.process_chat_completion_task"
+TASK_BULK_IMPORT = "candidates.tasks.bulk_import_task"
+
+
+def dispatch(task_name, *args, **options):
+    """Отправляет задачу по имени; маршрут берется из task_routes"""
+    return app.send_task(task_name, args=args, **options)
+
+
+def _route(queue):
+    return {"queue": queue, "routing_key": queue}
+
+
+app.conf.task_routes = {
+    TASK_PROCESS_CHAT_COMPLETION: _route(QUEUE_CHAT),
+    TASK_ANALYZE_APPLICATION: _route(QUEUE_ANALYSIS),
+    TASK_BULK_IMPORT: _route(QUEUE_BATCH),
+    # Стадии конвейера анализа; при запуске из batch наследуют очередь запуска
+    "analytics.tasks.rule_based_stage": _route(QUEUE_ANALYSIS),
+    "analytics.tasks.llm_evaluate_stage": _route(QUEUE_ANALYSIS),
+    "analytics.tasks.questions_stage": _route(QUEUE_ANALYSIS),
+    "analytics.tasks.persist_stage": _route(QUEUE_ANALYSIS),
+    "analytics.tasks.chat_init_stage": _route(QUEUE_ANALYSIS),
+    "analytics.tasks.notify_stage": _route(QUEUE_ANALYSIS),
+    "analytics.tasks.timeout_chat_sessions": _route(QUEUE_MAINTENANCE),
+    "analytics.tasks.rebuild_funnels_task": _route(QUEUE_MAINTENANCE),
+    "analytics.tasks.replay_degraded_analyses_task": _route(QUEUE_MAINTENANCE),
+    "analytics.tasks.reconcile_dead_letters_task": _route(QUEUE_MAINTENANCE),
+    "analytics.tasks.archive_chat_transcripts_task": _route(QUEUE_MAINTENANCE),
+    "analytics.tasks.schedule_analyses_task": _route(QUEUE_MAINTENANCE),
+    "analytics.tasks.flush_llm_usage_task": _route(QUEUE_MAINTENANCE),
+}
+
+app.conf.beat_schedule = {
+    "timeout-chat-sessions": {
+        "task": "analytics.tasks.timeout_chat_sessions",
+        "schedule": crontab(minute=0),
+    },
+    "rebuild-funnels": {
+        "task": "analytics.tasks.rebuild_funnels_task",
+        "schedule": crontab(hour=3, minute=30),
+    },
+    # Скорость разбора очереди повторного анализа: LLM_REPLAY_BATCH_SIZE в минуту
+    "replay-degraded-analyses": {
+        "task": "analytics.tasks.replay_degraded_analyses_task",
+        "schedule": crontab(),
+    },
+    "reconcile-dead-letters": {
+        "task": "analytics.tasks.reconcile_dead_letters_task",
+        "schedule": crontab(minute="*/30"),
+    },
+    # Основной запуск планировщика — по событиям (постановка, завершение анализа)
+    "schedule-analyses": {
+        "task": "analytics.tasks.schedule_analyses_task",
+        "schedule": crontab(),
+    },
+    # Журнал расхода LLM: пачка из буфера и дневные сводки
+    "flush-llm-usage": {
+        "task": "analytics.tasks.flush_llm_usage_task",
+        "schedule": crontab(),
+    },
+    "archive-chat-transcripts": {
+        "task": "analytics.tasks.archive_chat_transcripts_task",
+        "schedule": crontab(hour=4, minute=15),
+    },
+}
+
+
+def batch_options():
+    """Опции apply_async для массовых задач (импорт, пересчет, replay)"""
+    return _route(QUEUE_BATCH)
+
+
+def chat_options():
+    """Опции apply_async для анализа по итогам чата: кандидат ждет результата"""
+    return _route(QUEUE_CHAT)
+
+
+@celeryd_init.connect
+def configure_worker_for_queue(sender=None, conf=None, options=None, **kwargs):
+    """
+    Воркеру, слушающему одну очередь из топологии, выставляет ее concurrency
+    и prefetch, если они не переданы явно.
+    """
+    options = options or {}
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    if len(queues) != 1 or queues[0] not in QUEUE_TOPOLOGY:
+        return
+
+    topology = QUEUE_TOPOLOGY[queues[0]]
+    if not options.get("concurrency"):
+        conf.worker_concurrency = topology["concurrency"]
+    if not options.get("prefetch_multiplier"):
+        conf.worker_prefetch_multiplier = topology["prefetch_multiplier"]
+
+
+@worker_process_init.connect
+def prewarm_worker_process(**kwargs):
+    """
+    Прогрев процесса воркера: модули задач и LLM-клиент загружаются до
+    первой задачи, а не во время нее. Веб-процессы этот сигнал не получают.
+    """
+    try:
+        import analytics.tasks  # noqa: F401
+        from analytics.services.llm_client import get_llm_client
+
+        if os.getenv("GEMINI_API_KEY"):
+            get_llm_client()
+    except Exception:
+        logging.getLogger(__name__).exception("Worker pre-warm failed")
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    """Метка времени публикации для расчета ожидания в очереди"""
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    from analytics.services.queue_metrics import record_wait
+
+    request = getattr(task, "request", None)
+    published_at = getattr(request, "published_at", None) if request else None
+    if not published_at:
+        return
+    queue = (request.delivery_info or {}).get("routing_key") or QUEUE_ANALYSIS
+    record_wait(queue, time.time() - float(published_at))
+
+
+@task_failure.connect
+def record_dead_letter(sender=None, task_id=None, exception=None, args=None, kwargs=None,
+                       einfo=None, **extra):
+    """Окончательно упавшие (после всех повторов) задачи анализа попадают в DLQ"""
+    if sender is None or not sender.name.startswith("analytics.tasks."):
+        return
+    from analytics.services.dead_letter_service import DeadLetterService
+
+    try:
+        DeadLetterService().record(
+            sender.name, args=args, kwargs=kwargs, exc=exception, task_id=task_id or "",
+            attempts=(getattr(sender.request, "retries", 0) or 0) + 1,
+            tb=str(einfo) if einfo else None,
+        )
+    except Exception:
+        logging.getLogger(__name__).exception("Failed to record dead letter for %s", task_id)
@@ -0,0 +1,203 @@
+# project/db_router.py
+"""
+Маршрутизация чтений на реплики БД.
+
+Чтения идут на реплику только в запросах, которые это явно разрешают:
+безопасные (GET/HEAD) действия DRF-вьюсетов из replica_actions (по умолчанию
+list/retrieve) и списки админки. Все остальное — Celery-задачи, запись,
+чтения после записи — работает с основной БД (default).
+
+Read-your-writes: после записи запрос до конца читает из default, а клиент
+получает cookie, закрепляющую его за default на DATABASE_PRIMARY_STICKY_SECONDS.
+Реплика с отставанием больше DATABASE_REPLICA_MAX_LAG секунд (или недоступная)
+исключается; если подходящих реплик нет, чтение идет в default.
+"""
+import contextvars
+import logging
+import random
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_COOKIE = "db_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+DEFAULT_REPLICA_ACTIONS = ("list", "retrieve")
+
+_POSTGRES_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+@dataclass
+class RoutingState:
+    """Состояние маршрутизации на время HTTP-запроса"""
+    replica_reads: bool = False
+    wrote: bool = False
+
+
+_state = contextvars.ContextVar("db_routing_state", default=None)
+
+# alias -> (время проверки, пригодна ли реплика)
+_replica_health = {}
+
+
+def replica_aliases():
+    return list(getattr(settings, "DATABASE_REPLICA_ALIASES", []))
+
+
+def replica_lag(alias: str) -> float:
+    """Отставание реплики в секундах (для SQLite и прочих БД без репликации — 0)"""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(_POSTGRES_LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+def replica_is_healthy(alias: str) -> bool:
+    """Проверка отставания с кэшированием на DATABASE_REPLICA_CHECK_INTERVAL секунд"""
+    interval = getattr(settings, "DATABASE_REPLICA_CHECK_INTERVAL", 5)
+    checked = _replica_health.get(alias)
+    now = time.monotonic()
+    if checked and now - checked[0] < interval:
+        return checked[1]
+
+    try:
+        lag = replica_lag(alias)
+        healthy = lag <= getattr(settings, "DATABASE_REPLICA_MAX_LAG", 5)
+        if not healthy:
+            logger.warning("Replica %s lags %.1fs, reading from primary", alias, lag)
+    except Exception as e:
+        logger.warning("Replica %s unavailable: %s", alias, e)
+        healthy = False
+    _replica_health[alias] = (now, healthy)
+    return healthy
+
+
+def choose_replica():
+    healthy = [alias for alias in replica_aliases() if replica_is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+class ReplicaRouter:
+    """DATABASE_ROUTERS: чтения — на реплику, если запрос это разрешает"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or state.wrote:
+            return None
+        return choose_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему через репликацию
+        if db in replica_aliases():
+            return False
+        return None
+
+
+def _replica_allowed(request, view_func) -> bool:
+    if request.method not in SAFE_METHODS:
+        return False
+
+    # DRF-вьюсеты: действие по методу запроса
+    actions = getattr(view_func, "actions", None)
+    if actions:
+        action = actions.get(request.method.lower()) or actions.get("get")
+        view_class = getattr(view_func, "cls", None)
+        return action in getattr(view_class, "replica_actions", DEFAULT_REPLICA_ACTIONS)
+
+    # Списки админки (в т.ч. поиск по resume_text)
+    match = request.resolver_match
+    return bool(match and match.namespace == "admin" and (match.url_name or "").endswith("_changelist"))
+
+
+def _streaming_with_state(state, content):
+    """Потоковый ответ читает БД уже после выхода из middleware — восстанавливаем состояние"""
+    iterator = iter(content)
+    while True:
+        token = _state.set(state)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _state.reset(token)
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Включает чтение с реплик для разрешенных запросов и закрепляет клиента
+    за основной БД после записи.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = self._begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self._begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    def _begin(self, request):
+        state = RoutingState()
+        request._db_routing_state = state
+        return state, _state.set(state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not replica_aliases():
+            return None
+        try:
+            pinned = float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        request._db_routing_state.replica_reads = not pinned and _replica_allowed(request, view_func)
+        return None
+
+    def _finish(self, state, response):
+        if state.wrote and replica_aliases():
+            window = getattr(settings, "DATABASE_PRIMARY_STICKY_SECONDS", 10)
+            response.set_cookie(PRIMARY_COOKIE, str(time.time() + window), max_age=window, httponly=True)
+        if state.replica_reads and response.streaming and not getattr(response, "is_async", False):
+            response.streaming_content = _streaming_with_state(state, response.streaming_content)
+        return response
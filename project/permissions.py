@@ -1,9 +1,15 @@
 # project/permissions.py
 from rest_framework import permissions
 
+from employers.models import Employer
+from project.authentication import user_employer_id
+
+
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
     Allow read-only for everyone, write only for owner (has .owner or .user relation).
+    Ownership is checked by ids (FK *_id vs request user / its employer id),
+    without loading related objects.
     """
 
     def has_object_permission(self, request, view, obj):
@@ -11,19 +17,31 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+
         # try common owner attributes
         owner_attrs = ['owner', 'employer', 'user']
         for attr in owner_attrs:
-            if hasattr(obj, attr):
-                owner = getattr(obj, attr)
-                # if owner is a FK to Employer with .user
-                if getattr(owner, 'user', None):
-                    return owner.user == request.user
+            if hasattr(obj, f'{attr}_id'):
+                owner_id = getattr(obj, f'{attr}_id')
+                related_model = obj._meta.get_field(attr).related_model
+                # if owner is a FK to Employer (owned by its .user)
+                if related_model is Employer:
+                    return owner_id is not None and owner_id == user_employer_id(user)
                 # if owner is a user directly
-                if owner == request.user:
+                if owner_id == user.pk:
+                    return True
+            elif hasattr(obj, attr):
+                owner = getattr(obj, attr)
+                if getattr(owner, 'user_id', None) is not None:
+                    return owner.user_id == user.pk
+                if owner == user:
                     return True
         return False
 
+
 class IsEmployer(permissions.BasePermission):
     """
     Allow only authenticated users that have Employer profile to POST/PUT for employer-scoped endpoints.
@@ -32,4 +50,4 @@ class IsEmployer(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user or not request.user.is_authenticated:
             return False
-        return hasattr(request.user, 'employer')
+        return user_employer_id(request.user) is not None
@@ -0,0 +1,162 @@
+# project/response_cache.py
+"""
+Кэш ответов API с версионированными ключами и ETag.
+
+У каждой области (scope: "vacancy:list", "vacancy:42", "analysis:7", ...)
+есть версия в кэше, которую сигналы моделей меняют при сохранении.
+ETag ответа вычисляется из версий областей и варианта запроса, поэтому
+If-None-Match проверяется без обращения к БД, а тело ответа хранится
+под ключом с версией и само устаревает после смены версии.
+"""
+import hashlib
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified, JsonResponse
+from rest_framework.response import Response
+
+VERSION_TTL = 30 * 24 * 3600
+
+SCOPE_VACANCY_LIST = "vacancy:list"
+
+
+def vacancy_scope(vacancy_id) -> str:
+    return f"vacancy:{vacancy_id}"
+
+
+def analysis_scope(application_id) -> str:
+    return f"analysis:{application_id}"
+
+
+def chat_scope(chat_session_id) -> str:
+    return f"chat:{chat_session_id}"
+
+
+def _version_key(scope: str) -> str:
+    return f"respcache:v:{scope}"
+
+
+def _new_version() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def bump(*scopes: str):
+    """
+    Меняет версии областей: закэшированные ответы по ним больше не используются.
+    Выполняется после фиксации транзакции, иначе параллельный запрос успеет
+    закэшировать старые данные под новой версией.
+    """
+    versions = {_version_key(scope): _new_version() for scope in scopes}
+    if versions:
+        transaction.on_commit(lambda: cache.set_many(versions, VERSION_TTL))
+
+
+def _versions(scopes) -> list:
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    result = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _new_version(), VERSION_TTL)
+            version = cache.get(key)
+        result.append(version)
+    return result
+
+
+def _variant(request) -> str:
+    return "|".join((request.get_full_path(), request.META.get("HTTP_ACCEPT", "")))
+
+
+def response_key(request, scopes) -> tuple:
+    """
+    (ETag, ключ кэша) для запроса. Обе величины меняются при смене
+    версии любой из областей или варианта запроса (путь, Accept).
+    """
+    digest = hashlib.sha256(
+        "\n".join([*scopes, *_versions(scopes), _variant(request)]).encode()
+    ).hexdigest()[:32]
+    return f'"{digest}"', f"respcache:r:{digest}"
+
+
+def etag_matches(request, etag: str) -> bool:
+    header = request.META.get("HTTP_IF_NONE_MATCH", "")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _ttl() -> int:
+    return getattr(settings, "RESPONSE_CACHE_TTL", 300)
+
+
+class CachedResponseMixin:
+    """
+    Кэш list/retrieve для DRF-вьюсетов.
+    Вьюсет задает области через list_cache_scopes()/detail_cache_scopes(pk);
+    None — действие не кэшируется.
+    Кэшируются данные ответа 200 (до рендеринга), так что согласование
+    формата работает как обычно.
+    Чтение с реплик отключено: отстающая реплика закэшировала бы старые
+    данные под новой версией, а нагрузку на основную БД и так снимает кэш.
+    """
+    replica_actions = ()
+
+    def list_cache_scopes(self):
+        return None
+
+    def detail_cache_scopes(self, pk):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, self.list_cache_scopes(), super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self._cached_response(request, self.detail_cache_scopes(pk), super().retrieve, *args, **kwargs)
+
+    def _cached_response(self, request, scopes, view, *args, **kwargs):
+        if not scopes:
+            return view(request, *args, **kwargs)
+
+        etag, key = response_key(request, scopes)
+        if etag_matches(request, etag):
+            return Response(status=304, headers={"ETag": etag})
+
+        data = cache.get(key)
+        if data is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, _ttl())
+        else:
+            response = Response(data)
+        response["ETag"] = etag
+        return response
+
+
+async def acached_json(request, scopes, build):
+    """
+    То же для async-представлений: build() — корутина, возвращающая
+    (данные, статус). Кэшируется и ответ "еще не готово", чтобы опрос
+    до появления результата тоже не обращался к БД; ETag — только у 200.
+    """
+    etag, key = await sync_to_async(response_key, thread_sensitive=False)(request, scopes)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    cached = await cache.aget(key)
+    if cached is None:
+        cached = await build()
+        await cache.aset(key, cached, _ttl())
+    data, status = cached
+    response = JsonResponse(data, status=status, safe=False)
+    if status == 200:
+        response["ETag"] = etag
+    return response
@@ -1,5 +1,6 @@
 # project/settings.py
 from pathlib import Path
+import json
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -59,6 +60,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'project.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -114,6 +116,26 @@ else:
         }
     }
 
+# Реплики для чтения (project/db_router.py): через запятую host[:port] для Postgres
+# или пути к файлам для SQLite (например, локальная копия db.sqlite3)
+DATABASE_REPLICA_ALIASES = []
+for _index, _replica in enumerate(filter(None, (r.strip() for r in os.getenv("DATABASE_REPLICAS", "").split(","))), 1):
+    _alias = f"replica_{_index}"
+    if USE_POSTGRES:
+        _host, _, _port = _replica.partition(":")
+        DATABASES[_alias] = {**DATABASES['default'], 'HOST': _host, 'PORT': _port or DATABASES['default']['PORT']}
+    else:
+        DATABASES[_alias] = {**DATABASES['default'], 'NAME': BASE_DIR / _replica}
+    DATABASES[_alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICA_ALIASES.append(_alias)
+
+DATABASE_ROUTERS = ['project.db_router.ReplicaRouter']
+# Допустимое отставание реплики и период его проверки, секунды
+DATABASE_REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "5"))
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", "5"))
+# Сколько клиент после записи читает только из основной БД, секунды
+DATABASE_PRIMARY_STICKY_SECONDS = int(os.getenv("DATABASE_PRIMARY_STICKY_SECONDS", "10"))
+
 # ---------------------------------------------------------------------
 # Redis / Channels
 # ---------------------------------------------------------------------
@@ -130,13 +152,31 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Кэш Django (общий для web и Celery-воркеров: метрики очередей, circuit breaker и т.д.)
+USE_REDIS_CACHE = os.getenv("USE_REDIS_CACHE", "True").lower() in ("1", "true", "yes")
+
+if USE_REDIS_CACHE:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("CACHE_URL", REDIS_URL),
+            "KEY_PREFIX": "smartbot",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 # ---------------------------------------------------------------------
 # Django REST Framework
 # ---------------------------------------------------------------------
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'project.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
@@ -204,3 +244,86 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"))
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+
+# Контекстный кэш Gemini для префикса промпта вакансии
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "True").lower() in ("1", "true", "yes")
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 3600))
+
+# Предохранитель LLM и повторный анализ откликов, оцененных без LLM
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", 5))
+LLM_CIRCUIT_RECOVERY_SECONDS = int(os.getenv("LLM_CIRCUIT_RECOVERY_SECONDS", 60))
+LLM_REPLAY_BATCH_SIZE = int(os.getenv("LLM_REPLAY_BATCH_SIZE", 20))
+LLM_REPLAY_RETRY_SECONDS = int(os.getenv("LLM_REPLAY_RETRY_SECONDS", 600))
+
+# Стадия конвейера анализа в статусе running без обновлений дольше этого срока
+# считается брошенной и может быть захвачена другим запуском, секунды
+ANALYSIS_STAGE_LEASE_SECONDS = int(os.getenv("ANALYSIS_STAGE_LEASE_SECONDS", 900))
+
+# DLQ упавших задач анализа
+DEAD_LETTER_REPLAY_RATE = float(os.getenv("DEAD_LETTER_REPLAY_RATE", 2.0))
+DEAD_LETTER_RECONCILE_AFTER_MINUTES = int(os.getenv("DEAD_LETTER_RECONCILE_AFTER_MINUTES", 30))
+
+# Класс LLM-клиента для get_llm_client() и бюджет импортов веб-процесса (check_import_time)
+LLM_CLIENT_CLASS = os.getenv("LLM_CLIENT_CLASS", "analytics.services.llm_client.GeminiClient")
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 1500))
+
+# Инкрементальная переоценка после чата (только новые ответы вместо полного резюме)
+LLM_DELTA_REEVALUATION_ENABLED = os.getenv("LLM_DELTA_REEVALUATION_ENABLED", "True").lower() in ("1", "true", "yes")
+
+# Память диалога чат-бота: реплик дословно, лимит сводки и одной реплики (символов)
+CHAT_MEMORY_RECENT_TURNS = int(os.getenv("CHAT_MEMORY_RECENT_TURNS", 6))
+CHAT_MEMORY_SUMMARY_CHARS = int(os.getenv("CHAT_MEMORY_SUMMARY_CHARS", 1500))
+CHAT_MEMORY_TURN_CHARS = int(os.getenv("CHAT_MEMORY_TURN_CHARS", 600))
+
+# Валюта зарплаты из ответа в чате, если кандидат ее не назвал (в ней же ведется Candidate.expected_salary)
+CHAT_DEFAULT_SALARY_CURRENCY = os.getenv("CHAT_DEFAULT_SALARY_CURRENCY", "KZT")
+
+# Кэш пользователя для JWT-аутентификации: общий (Redis) и локальный в процессе, секунды
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "300"))
+AUTH_USER_LOCAL_TTL = int(os.getenv("AUTH_USER_LOCAL_TTL", "10"))
+
+# Кэш ответов API (вакансии, результаты анализа, чат-сессии), секунды; сбрасывается сигналами
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+# Ожидание событий анализа без WebSocket: long-poll (по умолчанию/максимум) и SSE, секунды
+ANALYSIS_EVENTS_POLL_TIMEOUT = int(os.getenv("ANALYSIS_EVENTS_POLL_TIMEOUT", "25"))
+ANALYSIS_EVENTS_MAX_TIMEOUT = int(os.getenv("ANALYSIS_EVENTS_MAX_TIMEOUT", "60"))
+ANALYSIS_EVENTS_SSE_MAX_SECONDS = int(os.getenv("ANALYSIS_EVENTS_SSE_MAX_SECONDS", "300"))
+ANALYSIS_EVENTS_SSE_HEARTBEAT = int(os.getenv("ANALYSIS_EVENTS_SSE_HEARTBEAT", "15"))
+
+# Архивация переписки завершенных чат-сессий: через сколько дней без активности, сессий за пачку
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "90"))
+CHAT_ARCHIVE_BATCH_SIZE = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "100"))
+
+# Буфер исходящих WebSocket-событий для досылки после переподключения:
+# redis (Redis Streams) или memory (в процессе, для тестов); длина буфера на отклик и TTL, секунды
+EVENT_BUFFER_BACKEND = os.getenv("EVENT_BUFFER_BACKEND", "redis")
+EVENT_BUFFER_MAXLEN = int(os.getenv("EVENT_BUFFER_MAXLEN", "200"))
+EVENT_BUFFER_TTL = int(os.getenv("EVENT_BUFFER_TTL", str(24 * 3600)))
+
+# Справедливый планировщик анализа по работодателям: анализов в работе всего,
+# вес и лимит работодателя по умолчанию (TenantSchedulingPolicy; 0 — без отдельного лимита),
+# таймаут анализа без обновления чекпоинтов стадий и ожидания старта в очереди batch, секунды
+LLM_SCHEDULER_MAX_IN_FLIGHT = int(os.getenv("LLM_SCHEDULER_MAX_IN_FLIGHT", "16"))
+LLM_SCHEDULER_DEFAULT_WEIGHT = int(os.getenv("LLM_SCHEDULER_DEFAULT_WEIGHT", "1"))
+LLM_SCHEDULER_TENANT_MAX_IN_FLIGHT = int(os.getenv("LLM_SCHEDULER_TENANT_MAX_IN_FLIGHT", "0"))
+LLM_SCHEDULER_DISPATCH_TIMEOUT = int(os.getenv("LLM_SCHEDULER_DISPATCH_TIMEOUT", "900"))
+LLM_SCHEDULER_BATCH_DISPATCH_TIMEOUT = int(os.getenv("LLM_SCHEDULER_BATCH_DISPATCH_TIMEOUT", "3600"))
+
+# Журнал расхода LLM: буфер записей (redis | memory) и размер пачки вставки;
+# цены моделей, $ за 1M токенов: {"модель": [вход, выход, вход из кэша]}
+LLM_USAGE_BUFFER_BACKEND = os.getenv("LLM_USAGE_BUFFER_BACKEND", "redis")
+LLM_USAGE_FLUSH_SIZE = int(os.getenv("LLM_USAGE_FLUSH_SIZE", "200"))
+LLM_PRICING = json.loads(os.getenv(
+    "LLM_PRICING",
+    '{"gemini-2.5-flash": [0.30, 2.50, 0.075], "gemini-2.5-flash-lite": [0.10, 0.40, 0.025]}'
+))
+
+# Бюджеты LLM работодателей по умолчанию (EmployerLLMBudget; 0 — без лимита): токенов в день, $ в месяц;
+# при превышении: downgrade (дешевая модель) или defer (очередь повторного анализа);
+# на дешевой модели бюджет можно превысить в LLM_BUDGET_HARD_LIMIT_RATIO раз, затем — defer
+LLM_BUDGET_DAILY_TOKENS = int(os.getenv("LLM_BUDGET_DAILY_TOKENS", "0"))
+LLM_BUDGET_MONTHLY_COST = float(os.getenv("LLM_BUDGET_MONTHLY_COST", "0"))
+LLM_BUDGET_ACTION = os.getenv("LLM_BUDGET_ACTION", "downgrade")
+LLM_BUDGET_FALLBACK_MODEL = os.getenv("LLM_BUDGET_FALLBACK_MODEL", "gemini-2.5-flash-lite")
+LLM_BUDGET_HARD_LIMIT_RATIO = float(os.getenv("LLM_BUDGET_HARD_LIMIT_RATIO", "1.5"))